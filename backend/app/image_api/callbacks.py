@@ -1,68 +1,80 @@
 import json
+import logging
 
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
-from .models import ImageLocation
-from geopy.geocoders import Nominatim
+from .services.callback_service import KNOWN_STATUSES, PredictionCallbackService
+
+logger = logging.getLogger(__name__)
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def image_location_callback(request):
-    print("Request body:", request.body.decode('utf-8'))
-
-    geolocator = Nominatim(user_agent="my_app")
+    """
+    Результат одной задачи GeoClip — обёртка над пакетной обработкой.
+    """
     try:
         # Получаем JSON из тела запроса
         json_data = json.loads(request.body)
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-    # Извлекаем TaskId и результат
     task_id = json_data.get("TaskId")
     status_response = json_data.get("Status")
-    error_code = json_data.get("ErrorCode")
-    error_message = json_data.get("ErrorMessage")
-    result = json_data.get("Result", {})
-
-    latitude = result.get("Latitude")
-    longitude = result.get("Longitude")
+    logger.debug(f"Callback for task {task_id}: {status_response}")
+    if status_response not in KNOWN_STATUSES:
+        # Иначе строка не обновится и ответ выглядел бы как «не найдена»
+        return JsonResponse({"error": f"Unknown status: {status_response}"}, status=400)
 
     try:
-        image_location = ImageLocation.objects.get(id=task_id)
-        address = image_location.address
-        # Обновляем статус в зависимости от ответа
-        if status_response == "Succeeded":
-            image_location.status = "done"
-        elif status_response == "Failed":
-            image_location.status = "failed"
-
-        # Обновляем координаты и адрес, если статус успешный
-        if status_response == "Succeeded":
-            if latitude is not None and image_location.lat is None:
-                image_location.lat = latitude
-            if longitude is not None and image_location.lon is None:
-                image_location.lon = longitude
-
-            if address is None:
-                try:
-                    loc = geolocator.reverse((latitude, longitude))
-                    if loc:
-                        address = loc.address
-                except Exception as e:
-                    print(f"Ошибка reverse для {latitude}, {longitude}: {e}")
-
-        image_location.address = address
-        image_location.save()
+        statuses = PredictionCallbackService().apply([json_data])
+        new_status = statuses.get(int(task_id))
+        if new_status is None:
+            return JsonResponse({"error": f"ImageLocation with id={task_id} not found"}, status=404)
 
         return JsonResponse({
             "status": "success",
             "message": f"Updated record {task_id}",
-            "new_status": image_location.status
+            "new_status": new_status
         })
 
-    except ImageLocation.DoesNotExist:
+    except (TypeError, ValueError):
         return JsonResponse({"error": f"ImageLocation with id={task_id} not found"}, status=404)
     except Exception as e:
-        return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
\ No newline at end of file
+        logger.error(f"Callback error for task {task_id}: {e}", exc_info=True)
+        return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def image_location_batch_callback(request):
+    """
+    Результаты нескольких задач GeoClip: массив CallbackResponse или {"results": [...]}.
+    Все строки обновляются одним условным UPDATE, адреса ищутся в фоне.
+    """
+    try:
+        json_data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    items = json_data.get("results") if isinstance(json_data, dict) else json_data
+    if not isinstance(items, list):
+        return JsonResponse({"error": "Expected a list of results"}, status=400)
+
+    try:
+        statuses = PredictionCallbackService().apply(items)
+    except Exception as e:
+        logger.error(f"Batch callback error: {e}", exc_info=True)
+        return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
+
+    return JsonResponse({
+        "status": "success",
+        "updated": [
+            {"task_id": task_id, "new_status": new_status}
+            for task_id, new_status in statuses.items()
+            if new_status is not None
+        ],
+        "not_found": [task_id for task_id, new_status in statuses.items() if new_status is None],
+    })
@@ -0,0 +1,3 @@
+# Значения по умолчанию для параметров съёмки, если клиент и EXIF их не дали
+DEFAULT_ANGLE = 0
+DEFAULT_HEIGHT = 1.5
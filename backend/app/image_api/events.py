@@ -0,0 +1,70 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .services.status_events import issue_stream_ticket, redeem_stream_ticket, status_event_stream
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def image_location_events_ticket(request):
+    """
+    Выдаёт одноразовый билет для ?ticket= потока событий (EventSource не передаёт заголовки).
+    Билет действует STATUS_EVENTS_TICKET_TTL секунд; при переподключении нужен новый.
+    """
+    return Response({
+        "ticket": issue_stream_ticket(request.user.id),
+        "expires_in": settings.STATUS_EVENTS_TICKET_TTL,
+    })
+
+
+def _authenticate_stream(request):
+    """
+    JWT из заголовка Authorization или одноразовый билет из ?ticket=.
+    Сам JWT в query string не принимается — он оседал бы в логах и истории браузера.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if raw_token is not None:
+        try:
+            return auth.get_user(auth.get_validated_token(raw_token))
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+
+    ticket = request.GET.get("ticket")
+    user_id = redeem_stream_ticket(ticket) if ticket else None
+    if user_id is None:
+        return None
+    return get_user_model().objects.filter(id=user_id).first()
+
+
+@require_GET
+async def image_location_events(request):
+    """
+    Server-Sent Events: изменения статусов ImageLocation текущего пользователя.
+    Событие status: {"locations": [{"id", "status", "lat", "lon", "address", "error_reason"}]}.
+    Работает под ASGI (recognition_backend.asgi).
+    """
+    user = await sync_to_async(_authenticate_stream)(request)
+    if user is None or not user.is_active:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    logger.info(f"Status events stream opened for user {user.id}")
+    response = StreamingHttpResponse(status_event_stream(user.id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx не должен буферизовать поток
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -1,6 +1,15 @@
+import math
+from datetime import datetime, time, timedelta
+
 import django_filters
+from django.utils import timezone
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
 from .models import ImageLocation
 
+EARTH_RADIUS_KM = 6371
+
 class ImageLocationFilter(django_filters.FilterSet):
     # Фильтрация по дате создания (без времени)
     created_date_after = django_filters.DateFilter(field_name='created_at', lookup_expr='date__gte')
@@ -11,37 +20,82 @@ class ImageLocationFilter(django_filters.FilterSet):
         fields = []
 
 class ImageLocationFilter(django_filters.FilterSet):
-    lat = django_filters.NumberFilter(method='filter_by_radius')
-    lon = django_filters.NumberFilter(method='filter_by_radius')
-    radius_km = django_filters.NumberFilter(method='filter_by_radius')
+    lat = django_filters.NumberFilter()
+    lon = django_filters.NumberFilter()
+    radius_km = django_filters.NumberFilter()
+
+    # lat, lon и radius_km задают одно условие — применяется один раз в filter_queryset
+    radius_params = ('lat', 'lon', 'radius_km')
 
     class Meta:
         model = ImageLocation
         fields = []
 
-    def filter_by_radius(self, queryset, name, value):
-        # Получаем lat, lon и radius из GET-параметров
-        lat = self.data.get('lat')
-        lon = self.data.get('lon')
-        radius_km = self.data.get('radius_km')
-
-        if lat and lon and radius_km:
-            lat = float(lat)
-            lon = float(lon)
-            radius_km = float(radius_km)
-
-            sql = """
-            6371 * acos(
-                cos(radians(%s)) *
-                cos(radians(lat)) *
-                cos(radians(lon) - radians(%s)) +
-                sin(radians(%s)) *
-                sin(radians(lat))
-            ) <= %s
-            """
-
-            queryset = queryset.extra(
-                where=[sql],
-                params=[lat, lon, lat, radius_km]
-            )
-        return queryset
\ No newline at end of file
+    def filter_queryset(self, queryset):
+        cleaned_data = self.form.cleaned_data
+        for name, value in cleaned_data.items():
+            if name not in self.radius_params:
+                queryset = self.filters[name].filter(queryset, value)
+        return self.filter_by_radius(queryset, *(cleaned_data.get(name) for name in self.radius_params))
+
+    def filter_by_radius(self, queryset, lat, lon, radius_km):
+        if lat is None or lon is None or radius_km is None:
+            return queryset
+        lat, lon, radius_km = float(lat), float(lon), float(radius_km)
+
+        # Сначала bounding box по индексу (user, lat, lon), затем точное расстояние
+        # только для строк внутри прямоугольника
+        queryset = queryset.filter(**bounding_box_filters(lat, lon, radius_km))
+        return queryset.annotate(
+            distance_km=great_circle_distance_km(lat, lon)
+        ).filter(distance_km__lte=radius_km)
+
+
+def created_at_range_filters(date_after=None, date_before=None):
+    """
+    Фильтр по датам создания (включительно) как полуоткрытый диапазон
+    [начало date_after, начало следующего за date_before дня) — без приведения
+    created_at к date, чтобы работал индекс (user, created_at).
+    """
+    filters = {}
+    if date_after:
+        filters['created_at__gte'] = timezone.make_aware(datetime.combine(date_after, time.min))
+    if date_before:
+        filters['created_at__lt'] = timezone.make_aware(datetime.combine(date_before + timedelta(days=1), time.min))
+    return filters
+
+
+def bounding_box_filters(lat, lon, radius_km):
+    """
+    Условия на lat/lon для прямоугольника, описанного вокруг круга радиусом radius_km.
+    """
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_min, lat_max = lat - lat_delta, lat + lat_delta
+    filters = {'lat__gte': lat_min, 'lat__lte': lat_max}
+
+    # У полюса или при радиусе больше полуокружности долготу не ограничиваем
+    if lat_min <= -90 or lat_max >= 90:
+        return filters
+    lon_delta = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    lon_min, lon_max = lon - lon_delta, lon + lon_delta
+    # Переход через антимеридиан — только по широте, точный фильтр отсечёт лишнее
+    if lon_min < -180 or lon_max > 180:
+        return filters
+    filters.update({'lon__gte': lon_min, 'lon__lte': lon_max})
+    return filters
+
+
+def great_circle_distance_km(lat, lon):
+    """
+    Расстояние (км) от точки (lat, lon) до строки по формуле гаверсинуса.
+    """
+    dlat = Radians(F('lat')) - math.radians(lat)
+    dlon = Radians(F('lon')) - math.radians(lon)
+    a = (
+        Power(Sin(dlat / 2), 2)
+        + math.cos(math.radians(lat)) * Cos(Radians(F('lat'))) * Power(Sin(dlon / 2), 2)
+    )
+    return ExpressionWrapper(
+        2 * EARTH_RADIUS_KM * ASin(Sqrt(Least(Value(1.0), a))),
+        output_field=FloatField(),
+    )
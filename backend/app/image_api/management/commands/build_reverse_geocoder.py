@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from image_api.services.offline_geocoder import DEFAULT_CELL_SIZE, build_index
+
+
+class Command(BaseCommand):
+    help = "Строит локальный индекс обратного геокодирования из выгрузки OSM (region.osm.bz2)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("osm_path", help="Путь к .osm или .osm.bz2 (например, OverpassApi/db/region.osm.bz2)")
+        parser.add_argument("--index-dir", default=settings.OFFLINE_GEOCODER_INDEX_DIR,
+                            help="Куда сохранить индекс (по умолчанию OFFLINE_GEOCODER_INDEX_DIR)")
+        parser.add_argument("--cell-size", type=float, default=DEFAULT_CELL_SIZE,
+                            help="Размер ячейки сетки в градусах")
+
+    def handle(self, *args, **options):
+        if not options["index_dir"]:
+            raise CommandError("Не задан --index-dir и OFFLINE_GEOCODER_INDEX_DIR")
+
+        started = time.perf_counter()
+        count = build_index(options["osm_path"], options["index_dir"], options["cell_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Индекс {options['index_dir']}: {count} адресов за {time.perf_counter() - started:.1f} с"
+        ))
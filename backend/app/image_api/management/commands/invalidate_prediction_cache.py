@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from image_api.services.prediction_cache import PredictionCacheService
+
+
+class Command(BaseCommand):
+    help = "Удаляет кэш предсказаний GeoClip (после смены модели)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-version", help="Удалить только записи этой версии модели")
+        parser.add_argument("--all", action="store_true", help="Удалить записи всех версий")
+        parser.add_argument("--stats", action="store_true", help="Только показать статистику попаданий")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(str(PredictionCacheService.get_stats()))
+            return
+
+        model_version = None if options["all"] else (options["model_version"] or settings.GEOCLIP_MODEL_VERSION)
+        deleted = PredictionCacheService.invalidate(model_version)
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей: {deleted}"))
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from image_api.models import UploadedArchive
+from image_api.tasks import process_archive_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Продолжает обработку архивов с невыполненными чанками: failed и зависшие в pending/processing. "
+        "process_archive_task пропускает чанки из completed_chunks, поэтому готовая часть не повторяется"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive_ids", nargs="*", type=int, help="id архивов (по умолчанию — все подходящие)")
+        parser.add_argument("--stalled-minutes", type=int, default=60,
+                            help="pending/processing без прогресса дольше этого считаются зависшими")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать архивы")
+
+    def handle(self, *args, **options):
+        # Зависший — давно не завершал чанков: большой архив может обрабатываться дольше stalled_minutes
+        stalled_before = timezone.now() - timedelta(minutes=options["stalled_minutes"])
+        archives = UploadedArchive.objects.filter(
+            Q(status='failed') | Q(status__in=('pending', 'processing'), updated_at__lt=stalled_before)
+        ).order_by('id')
+        if options["archive_ids"]:
+            archives = UploadedArchive.objects.filter(id__in=options["archive_ids"]).order_by('id')
+
+        resumed = 0
+        for archive in archives:
+            self.stdout.write(
+                f"Архив {archive.id} ({archive.original_filename}): {archive.status}, "
+                f"чанков готово {len(archive.completed_chunks)} из {archive.total_chunks or '?'}"
+                + (f", ошибка: {archive.error_reason}" if archive.error_reason else "")
+            )
+            if not options["dry_run"]:
+                process_archive_task.delay(archive.id)
+                resumed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Перезапущено архивов: {resumed}"))
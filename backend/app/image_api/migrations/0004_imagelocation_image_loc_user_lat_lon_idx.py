@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_api', '0003_imagelocation_address_imagelocation_angle_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imagelocation',
+            index=models.Index(fields=['user', 'lat', 'lon'], name='image_loc_user_lat_lon_idx'),
+        ),
+    ]
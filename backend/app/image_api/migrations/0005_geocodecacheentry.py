@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_api', '0004_imagelocation_image_loc_user_lat_lon_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('forward', 'Forward'), ('reverse', 'Reverse')], max_length=10)),
+                ('key', models.CharField(max_length=500)),
+                ('found', models.BooleanField(default=True)),
+                ('address', models.CharField(blank=True, max_length=500, null=True)),
+                ('lat', models.FloatField(blank=True, null=True)),
+                ('lon', models.FloatField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'geocode_cache',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='geocode_cache_kind_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_api', '0005_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedarchive',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='uploadedarchive',
+            name='total_entries',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedarchive',
+            name='chunk_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedarchive',
+            name='completed_chunks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='uploadedarchive',
+            name='error_reason',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedarchive',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_api', '0006_uploadedarchive_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 содержимого', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='uploadedimage',
+            constraint=models.UniqueConstraint(fields=('user', 'content_hash'), name='uploaded_image_user_hash_uniq'),
+        ),
+    ]
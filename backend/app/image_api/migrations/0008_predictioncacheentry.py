@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_api', '0007_uploadedimage_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('angle', models.FloatField()),
+                ('height', models.FloatField()),
+                ('model_version', models.CharField(max_length=64)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('address', models.CharField(blank=True, max_length=500, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'prediction_cache',
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'angle', 'height', 'model_version'), name='prediction_cache_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:40
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в image_locations, но не работает в транзакции
+    atomic = False
+
+    dependencies = [
+        ('image_api', '0008_predictioncacheentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='imagelocation',
+            index=models.Index(fields=['user', 'id'], name='image_loc_user_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='imagelocation',
+            index=models.Index(fields=['user', 'created_at'], name='image_loc_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='imagelocation',
+            index=models.Index(
+                condition=models.Q(('status', 'processing')),
+                fields=['user', 'id'],
+                name='image_loc_processing_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_api', '0009_imagelocation_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, help_text='Превью в S3: {размер: ключ}'),
+        ),
+    ]
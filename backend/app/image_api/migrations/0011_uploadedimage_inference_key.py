@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_api', '0010_uploadedimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='inference_key',
+            field=models.CharField(blank=True, help_text='Копия под вход GeoClip в S3', max_length=255, null=True),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.db import models
-from .services.s3_service import S3Service
+from .services.presigned_url_cache import get_presigned_url_cache
 
 
 class UploadedImage(models.Model):
@@ -9,12 +9,28 @@ class UploadedImage(models.Model):
     original_filename = models.CharField(max_length=255, blank=True, null=True, help_text="Оригинальное имя файла")
     file_path = models.CharField(max_length=500, default='', help_text="Относительный путь к файлу на сервере")
     s3_url = models.URLField(max_length=500, default='', help_text="URL для доступа к файлу")
+    content_hash = models.CharField(max_length=64, null=True, blank=True, help_text="SHA-256 содержимого")
+    renditions = models.JSONField(default=dict, blank=True, help_text="Превью в S3: {размер: ключ}")
+    inference_key = models.CharField(max_length=255, null=True, blank=True, help_text="Копия под вход GeoClip в S3")
     uploaded_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # Дедупликация в пределах пользователя; объект в S3 (контентный ключ) общий
+            models.UniqueConstraint(fields=['user', 'content_hash'], name='uploaded_image_user_hash_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.filename} (загружено {self.user.username})"
 
+    @property
+    def preview_key(self):
+        """
+        Ключ превью для списка; пока превью не готово — ключ оригинала.
+        """
+        return self.renditions.get(str(settings.PREVIEW_RENDITION_SIZE)) or self.filename
+
 class ImageLocation(models.Model):
     # Ссылка на пользователя
     user = models.ForeignKey(
@@ -55,6 +71,20 @@ class ImageLocation(models.Model):
         db_table = 'image_locations'
         verbose_name = 'Image Location'
         verbose_name_plural = 'Image Locations'
+        indexes = [
+            # bounding box для поиска по радиусу (ImageLocationFilter)
+            models.Index(fields=['user', 'lat', 'lon'], name='image_loc_user_lat_lon_idx'),
+            # список пользователя: WHERE user_id = ? ORDER BY id DESC (и курсор id < ?)
+            models.Index(fields=['user', 'id'], name='image_loc_user_id_idx'),
+            # фильтр по дате создания (полуоткрытый диапазон по created_at)
+            models.Index(fields=['user', 'created_at'], name='image_loc_user_created_idx'),
+            # незавершённые задачи — небольшая доля таблицы
+            models.Index(
+                fields=['user', 'id'],
+                name='image_loc_processing_idx',
+                condition=models.Q(status='processing'),
+            ),
+        ]
 
     def __str__(self):
         return f"Location for {self.image.filename} - {self.status}"
@@ -66,13 +96,21 @@ class ImageLocation(models.Model):
     @property
     def preview_url(self):
         """
-        Возвращает presigned URL для предпросмотра файла.
+        Возвращает presigned URL превью (или оригинала, если превью ещё нет);
+        ссылка берётся из кэша, если ещё свежая.
         """
-        s3 = S3Service()
-        return s3.generate_presigned_url(self.image.filename)
+        cache = get_presigned_url_cache()
+        return cache.get(self.image.preview_key) or cache.get(self.image.filename)
 
-
-    def to_dict(self):
+    def to_dict(self, preview_urls=None):
+        """
+        preview_urls — заранее подписанные ссылки {preview_key: url} для всей страницы
+        (см. PresignedUrlCache.get_many); без него ссылка берётся из preview_url.
+        """
+        if preview_urls is not None and preview_urls.get(self.image.preview_key):
+            preview_url = preview_urls[self.image.preview_key]
+        else:
+            preview_url = self.preview_url
         if self.lat is not None and self.lon is not None:
             main_coordinates = {"lat": self.lat, "lon": self.lon}
         else:
@@ -85,7 +123,7 @@ class ImageLocation(models.Model):
                     "id": det.file.id,
                     "filename": det.file.filename,
                     "file_path": det.file.s3_url or det.file.file_path,
-                    "preview_url": self.preview_url,
+                    "preview_url": preview_url,
                     # preview_url можно тоже добавить, если нужно
                 },
                 "lat": det.lat,
@@ -109,7 +147,7 @@ class ImageLocation(models.Model):
                 "id": self.image.id,
                 "filename": self.image.filename,
                 "file_path": self.file_path,
-                "preview_url": self.preview_url,
+                "preview_url": preview_url,
             },
             "trash_images": trash_images,
         }
@@ -121,6 +159,32 @@ class UploadedArchive(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Чекпоинты обработки: архив делится на чанки по chunk_size записей,
+    # номера готовых чанков пишутся в completed_chunks вместе с их строками в БД;
+    # manage.py resume_archives перезапускает только невыполненные чанки;
+    # updated_at сдвигается при каждом готовом чанке — по нему видно, что обработка идёт
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('processing', 'Processing'),
+            ('done', 'Done'),
+            ('failed', 'Failed'),
+        ],
+        default='pending'
+    )
+    total_entries = models.PositiveIntegerField(null=True, blank=True)
+    chunk_size = models.PositiveIntegerField(null=True, blank=True)
+    completed_chunks = models.JSONField(default=list, blank=True)
+    error_reason = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def total_chunks(self):
+        if not self.total_entries or not self.chunk_size:
+            return 0
+        return (self.total_entries + self.chunk_size - 1) // self.chunk_size
+
 
 class DetectedImageLocation(models.Model):
     file = models.ForeignKey(
@@ -138,3 +202,63 @@ class DetectedImageLocation(models.Model):
     lat = models.FloatField(null=True, blank=True)
     lon = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+class GeocodeCacheEntry(models.Model):
+    KIND_FORWARD = 'forward'
+    KIND_REVERSE = 'reverse'
+
+    kind = models.CharField(
+        max_length=10,
+        choices=[
+            (KIND_FORWARD, 'Forward'),
+            (KIND_REVERSE, 'Reverse'),
+        ]
+    )
+    # нормализованный адрес или округлённые координаты "lat,lon"
+    key = models.CharField(max_length=500)
+    # found=False — геокодер ничего не нашёл, такой ответ тоже кэшируем
+    found = models.BooleanField(default=True)
+    address = models.CharField(max_length=500, null=True, blank=True)
+    lat = models.FloatField(null=True, blank=True)
+    lon = models.FloatField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'geocode_cache'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='geocode_cache_kind_key_uniq'),
+        ]
+
+
+class PredictionCacheEntry(models.Model):
+    # Результат GeoClip для (содержимое, angle, height, версия модели)
+    content_hash = models.CharField(max_length=64)
+    # NOT NULL: в уникальном ключе NULL-ы различны, и ON CONFLICT для них не срабатывал бы
+    angle = models.FloatField()
+    height = models.FloatField()
+    model_version = models.CharField(max_length=64)
+    lat = models.FloatField()
+    lon = models.FloatField()
+    address = models.CharField(max_length=500, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'prediction_cache'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_hash', 'angle', 'height', 'model_version'],
+                name='prediction_cache_key_uniq',
+            ),
+        ]
+
+
+class ConsumedUploadKey(models.Model):
+    # Ключ S3 прямой загрузки, по которому уже создана запись: повторный commit того же токена отклоняется
+    key = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'consumed_upload_keys'
@@ -1,6 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+import logging
+from urllib.parse import parse_qs, urlparse
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
+logger = logging.getLogger(__name__)
+
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
@@ -18,4 +24,54 @@ class CustomPagination(PageNumberPagination):
                 # 'to': self.page.end_index(),  # если нужно
             },
             'data': data
-        })
\ No newline at end of file
+        })
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация по -id: страница — WHERE id < <курсор> ORDER BY id DESC LIMIT n,
+    без COUNT(*) и OFFSET, поэтому глубокие страницы не медленнее первой.
+    Курсоры непрозрачные (base64), в meta отдаются next_cursor/prev_cursor.
+    Приблизительный total (оценка планировщика Postgres) — только по ?with_total=estimate.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.estimated_total = None
+        if request.query_params.get('with_total') == 'estimate':
+            self.estimated_total = self.estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    @staticmethod
+    def estimate_count(queryset):
+        """
+        Число строк по оценке планировщика (EXPLAIN без выполнения запроса).
+        """
+        try:
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows'])
+        except Exception as e:
+            logger.warning(f"Row estimate failed: {e}")
+            return None
+
+    def _cursor_param(self, link):
+        if not link:
+            return None
+        return parse_qs(urlparse(link).query).get(self.cursor_query_param, [None])[0]
+
+    def get_paginated_response(self, data):
+        next_link = self.get_next_link()
+        previous_link = self.get_previous_link()
+        meta = {
+            'per_page': self.page_size,
+            'next_cursor': self._cursor_param(next_link),
+            'prev_cursor': self._cursor_param(previous_link),
+            'next': next_link,
+            'previous': previous_link,
+        }
+        if self.estimated_total is not None:
+            meta['estimated_total'] = self.estimated_total
+        return Response({'meta': meta, 'data': data})
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import UploadedImage, ImageLocation, DetectedImageLocation
 
@@ -68,3 +69,38 @@ class ImageDataSerializer(serializers.Serializer):
 
 class UploadImagesRequestSerializer(serializers.Serializer):
     images_data = ImageDataSerializer(many=True)
+
+
+class DirectUploadFileSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=200)
+    content_type = serializers.CharField(required=False, allow_blank=True)
+    size = serializers.IntegerField(min_value=1)
+
+
+class DirectUploadPresignRequestSerializer(serializers.Serializer):
+    files = DirectUploadFileSerializer(many=True, allow_empty=False)
+
+    def validate_files(self, value):
+        if len(value) > settings.DIRECT_UPLOAD_MAX_FILES:
+            raise serializers.ValidationError(f"No more than {settings.DIRECT_UPLOAD_MAX_FILES} files per request")
+        return value
+
+
+class DirectUploadPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1)
+    etag = serializers.CharField()
+
+
+class DirectUploadCommitItemSerializer(serializers.Serializer):
+    upload_token = serializers.CharField()
+    parts = DirectUploadPartSerializer(many=True, required=False)
+    address = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    lat = serializers.FloatField(required=False, allow_null=True)
+    lon = serializers.FloatField(required=False, allow_null=True)
+    # Значения по умолчанию подставляются после чтения EXIF (apply_exif_metadata)
+    angle = serializers.FloatField(required=False, allow_null=True)
+    height = serializers.FloatField(required=False, allow_null=True)
+
+
+class DirectUploadCommitRequestSerializer(serializers.Serializer):
+    files = DirectUploadCommitItemSerializer(many=True, allow_empty=False)
@@ -1,6 +1,4 @@
 import uuid
-import zipfile
-import io
 import logging
 from django.conf import settings
 from .s3_service import S3Service
@@ -16,12 +14,15 @@ class ArchiveUploadService:
 
     def upload_archive(self, file_obj):
         """
-        Загружает архив в S3 и создаёт запись в БД
+        Загружает архив в S3 и создаёт запись в БД.
+        Файл не читается в память целиком: upload_fileobj отправляет его multipart-частями
+        по S3_MULTIPART_CHUNKSIZE (не больше S3_UPLOAD_MAX_WORKERS частей параллельно)
+        и прерывает multipart-загрузку при ошибке.
         """
         filename = f"archives/{uuid.uuid4()}_{file_obj.name}"
-        file_content = file_obj.read()
+        file_obj.seek(0)
 
-        success = self.s3_service.upload_file(filename, file_content, content_type="application/zip")
+        success = self.s3_service.upload_fileobj(filename, file_obj, content_type="application/zip")
         if not success:
             raise Exception("Failed to upload archive to S3")
 
@@ -0,0 +1,123 @@
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from image_api.models import ImageLocation, UploadedImage
+from .offline_geocoder import get_offline_geocoder
+from .prediction_cache import PredictionCacheService
+from .list_response_cache import bump_list_versions
+from .status_events import publish_status_deltas
+
+logger = logging.getLogger(__name__)
+
+
+APPLY_RESULTS_SQL = """
+UPDATE {locations} AS il SET
+    status = v.status,
+    lat = COALESCE(il.lat, v.lat),
+    lon = COALESCE(il.lon, v.lon),
+    address = COALESCE(NULLIF(il.address, ''), v.address),
+    error_reason = COALESCE(v.error_reason, il.error_reason)
+FROM (VALUES {values}) AS v(id, status, lat, lon, address, error_reason),
+     {images} AS ui
+WHERE il.id = v.id AND ui.id = il.image_id AND il.status <> 'done'
+RETURNING il.id, il.status, il.lat, il.lon, il.address, il.angle, il.height, v.lat, v.lon, ui.content_hash,
+          il.user_id, il.error_reason, v.address
+"""
+VALUES_ROW = "(%s::bigint, %s::varchar, %s::double precision, %s::double precision, %s::varchar, %s::text)"
+# Статусы CallbackResponse, которые меняют строку; остальные пропускаются
+KNOWN_STATUSES = ("Succeeded", "Failed")
+
+
+class PredictionCallbackService:
+    """
+    Применяет результаты GeoClip (CallbackResponse) пачкой одним условным UPDATE ... FROM (VALUES ...):
+    меняются только статус, пустые lat/lon/address и error_reason; строки в статусе done
+    не трогаются (повторный callback не затирает результат). Без предварительного SELECT.
+    Адреса здесь не ищутся — для строк без адреса запускается geocode_locations_task.
+    """
+
+    def apply(self, items):
+        """
+        items — список CallbackResponse ({'TaskId', 'Status', 'ErrorCode', 'ErrorMessage', 'Result'}).
+        Возвращает {task_id: текущий статус или None, если ImageLocation не найдена}.
+        """
+        from image_api.tasks import geocode_locations_task
+
+        offline = get_offline_geocoder() if settings.OFFLINE_GEOCODER_SNAP else None
+        rows = {}
+        for item in items:
+            try:
+                task_id = int(item.get("TaskId"))
+            except (TypeError, ValueError):
+                logger.warning(f"Callback with invalid TaskId: {item.get('TaskId')}")
+                continue
+
+            status_response = item.get("Status")
+            result = item.get("Result") or {}
+            latitude = result.get("Latitude")
+            longitude = result.get("Longitude")
+            address = None
+
+            if status_response == "Succeeded":
+                # Притягиваем предсказание к ближайшему зданию с адресом из локального индекса OSM
+                if offline is not None and latitude is not None and longitude is not None:
+                    snapped = offline.reverse((latitude, longitude))
+                    if snapped:
+                        latitude, longitude, address = snapped.lat, snapped.lon, snapped.address
+                rows[task_id] = (task_id, "done", latitude, longitude, address, None)
+            elif status_response == "Failed":
+                error_reason = item.get("ErrorMessage") or item.get("ErrorCode")
+                rows[task_id] = (task_id, "failed", None, None, None, error_reason)
+            else:
+                logger.warning(f"Callback for task {task_id} with unknown status: {status_response}")
+
+        statuses = {}
+        updated = []
+        if rows:
+            sql = APPLY_RESULTS_SQL.format(
+                locations=ImageLocation._meta.db_table,
+                images=UploadedImage._meta.db_table,
+                values=", ".join([VALUES_ROW] * len(rows)),
+            )
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [value for row in rows.values() for value in row])
+                updated = cursor.fetchall()
+
+                to_geocode = [
+                    row[0] for row in updated
+                    if row[1] == "done" and not row[4] and row[2] is not None and row[3] is not None
+                ]
+                if to_geocode:
+                    transaction.on_commit(lambda: geocode_locations_task.delay(to_geocode))
+
+                # Клиенты узнают о смене статуса из потока событий, кэш списка сбрасывается
+                deltas = [
+                    {'id': row[0], 'status': row[1], 'lat': row[2], 'lon': row[3], 'address': row[4],
+                     'user_id': row[10], 'error_reason': row[11]}
+                    for row in updated
+                ]
+                transaction.on_commit(lambda: publish_status_deltas(deltas))
+                transaction.on_commit(lambda: bump_list_versions(delta['user_id'] for delta in deltas))
+
+        for task_id, status, *_ in updated:
+            statuses[task_id] = status
+
+        # Не обновлённые: уже done (повторный callback) или не существуют
+        skipped = [task_id for task_id in rows if task_id not in statuses]
+        if skipped:
+            statuses.update(dict(ImageLocation.objects.filter(id__in=skipped).values_list('id', 'status')))
+        statuses.update({task_id: None for task_id in skipped if task_id not in statuses})
+
+        # В кэш — только вывод модели (v.*): адрес строки мог ввести пользователь,
+        # а запись кэша отдаётся другим пользователям с тем же содержимым
+        PredictionCacheService().store_many([
+            (content_hash, angle, height, predicted_lat, predicted_lon, predicted_address)
+            for (_, status, _, _, _, angle, height, predicted_lat, predicted_lon, content_hash,
+                 _, _, predicted_address) in updated
+            if status == "done"
+        ])
+
+        logger.info(f"Applied {len(updated)} of {len(items)} prediction callbacks")
+        return statuses
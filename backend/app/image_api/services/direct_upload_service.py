@@ -0,0 +1,185 @@
+import math
+import uuid
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from image_api.models import ConsumedUploadKey
+
+from .image_upload_service import ImageUploadService, apply_exif_metadata
+from .s3_service import S3Service
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = "image_api.direct_upload"
+REPLAY_ERROR = "Upload token has already been used"
+
+
+class DirectUploadService:
+    """
+    Загрузка изображений клиентом напрямую в S3:
+    1) presign — выдаём ключи и presigned PUT URL (или части multipart-загрузки);
+    2) commit — проверяем, что объекты загружены, создаём записи и запускаем обработку (start_image_processing).
+    Ключ привязан к пользователю подписанным upload_token, поэтому состояние между шагами не хранится;
+    после commit ключ помечается использованным (ConsumedUploadKey), и повтор токена отклоняется.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.s3_service = S3Service()
+
+    def presign(self, files):
+        """
+        files — [{'filename', 'content_type', 'size'}], возвращает инструкции загрузки в том же порядке.
+        """
+        expires_in = settings.DIRECT_UPLOAD_URL_EXPIRES_IN
+        part_size = settings.S3_MULTIPART_CHUNKSIZE
+        uploads = []
+
+        for i, item in enumerate(files):
+            key = f"{uuid.uuid4()}_{item['filename']}"
+            content_type = item.get('content_type') or 'application/octet-stream'
+            size = item['size']
+            token_data = {"u": self.user.id, "k": key, "n": item['filename'], "s": size}
+            upload = {"index": i, "key": key}
+
+            if size >= settings.S3_MULTIPART_THRESHOLD:
+                upload_id = self.s3_service.create_multipart_upload(key, content_type)
+                token_data["m"] = upload_id
+                upload.update({
+                    "method": "multipart",
+                    "upload_id": upload_id,
+                    "part_size": part_size,
+                    "parts": [
+                        {
+                            "part_number": n,
+                            "url": self.s3_service.generate_presigned_part_url(key, upload_id, n, expires_in),
+                        }
+                        for n in range(1, math.ceil(size / part_size) + 1)
+                    ],
+                })
+            else:
+                upload.update({
+                    "method": "put",
+                    "url": self.s3_service.generate_presigned_put_url(key, content_type, expires_in),
+                    "headers": {"Content-Type": content_type},
+                })
+
+            upload["upload_token"] = signing.dumps(token_data, salt=TOKEN_SALT)
+            uploads.append(upload)
+
+        return uploads
+
+    def commit(self, items):
+        """
+        items — [{'upload_token', 'parts'?, 'address', 'lat', 'lon', 'angle', 'height'}].
+        Возвращает (locations, errors) — как ImageUploadService.upload_and_process.
+        Каждый токен принимается один раз: ключ S3 записывается в ConsumedUploadKey
+        в той же транзакции, что и записи изображений.
+        """
+        from image_api.tasks import start_image_processing
+
+        tokens = []
+        errors = []
+        for i, item in enumerate(items):
+            try:
+                token = signing.loads(
+                    item['upload_token'], salt=TOKEN_SALT, max_age=settings.DIRECT_UPLOAD_TOKEN_MAX_AGE
+                )
+            except signing.BadSignature:
+                errors.append({"file_index": i, "filename": None, "error": "Invalid or expired upload token"})
+                continue
+            if token["u"] != self.user.id:
+                errors.append({"file_index": i, "filename": token["n"], "error": "Upload token belongs to another user"})
+                continue
+            tokens.append((i, item, token))
+
+        consumed = set(
+            ConsumedUploadKey.objects.filter(key__in=[token["k"] for _, _, token in tokens])
+            .values_list('key', flat=True)
+        )
+        checked = []
+        for i, item, token in tokens:
+            key = token["k"]
+            if key in consumed:
+                errors.append({"file_index": i, "filename": token["n"], "error": REPLAY_ERROR})
+                continue
+            consumed.add(key)
+            parts = [{"PartNumber": p["part_number"], "ETag": p["etag"]} for p in item.get("parts") or []]
+            if token.get("m") and not parts:
+                errors.append({"file_index": i, "filename": token["n"], "error": "Failed to complete multipart upload"})
+                continue
+            checked.append((i, item, token, parts))
+
+        # Multipart-загрузки завершаются, только когда все элементы прошли проверку: завершённую
+        # загрузку повторить нельзя (NoSuchUpload), а отклонённый пакет клиент отправит снова.
+        # Объект ожидаемого размера уже есть — загрузку завершил предыдущий commit
+        to_complete = []
+        for i, item, token, parts in checked:
+            size = self.s3_service.get_object_size(token["k"])
+            if token.get("m") and size != token["s"]:
+                to_complete.append((i, token, parts))
+            elif size is None:
+                errors.append({"file_index": i, "filename": token["n"], "error": "File was not uploaded"})
+            elif size != token["s"]:
+                errors.append({"file_index": i, "filename": token["n"], "error": "Uploaded file size mismatch"})
+        if errors:
+            return None, errors
+
+        for i, token, parts in to_complete:
+            key = token["k"]
+            if not self.s3_service.complete_multipart_upload(key, token["m"], parts):
+                errors.append({"file_index": i, "filename": token["n"], "error": "Failed to complete multipart upload"})
+            elif self.s3_service.get_object_size(key) != token["s"]:
+                errors.append({"file_index": i, "filename": token["n"], "error": "Uploaded file size mismatch"})
+
+        files = [
+            {
+                "filename": token["k"],
+                "original_filename": token["n"],
+                "url": self.s3_service.generate_file_url(token["k"]),
+                "index": i,
+                "address": item.get("address") or None,
+                "lat": item.get("lat"),
+                "lon": item.get("lon"),
+                "angle": item.get("angle"),
+                "height": item.get("height"),
+            }
+            for i, item, token, _ in checked
+        ]
+
+        if errors:
+            return None, errors
+
+        # Заголовки для EXIF читаются параллельно, а не по одному на файл
+        heads = self.s3_service.batch_read_heads([f["filename"] for f in files], settings.EXIF_HEADER_BYTES)
+        files = [apply_exif_metadata(f, head) for f, head in zip(files, heads)]
+
+        service = ImageUploadService(self.user)
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    ConsumedUploadKey.objects.bulk_create([
+                        ConsumedUploadKey(key=f["filename"], user=self.user) for f in files
+                    ])
+            except IntegrityError:
+                # Параллельный commit с теми же токенами успел раньше
+                return None, [
+                    {"file_index": f["index"], "filename": f["original_filename"], "error": REPLAY_ERROR}
+                    for f in files
+                ]
+            # Токены старше DIRECT_UPLOAD_TOKEN_MAX_AGE отклоняет signing, их ключи хранить незачем
+            ConsumedUploadKey.objects.filter(
+                created_at__lt=timezone.now() - timedelta(seconds=settings.DIRECT_UPLOAD_TOKEN_MAX_AGE)
+            ).delete()
+
+            images, locations = service.create_records_batch(files)
+            image_ids = service.pending_derivatives(images)
+            images_data = service.geo_tasks_payload(images, locations)
+            transaction.on_commit(lambda: start_image_processing(image_ids, images_data))
+
+        return locations, None
@@ -0,0 +1,149 @@
+import io
+import math
+import logging
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from PIL import Image, ExifTags
+
+logger = logging.getLogger(__name__)
+
+GPS = ExifTags.GPS
+
+EXIF_MARKER = b"Exif\x00\x00"
+# Маркеры без поля длины: TEM и RST0-RST7
+_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+
+
+class ExifGeo(NamedTuple):
+    lat: Optional[float]
+    lon: Optional[float]
+    altitude: Optional[float]
+    direction: Optional[float]
+    accuracy_m: Optional[float]
+    dop: Optional[float]
+
+    @property
+    def has_gps(self):
+        return self.lat is not None and self.lon is not None
+
+    @property
+    def trusted(self):
+        """
+        GPS считается надёжным, если координаты валидны (и не 0,0 — типичная «пустая» запись),
+        а заявленная точность, если есть, не хуже EXIF_GPS_MAX_ERROR_M.
+        """
+        if not self.has_gps or (self.lat == 0 and self.lon == 0):
+            return False
+        if self.accuracy_m is not None:
+            return self.accuracy_m <= settings.EXIF_GPS_MAX_ERROR_M
+        if self.dop is not None:
+            return self.dop <= settings.EXIF_GPS_MAX_DOP
+        return True
+
+
+def _number(value):
+    """
+    IFDRational/int -> float; None для отсутствующих и делённых на ноль значений.
+    """
+    if isinstance(value, (tuple, list)):
+        value = value[0] if value else None
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _ref(value):
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "ignore")
+    return value.strip("\x00 ").upper() if isinstance(value, str) else value
+
+
+def _degrees(values, ref, negative_ref):
+    if not isinstance(values, (tuple, list)) or len(values) < 3:
+        return None
+    parts = [_number(v) for v in values[:3]]
+    if any(v is None for v in parts):
+        return None
+    degrees = parts[0] + parts[1] / 60 + parts[2] / 3600
+    return -degrees if _ref(ref) == negative_ref else degrees
+
+
+def _exif_segment(head: bytes) -> Optional[bytes]:
+    """
+    Содержимое сегмента APP1 Exif из начала JPEG. Маркеры проходятся по полю длины,
+    поэтому ICC/XMP и прочие сегменты после APP1 читать не нужно.
+    None — APP1 Exif нет до SOS или он не уместился в head.
+    """
+    pos = 2
+    while pos + 4 <= len(head):
+        if head[pos] != 0xFF:
+            return None
+        marker = head[pos + 1]
+        if marker == 0xFF:  # заполняющие байты перед маркером
+            pos += 1
+            continue
+        if marker in _STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == 0xDA:  # SOS — дальше сжатые данные, EXIF не будет
+            return None
+        length = int.from_bytes(head[pos + 2:pos + 4], "big")
+        end = pos + 2 + length
+        if marker == 0xE1 and head[pos + 4:pos + 10] == EXIF_MARKER:
+            if end > len(head):
+                logger.debug(f"EXIF segment truncated: {length} bytes, head has {len(head) - pos - 4}")
+                return None
+            return head[pos + 4:end]
+        pos = end
+    return None
+
+
+def read_exif_geo(head: bytes) -> Optional[ExifGeo]:
+    """
+    Координаты, высота (над уровнем моря), направление съёмки и точность из EXIF GPS.
+    head — первые байты файла (EXIF_HEADER_BYTES). У JPEG разбирается только сегмент APP1
+    (остальные маркеры могут не уместиться в head), прочие форматы открывает Pillow;
+    пиксели не декодируются.
+    None — EXIF нет (не изображение, нет GPS) или он повреждён/обрезан.
+    """
+    try:
+        if head[:2] == b"\xff\xd8":
+            segment = _exif_segment(head)
+            if segment is None:
+                return None
+            exif = Image.Exif()
+            exif.load(segment)
+        else:
+            with Image.open(io.BytesIO(head)) as image:
+                exif = image.getexif()
+        gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    except Exception as e:
+        logger.debug(f"Unreadable EXIF: {e}")
+        return None
+    if not gps:
+        return None
+
+    lat = _degrees(gps.get(GPS.GPSLatitude), gps.get(GPS.GPSLatitudeRef), "S")
+    lon = _degrees(gps.get(GPS.GPSLongitude), gps.get(GPS.GPSLongitudeRef), "W")
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        lat = lon = None
+
+    altitude = _number(gps.get(GPS.GPSAltitude))
+    altitude_ref = gps.get(GPS.GPSAltitudeRef)
+    if altitude is not None and altitude_ref in (1, b"\x01"):
+        altitude = -altitude
+    direction = _number(gps.get(GPS.GPSImgDirection))
+
+    return ExifGeo(
+        lat=lat,
+        lon=lon,
+        altitude=altitude,
+        direction=direction % 360 if direction is not None else None,
+        accuracy_m=_number(gps.get(GPS.GPSHPositioningError)),
+        dop=_number(gps.get(GPS.GPSDOP)),
+    )
@@ -0,0 +1,197 @@
+import json
+import logging
+import re
+import time
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from geopy.geocoders import Nominatim
+
+from image_api.models import GeocodeCacheEntry
+from .offline_geocoder import get_offline_geocoder
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "geocode:"
+REDIS_STATS_KEY = "geocode:stats"
+REDIS_RATE_LIMIT_KEY = "geocode:ratelimit"
+
+
+def normalize_address(address: str) -> str:
+    return re.sub(r"\s+", " ", address).strip().lower()
+
+
+def reverse_key(lat: float, lon: float) -> str:
+    precision = settings.GEOCODE_REVERSE_PRECISION
+    return f"{round(float(lat), precision):.{precision}f},{round(float(lon), precision):.{precision}f}"
+
+
+class GeocodingService:
+    """
+    Геокодирование через Nominatim с кэшем:
+    память экземпляра (дубликаты в одном запросе) -> Redis -> таблица geocode_cache -> Nominatim.
+    Прямой поиск кэшируется по нормализованному адресу, обратный — по координатам,
+    округлённым до GEOCODE_REVERSE_PRECISION знаков (если локальный индекс OSM не нашёл адрес).
+    """
+
+    def __init__(self, min_interval: float = 0):
+        """
+        min_interval — минимальная пауза (сек) между обращениями к Nominatim
+        для всех воркеров сразу (общий ключ в Redis); попадания в кэш её не ждут.
+        """
+        self.geolocator = Nominatim(user_agent=settings.GEOCODER_USER_AGENT)
+        self.ttl = timedelta(seconds=settings.GEOCODE_CACHE_TTL)
+        self.min_interval = min_interval
+        self._last_request_at = None
+        self._memo = {}
+
+    def geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        """
+        Возвращает (lat, lon) для адреса или None.
+        """
+        if not address:
+            return None
+        entry = self._lookup(GeocodeCacheEntry.KIND_FORWARD, normalize_address(address),
+                             lambda: self.geolocator.geocode(address))
+        if entry['found']:
+            return entry['lat'], entry['lon']
+        return None
+
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Возвращает адрес для координат или None.
+        Сначала локальный индекс OSM (если собран), затем кэш и Nominatim.
+        """
+        if lat is None or lon is None:
+            return None
+        offline = get_offline_geocoder()
+        if offline is not None:
+            found = offline.reverse((lat, lon))
+            if found:
+                return found.address
+        entry = self._lookup(GeocodeCacheEntry.KIND_REVERSE, reverse_key(lat, lon),
+                             lambda: self.geolocator.reverse((lat, lon)))
+        return entry['address'] if entry['found'] else None
+
+    @staticmethod
+    def get_stats():
+        """
+        Счётчики попаданий/промахов по уровням, например {'forward:redis_hit': 10, ...}.
+        """
+        try:
+            raw = get_redis().hgetall(REDIS_STATS_KEY)
+        except Exception as e:
+            logger.warning(f"Geocode cache: failed to read stats: {e}")
+            return {}
+        return {k.decode(): int(v) for k, v in raw.items()}
+
+    def _lookup(self, kind, key, fetch):
+        memo_key = (kind, key)
+        if memo_key in self._memo:
+            self._count(kind, 'memo_hit')
+            return self._memo[memo_key]
+
+        entry = self._get_redis(kind, key)
+        if entry is not None:
+            self._count(kind, 'redis_hit')
+        else:
+            entry = self._get_db(kind, key)
+            if entry is not None:
+                self._count(kind, 'db_hit')
+                self._set_redis(kind, key, entry)
+            else:
+                self._count(kind, 'miss')
+                entry = self._fetch(kind, key, fetch)
+
+        self._memo[memo_key] = entry
+        return entry
+
+    def _fetch(self, kind, key, fetch):
+        self._wait_rate_limit()
+        try:
+            loc = fetch()
+        except Exception as e:
+            # Ошибку сети не кэшируем — в следующий раз попробуем снова
+            logger.warning(f"Geocoding failed for {kind} '{key}': {e}")
+            return {'found': False, 'address': None, 'lat': None, 'lon': None}
+
+        entry = {
+            'found': loc is not None,
+            'address': loc.address if loc else None,
+            'lat': loc.latitude if loc else None,
+            'lon': loc.longitude if loc else None,
+        }
+        self._set_db(kind, key, entry)
+        self._set_redis(kind, key, entry)
+        return entry
+
+    def _wait_rate_limit(self):
+        """
+        Глобальный лимит: обращение разрешено тому, кто успел SET NX ключа с TTL = min_interval,
+        остальные ждут его истечения. Без Redis — пауза только внутри экземпляра.
+        """
+        if not self.min_interval:
+            return
+        interval_ms = max(int(self.min_interval * 1000), 1)
+        try:
+            client = get_redis()
+            while not client.set(REDIS_RATE_LIMIT_KEY, 1, nx=True, px=interval_ms):
+                wait_ms = client.pttl(REDIS_RATE_LIMIT_KEY)
+                time.sleep(max(wait_ms, 10) / 1000)
+            self._last_request_at = time.monotonic()
+            return
+        except Exception as e:
+            logger.warning(f"Geocode rate limit: Redis unavailable, falling back to local throttle: {e}")
+
+        if self._last_request_at is not None:
+            delay = self._last_request_at + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self._last_request_at = time.monotonic()
+
+    def _get_db(self, kind, key):
+        row = (
+            GeocodeCacheEntry.objects
+            .filter(kind=kind, key=key, expires_at__gt=timezone.now())
+            .values('found', 'address', 'lat', 'lon')
+            .first()
+        )
+        return row
+
+    def _set_db(self, kind, key, entry):
+        try:
+            GeocodeCacheEntry.objects.update_or_create(
+                kind=kind, key=key,
+                defaults={**entry, 'expires_at': timezone.now() + self.ttl},
+            )
+        except IntegrityError:
+            # Параллельный воркер успел записать тот же ключ
+            pass
+
+    def _get_redis(self, kind, key):
+        try:
+            value = get_redis().get(f"{REDIS_KEY_PREFIX}{kind}:{key}")
+        except Exception as e:
+            logger.warning(f"Geocode cache: Redis GET failed: {e}")
+            return None
+        return json.loads(value) if value else None
+
+    def _set_redis(self, kind, key, entry):
+        try:
+            get_redis().set(
+                f"{REDIS_KEY_PREFIX}{kind}:{key}",
+                json.dumps(entry),
+                ex=settings.GEOCODE_CACHE_REDIS_TTL,
+            )
+        except Exception as e:
+            logger.warning(f"Geocode cache: Redis SET failed: {e}")
+
+    def _count(self, kind, tier):
+        try:
+            get_redis().hincrby(REDIS_STATS_KEY, f"{kind}:{tier}", 1)
+        except Exception:
+            pass
@@ -1,15 +1,65 @@
-import uuid
+import os
+import time
+import hashlib
 import logging
+from django.conf import settings
 from django.db import transaction
 from image_api.models import UploadedImage, ImageLocation
+from image_api.constants import DEFAULT_ANGLE, DEFAULT_HEIGHT
+from image_api.services.exif_reader import read_exif_geo
+from image_api.services.list_response_cache import bump_list_versions
 from image_api.services.s3_service import S3Service
 
 logger = logging.getLogger(__name__)
 
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_stream(chunks):
+    """
+    SHA-256 по итератору кусков (file.chunks(), iter(f.read, b'')), без чтения файла целиком.
+    """
+    hasher = hashlib.sha256()
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def content_key(content_hash, original_filename):
+    """
+    Ключ объекта в S3 по содержимому: одинаковые файлы попадают в один объект.
+    """
+    return f"{content_hash}{os.path.splitext(original_filename)[1].lower()}"
+
+
+def apply_exif_metadata(item, head):
+    """
+    Дополняет метаданные файла из EXIF (head — первые EXIF_HEADER_BYTES байт):
+    координаты — если клиент их не передал, angle — направлением съёмки.
+    Незаполненные angle/height получают значения по умолчанию.
+    При EXIF_TRUSTED_GPS_SKIP_INFERENCE изображение с надёжным GPS помечается skip_inference.
+    """
+    exif = read_exif_geo(head) if head else None
+    if exif is not None:
+        if item.get("lat") is None and item.get("lon") is None and exif.has_gps:
+            item["lat"], item["lon"] = exif.lat, exif.lon
+            item["skip_inference"] = settings.EXIF_TRUSTED_GPS_SKIP_INFERENCE and exif.trusted
+        if item.get("angle") is None and exif.direction is not None:
+            item["angle"] = exif.direction
+    # GPSAltitude — высота над уровнем моря, а не высота камеры над землёй: в height не пишем
+    if item.get("angle") is None:
+        item["angle"] = DEFAULT_ANGLE
+    if item.get("height") is None:
+        item["height"] = DEFAULT_HEIGHT
+    return item
+
+
 class ImageUploadService:
     def __init__(self, user):
         self.user = user
         self.s3_service = S3Service()
+        # Тайминги пачек последнего bulk_upload_and_process (для логов и бенчмарков)
+        self.batch_timings = []
 
     def validate_files(self, processed):
         validated_files = []
@@ -26,12 +76,19 @@ class ImageUploadService:
                     })
                     continue
 
-                filename = f"{uuid.uuid4()}_{file_obj.name}"
-                file_content = file_obj.read()
+                # Хэш считаем по мере чтения кусков
+                hasher = hashlib.sha256()
+                parts = []
+                for chunk in file_obj.chunks(HASH_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    parts.append(chunk)
+                content_hash = hasher.hexdigest()
+                file_content = b"".join(parts)
 
-                validated_files.append({
-                    "filename": filename,
+                validated_files.append(apply_exif_metadata({
+                    "filename": content_key(content_hash, file_obj.name),
                     "content": file_content,
+                    "content_hash": content_hash,
                     "original_filename": file_obj.name,
                     "index": i,
                     "content_type": getattr(file_obj, "content_type", "application/octet-stream"),
@@ -40,7 +97,7 @@ class ImageUploadService:
                     "lon": item.get("lon"),
                     "angle": item.get("angle"),
                     "height": item.get("height"),
-                })
+                }, file_content[:settings.EXIF_HEADER_BYTES]))
             except Exception as e:
                 validation_errors.append({
                     "file_index": i,
@@ -50,82 +107,206 @@ class ImageUploadService:
 
         return validated_files, validation_errors
 
+    def stored_hashes(self, hashes):
+        """
+        Хэши, объект которых уже лежит в S3 (под контентным ключом) — у любого пользователя.
+        Общий только объект в S3: UploadedImage у каждого пользователя свой (create_records_batch).
+        """
+        hashes = [h for h in hashes if h]
+        if not hashes:
+            return set()
+        return set(UploadedImage.objects.filter(content_hash__in=hashes).values_list('content_hash', flat=True))
+
+    def _upload_new(self, validated_files):
+        """
+        Загружает в S3 только файлы, которых ещё нет (по content_hash); повторяющиеся
+        в одном запросе файлы загружаются один раз.
+        """
+        existing = self.stored_hashes(f.get("content_hash") for f in validated_files)
+        to_upload = {}
+        for f in validated_files:
+            if f.get("content_hash") not in existing:
+                to_upload.setdefault(f["filename"], f)
+        skipped = len(validated_files) - len(to_upload)
+        if skipped:
+            logger.info(f"Dedup: {skipped} of {len(validated_files)} files already stored, upload skipped")
+        return self.s3_service.batch_upload(list(to_upload.values()))
+
     @transaction.atomic
     def upload_and_process(self, validated_files):
-        from image_api.tasks import process_geo_tasks
-        uploaded_images = []
-        upload_errors = []
+        from image_api.tasks import start_image_processing
+
+        upload_results = self._upload_new(validated_files)
+        if upload_results['failed']:
+            return None, upload_results['failed']
+
+        try:
+            images, locations = self.create_records_batch(validated_files)
+        except Exception as db_error:
+            # Объекты в S3 не удаляем: ключи контентные, повторная загрузка их переиспользует
+            logger.error(f"Database error: {str(db_error)}")
+            return None, [
+                {
+                    "file_index": f['index'],
+                    "filename": f['original_filename'],
+                    "error": f"Database error: {str(db_error)}"
+                }
+                for f in validated_files
+            ]
+
+        # Отправляем в Celery; задача должна увидеть закоммиченные строки
+        image_ids = self.pending_derivatives(images)
+        images_data = self.geo_tasks_payload(images, locations)
+        transaction.on_commit(lambda: start_image_processing(image_ids, images_data))
+
+        return images, None
 
-        upload_results = self.s3_service.batch_upload(validated_files)
+    def bulk_upload_and_process(self, validated_files, batch_size=None):
+        """
+        Массовая загрузка: файлы уходят в S3, записи UploadedImage/ImageLocation
+        создаются через bulk_create пачками по batch_size, каждая пачка — в своей
+        транзакции. Тайминги пачек пишутся в лог и в self.batch_timings.
+        """
+        from image_api.tasks import start_image_processing
 
-        # Успешные загрузки
-        for success_file in upload_results['successful']:
+        batch_size = batch_size or settings.IMAGE_UPLOAD_BATCH_SIZE
+        self.batch_timings = []
+
+        upload_results = self._upload_new(validated_files)
+        if upload_results['failed']:
+            return None, upload_results['failed']
+
+        uploaded_images = []
+        created_batches = []
+
+        for start in range(0, len(validated_files), batch_size):
+            batch = validated_files[start:start + batch_size]
             try:
-                uploaded = UploadedImage.objects.create(
-                    filename=success_file['filename'],
-                    original_filename=success_file['original_filename'],
-                    file_path=f"uploads/{success_file['filename']}",
-                    s3_url=success_file['url'],
-                    user=self.user
-                )
-                # сохраняем index, чтобы потом найти метаданные
-                uploaded._file_index = success_file['index']
-                uploaded_images.append(uploaded)
-                logger.info(f"Database record created: {success_file['filename']}")
+                images, locations = self.create_records_batch(batch)
             except Exception as db_error:
-                logger.error(f"Database error for {success_file['filename']}: {str(db_error)}")
-                self.s3_service.delete_file(success_file['filename'])
-                upload_errors.append({
-                    "file_index": success_file['index'],
-                    "filename": success_file['original_filename'],
-                    "error": f"Database error: {str(db_error)}"
-                })
+                logger.error(f"Bulk insert error at batch {start // batch_size}: {str(db_error)}")
+                self._rollback_batches(created_batches)
+                return None, [
+                    {
+                        "file_index": f['index'],
+                        "filename": f['original_filename'],
+                        "error": f"Database error: {str(db_error)}"
+                    }
+                    for f in validated_files
+                ]
+
+            created_batches.append((images, locations))
+            uploaded_images.extend(images)
 
-        upload_errors.extend(upload_results['failed'])
-
-        if upload_errors:
-            self._rollback(uploaded_images)
-            return None, upload_errors
-
-        # Создаём ImageLocation с метаданными
-        image_locations = []
-        for uploaded_image in uploaded_images:
-            # ищем словарь из validated_files по index
-            meta = next((f for f in validated_files if f["index"] == uploaded_image._file_index), {})
-
-            location = ImageLocation.objects.create(
-                user=self.user,
-                image=uploaded_image,
-                status='processing',
-                address=meta.get("address"),
-                lat=meta.get("lat"),
-                lon=meta.get("lon"),
-                angle=meta.get("angle"),
-                height=meta.get("height"),
-            )
-            image_locations.append(location)
-
-        # Отправляем в Celery
         images_data = [
+            item
+            for images, locations in created_batches
+            for item in self.geo_tasks_payload(images, locations)
+        ]
+        start_image_processing(self.pending_derivatives(uploaded_images), images_data)
+
+        return uploaded_images, None
+
+    def create_records_batch(self, files):
+        """
+        Создаёт UploadedImage и ImageLocation для уже загруженных в S3 файлов
+        двумя bulk_create в одной транзакции.
+        files — словари с filename, original_filename, content_hash (если есть)
+        и метаданными (address, lat, lon, angle, height).
+        UploadedImage пользователя с тем же content_hash переиспользуется.
+        Превью и копии для GeoClip запускает вызывающий код (start_image_processing).
+        """
+        started = time.perf_counter()
+        with transaction.atomic():
+            hashed = {}
+            for f in files:
+                if f.get('content_hash'):
+                    hashed.setdefault(f['content_hash'], f)
+
+            images_by_hash = {}
+            if hashed:
+                # Конфликт по (user, content_hash) — пользователь уже загружал этот файл
+                # (в т.ч. параллельным запросом)
+                UploadedImage.objects.bulk_create(
+                    [self._build_image(f) for f in hashed.values()],
+                    ignore_conflicts=True,
+                )
+                images_by_hash = {
+                    image.content_hash: image
+                    for image in UploadedImage.objects.filter(user=self.user, content_hash__in=hashed)
+                }
+
+            created = iter(UploadedImage.objects.bulk_create([
+                self._build_image(f) for f in files if not f.get('content_hash')
+            ]))
+            images = [
+                images_by_hash[f['content_hash']] if f.get('content_hash') else next(created)
+                for f in files
+            ]
+
+            locations = ImageLocation.objects.bulk_create([
+                ImageLocation(
+                    user=self.user,
+                    image=image,
+                    # Надёжный GPS из EXIF при включённой политике — без GeoClip
+                    status='done' if f.get("skip_inference") else 'processing',
+                    address=f.get("address"),
+                    lat=f.get("lat"),
+                    lon=f.get("lon"),
+                    angle=f.get("angle"),
+                    height=f.get("height"),
+                )
+                for f, image in zip(files, images)
+            ])
+            user_id = self.user.id
+            transaction.on_commit(lambda: bump_list_versions([user_id]))
+
+        elapsed = time.perf_counter() - started
+        self.batch_timings.append({"batch": len(self.batch_timings), "size": len(files), "seconds": elapsed})
+        logger.info(f"Bulk batch {len(self.batch_timings) - 1}: {len(files)} rows in {elapsed * 1000:.1f} ms")
+        return images, locations
+
+    def _build_image(self, f):
+        return UploadedImage(
+            filename=f['filename'],
+            original_filename=f['original_filename'],
+            file_path=f"uploads/{f['filename']}",
+            s3_url=f.get('url') or self.s3_service.generate_file_url(f['filename']),
+            content_hash=f.get('content_hash'),
+            user=self.user,
+        )
+
+    @staticmethod
+    def pending_derivatives(images):
+        """
+        id изображений, которым ещё нужны превью или копия для GeoClip.
+        """
+        return list({
+            image.id for image in images
+            if not image.renditions or (settings.INFERENCE_COPY_ENABLED and not image.inference_key)
+        })
+
+    @staticmethod
+    def geo_tasks_payload(images, locations):
+        return [
             {
                 "task_id": loc.id,
-                "image_filename": loc.image.filename,
+                "image_filename": image.filename,
+                "address": loc.address,
                 "angle": loc.angle,
                 "height": loc.height,
                 "lat": loc.lat,
                 "lon": loc.lon,
+                "skip_inference": loc.status == 'done',
             }
-            for loc in image_locations
+            for image, loc in zip(images, locations)
         ]
-        process_geo_tasks.delay(images_data)
 
-        return uploaded_images, None
-
-
-    def _rollback(self, uploaded_images):
-        for uploaded_image in uploaded_images:
-            try:
-                uploaded_image.delete()
-                self.s3_service.delete_file(uploaded_image.filename)
-            except Exception as e:
-                logger.error(f"Rollback error for {uploaded_image.filename}: {str(e)}")
+    def _rollback_batches(self, created_batches):
+        location_ids = [loc.id for _, locations in created_batches for loc in locations]
+        image_ids = {image.id for images, _ in created_batches for image in images}
+        ImageLocation.objects.filter(id__in=location_ids).delete()
+        # UploadedImage может быть общим (дедупликация) — удаляем только неиспользуемые
+        UploadedImage.objects.filter(
+            id__in=image_ids, locations__isnull=True, detected_locations__isnull=True
+        ).delete()
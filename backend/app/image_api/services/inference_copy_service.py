@@ -0,0 +1,105 @@
+import io
+import os
+import logging
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from image_api.models import UploadedImage
+from .s3_service import S3Service
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg"}
+FORMAT_CONTENT_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg"}
+
+
+def inference_key(filename, size=None, image_format=None):
+    """
+    Ключ копии для GeoClip, производный от ключа оригинала: inference/<имя>_<W>x<H>.<ext>.
+    """
+    width, height = size or settings.INFERENCE_IMAGE_SIZE
+    image_format = (image_format or settings.INFERENCE_COPY_FORMAT).upper()
+    stem = os.path.splitext(filename)[0]
+    return f"inference/{stem}_{width}x{height}{FORMAT_EXTENSIONS[image_format]}"
+
+
+def render_inference_copy(content, size=None, image_format=None, quality=None):
+    """
+    Копия под вход модели: ориентация по EXIF, RGB, ровно size (W, H) — GeoClipService
+    (PredictService) всё равно растягивает изображение до resize из processor_info.json
+    без сохранения пропорций, поэтому его собственный resize становится холостым.
+    По умолчанию PNG: после resize нет второго сжатия с потерями.
+    """
+    width, height = size or settings.INFERENCE_IMAGE_SIZE
+    image_format = (image_format or settings.INFERENCE_COPY_FORMAT).upper()
+    with Image.open(io.BytesIO(content)) as source:
+        source.draft("RGB", (width, height))
+        image = ImageOps.exif_transpose(source).convert("RGB")
+        image = image.resize((width, height), Image.Resampling.BICUBIC)
+        buffer = io.BytesIO()
+        if image_format == "JPEG":
+            image.save(buffer, format="JPEG", quality=quality or settings.INFERENCE_COPY_QUALITY)
+        else:
+            image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class InferenceCopyService:
+    """
+    Копии изображений размером со вход модели, чтобы GeoClipService скачивал и декодировал
+    десятки КБ вместо полноразмерных оригиналов. Копии создаются при приёме файла
+    (generate_derivatives_task, из того же скачивания, что и превью); ключ хранится
+    в UploadedImage.inference_key. Нет копии — задача уходит в GeoClip с оригиналом.
+    """
+
+    def __init__(self):
+        self.s3_service = S3Service()
+
+    def create(self, filename, content=None):
+        """
+        Делает копию и загружает её в S3; content — уже скачанный оригинал.
+        Возвращает ключ копии или None при ошибке.
+        """
+        if content is None:
+            content = self.s3_service.download_file(filename)
+            if content is None:
+                return None
+        try:
+            data = render_inference_copy(content)
+        except Exception as e:
+            logger.error(f"Inference copy error for {filename}: {e}")
+            return None
+        key = inference_key(filename)
+        image_format = settings.INFERENCE_COPY_FORMAT.upper()
+        if not self.s3_service.upload_file(key, data, FORMAT_CONTENT_TYPES[image_format]):
+            return None
+        logger.debug(f"Inference copy for {filename}: {len(content)} B -> {len(data)} B")
+        return key
+
+    @staticmethod
+    def attach(images_data):
+        """
+        Дополняет задачи (payload process_geo_tasks) ключом inference_filename готовой копии.
+        Копии здесь не создаются: отправка в GeoClip не ждёт обработки изображений.
+        """
+        if not settings.INFERENCE_COPY_ENABLED or not images_data:
+            return images_data
+
+        filenames = {img['image_filename'] for img in images_data}
+        # Копия другого размера или формата (сменили настройки) считается отсутствующей
+        keys = {
+            filename: key
+            for filename, key in UploadedImage.objects.filter(
+                filename__in=filenames, inference_key__isnull=False
+            ).values_list('filename', 'inference_key')
+            if key == inference_key(filename)
+        }
+        missing = len(filenames) - len(keys)
+        if missing:
+            logger.info(f"Inference copies: {missing} of {len(filenames)} images sent as originals")
+
+        return [
+            {**img, 'inference_filename': keys.get(img['image_filename'])}
+            for img in images_data
+        ]
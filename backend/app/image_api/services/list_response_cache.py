@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY_PREFIX = "locations:ver:"
+RESPONSE_KEY_PREFIX = "locations:list:"
+
+
+def normalize_query(query_params):
+    """
+    Параметры запроса в каноническом виде: сортировка ключей и значений, пустые отбрасываются.
+    """
+    items = []
+    for key in sorted(query_params.keys()):
+        values = sorted(v for v in query_params.getlist(key) if v != "")
+        items.extend(f"{key}={value}" for value in values)
+    return "&".join(items)
+
+
+def bump_list_versions(user_ids):
+    """
+    Сбрасывает кэш списка локаций пользователей: новая версия — новые ключи и ETag,
+    старые записи истекают сами по TTL.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids or not settings.LIST_CACHE_ENABLED:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(f"{VERSION_KEY_PREFIX}{user_id}")
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"List cache: version bump failed for users {sorted(user_ids)}: {e}")
+
+
+class ListResponseCache:
+    """
+    Кэш ответа GET /api/user/image-locations/ в Redis по (пользователь, версия, параметры).
+    Версия пользователя увеличивается при любом изменении его локаций (bump_list_versions).
+    ETag вычисляется из версии и параметров, поэтому проверка If-None-Match — один GET версии.
+    В ответе есть presigned URL, поэтому TTL не больше PRESIGNED_URL_REFRESH_MARGIN,
+    а ETag меняется не реже раза в TTL.
+    """
+
+    def __init__(self, user_id, query_params):
+        self.user_id = user_id
+        self.query = normalize_query(query_params)
+        self.ttl = max(1, min(settings.LIST_CACHE_TTL, settings.PRESIGNED_URL_REFRESH_MARGIN))
+        self.enabled = settings.LIST_CACHE_ENABLED
+        self.version = None
+
+    def load_version(self):
+        """
+        Читает текущую версию; None — кэш недоступен (Redis упал или выключен).
+        """
+        if not self.enabled:
+            return None
+        try:
+            self.version = int(get_redis().get(f"{VERSION_KEY_PREFIX}{self.user_id}") or 0)
+        except Exception as e:
+            logger.warning(f"List cache: version read failed for user {self.user_id}: {e}")
+            self.version = None
+        return self.version
+
+    @property
+    def etag(self):
+        if self.version is None:
+            return None
+        bucket = int(time.time() // self.ttl)
+        digest = hashlib.sha1(f"{self.user_id}|{self.version}|{bucket}|{self.query}".encode()).hexdigest()
+        return f'"{digest}"'
+
+    @property
+    def _key(self):
+        digest = hashlib.sha1(self.query.encode()).hexdigest()
+        return f"{RESPONSE_KEY_PREFIX}{self.user_id}:{self.version}:{digest}"
+
+    def matches(self, if_none_match):
+        etag = self.etag
+        if not etag or not if_none_match:
+            return False
+        return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    def get(self):
+        if self.version is None:
+            return None
+        try:
+            return get_redis().get(self._key)
+        except Exception as e:
+            logger.warning(f"List cache: read failed for user {self.user_id}: {e}")
+            return None
+
+    def set(self, body):
+        if self.version is None:
+            return
+        try:
+            get_redis().set(self._key, body, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"List cache: write failed for user {self.user_id}: {e}")
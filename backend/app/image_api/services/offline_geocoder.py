@@ -0,0 +1,214 @@
+import bz2
+import json
+import logging
+import math
+import mmap
+import os
+import threading
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000
+DEFAULT_CELL_SIZE = 0.01  # градусы, ~1.1 км по широте
+
+
+@dataclass
+class ReverseResult:
+    address: str
+    lat: float
+    lon: float
+    distance_m: float
+
+
+def _cell_keys(lat, lon, cell_size):
+    ncols = int(math.ceil(360 / cell_size))
+    rows = np.floor((np.asarray(lat, dtype=np.float64) + 90) / cell_size).astype(np.int64)
+    cols = np.floor((np.asarray(lon, dtype=np.float64) + 180) / cell_size).astype(np.int64)
+    return rows * ncols + cols
+
+
+def _format_address(tags):
+    return ", ".join(filter(None, [tags.get("addr:street") or tags.get("addr:place"),
+                                   tags.get("addr:housenumber"),
+                                   tags.get("addr:city")]))
+
+
+class OfflineReverseGeocoder:
+    """
+    Обратное геокодирование по локальному индексу адресных точек OSM.
+    Индекс — набор .npy-файлов, отсортированных по ячейкам сетки, открывается через mmap,
+    поэтому все воркеры на машине делят одни и те же страницы в page cache.
+    """
+
+    def __init__(self, index_dir):
+        index_dir = Path(index_dir)
+        meta = json.loads((index_dir / "meta.json").read_text())
+        self.cell_size = meta["cell_size"]
+        self.ncols = int(math.ceil(360 / self.cell_size))
+        self.lat = np.load(index_dir / "lat.npy", mmap_mode="r")
+        self.lon = np.load(index_dir / "lon.npy", mmap_mode="r")
+        self.cell_keys = np.load(index_dir / "cell_keys.npy", mmap_mode="r")
+        self.cell_starts = np.load(index_dir / "cell_starts.npy", mmap_mode="r")
+        self.addr_offsets = np.load(index_dir / "addr_offsets.npy", mmap_mode="r")
+        with open(index_dir / "addresses.bin", "rb") as f:
+            self.addresses = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self.lat)
+
+    def reverse(self, point, max_distance_m: float = None) -> Optional[ReverseResult]:
+        """
+        Ближайший адресный объект к point=(lat, lon) в пределах max_distance_m или None.
+        """
+        lat, lon = float(point[0]), float(point[1])
+        max_distance_m = max_distance_m or settings.OFFLINE_GEOCODER_MAX_DISTANCE_M
+
+        lat_delta = math.degrees(max_distance_m / EARTH_RADIUS_M)
+        lon_delta = lat_delta / max(math.cos(math.radians(lat)), 1e-6)
+        row_min = int((lat - lat_delta + 90) // self.cell_size)
+        row_max = int((lat + lat_delta + 90) // self.cell_size)
+        col_min = max(0, int((lon - lon_delta + 180) // self.cell_size))
+        col_max = min(self.ncols - 1, int((lon + lon_delta + 180) // self.cell_size))
+
+        best_index, best_distance = None, max_distance_m
+        cos_lat = math.cos(math.radians(lat))
+        for row in range(row_min, row_max + 1):
+            # ячейки одной строки сетки идут подряд — кандидаты образуют один срез
+            lo = int(np.searchsorted(self.cell_keys, row * self.ncols + col_min, side="left"))
+            hi = int(np.searchsorted(self.cell_keys, row * self.ncols + col_max, side="right"))
+            if lo == hi:
+                continue
+            start, end = int(self.cell_starts[lo]), int(self.cell_starts[hi])
+            dlat = np.radians(self.lat[start:end] - lat)
+            dlon = np.radians(self.lon[start:end] - lon) * cos_lat
+            distances = EARTH_RADIUS_M * np.sqrt(dlat * dlat + dlon * dlon)
+            i = int(np.argmin(distances))
+            if distances[i] <= best_distance:
+                best_index, best_distance = start + i, float(distances[i])
+
+        if best_index is None:
+            return None
+        address = bytes(self.addresses[self.addr_offsets[best_index]:self.addr_offsets[best_index + 1]]).decode("utf-8")
+        return ReverseResult(
+            address=address,
+            lat=float(self.lat[best_index]),
+            lon=float(self.lon[best_index]),
+            distance_m=best_distance,
+        )
+
+
+def build_index(osm_path, index_dir, cell_size: float = DEFAULT_CELL_SIZE):
+    """
+    Строит индекс из OSM XML (.osm / .osm.bz2): адресные точки (узлы с addr:housenumber)
+    и центроиды зданий (ways с building и addr:housenumber).
+    Два прохода, чтобы не держать в памяти координаты всех узлов региона.
+    """
+    def open_osm():
+        return bz2.open(osm_path, "rb") if str(osm_path).endswith(".bz2") else open(osm_path, "rb")
+
+    def iter_elements(tag):
+        with open_osm() as f:
+            root = None
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if root is None:
+                        root = elem
+                    continue
+                if elem.tag == tag:
+                    yield elem
+                if elem.tag in ("node", "way", "relation"):
+                    # elem.clear() оставляет пустые элементы детьми корня — чистим и корень,
+                    # иначе память растёт с числом объектов в выгрузке
+                    elem.clear()
+                    root.clear()
+
+    # Проход 1: здания с адресом и их узлы
+    buildings = []
+    needed_nodes = set()
+    for way in iter_elements("way"):
+        tags = {t.get("k"): t.get("v") for t in way.iter("tag")}
+        if "building" not in tags or "addr:housenumber" not in tags:
+            continue
+        refs = [int(nd.get("ref")) for nd in way.iter("nd")]
+        buildings.append((refs, _format_address(tags)))
+        needed_nodes.update(refs)
+    logger.info(f"Offline geocoder: {len(buildings)} addressed buildings")
+
+    # Проход 2: координаты узлов зданий и адресные точки
+    node_coords = {}
+    lats, lons, addresses = [], [], []
+    for node in iter_elements("node"):
+        node_id = int(node.get("id"))
+        lat, lon = float(node.get("lat")), float(node.get("lon"))
+        if node_id in needed_nodes:
+            node_coords[node_id] = (lat, lon)
+        tags = {t.get("k"): t.get("v") for t in node.iter("tag")}
+        if "addr:housenumber" in tags:
+            lats.append(lat)
+            lons.append(lon)
+            addresses.append(_format_address(tags))
+
+    for refs, address in buildings:
+        coords = [node_coords[ref] for ref in refs if ref in node_coords]
+        if not coords:
+            continue
+        lats.append(sum(c[0] for c in coords) / len(coords))
+        lons.append(sum(c[1] for c in coords) / len(coords))
+        addresses.append(address)
+    del node_coords
+
+    write_index(index_dir, lats, lons, addresses, cell_size)
+    return len(addresses)
+
+
+def write_index(index_dir, lats, lons, addresses, cell_size: float = DEFAULT_CELL_SIZE):
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    lat = np.asarray(lats, dtype=np.float64)
+    lon = np.asarray(lons, dtype=np.float64)
+    keys = _cell_keys(lat, lon, cell_size)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+
+    cell_keys, cell_first = np.unique(keys, return_index=True)
+    cell_starts = np.append(cell_first, len(keys)).astype(np.int64)
+
+    encoded = [addresses[i].encode("utf-8") for i in order]
+    addr_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    addr_offsets[1:] = np.cumsum([len(a) for a in encoded])
+
+    np.save(index_dir / "lat.npy", lat[order].astype(np.float32))
+    np.save(index_dir / "lon.npy", lon[order].astype(np.float32))
+    np.save(index_dir / "cell_keys.npy", cell_keys.astype(np.int64))
+    np.save(index_dir / "cell_starts.npy", cell_starts)
+    np.save(index_dir / "addr_offsets.npy", addr_offsets)
+    (index_dir / "addresses.bin").write_bytes(b"".join(encoded))
+    (index_dir / "meta.json").write_text(json.dumps({"cell_size": cell_size, "count": len(encoded)}))
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_offline_geocoder() -> Optional[OfflineReverseGeocoder]:
+    """
+    Общий на процесс индекс или None, если OFFLINE_GEOCODER_INDEX_DIR не задан/не собран.
+    """
+    global _geocoder
+    index_dir = settings.OFFLINE_GEOCODER_INDEX_DIR
+    if not index_dir or not (Path(index_dir) / "meta.json").exists():
+        return None
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                _geocoder = OfflineReverseGeocoder(index_dir)
+                logger.info(f"Offline geocoder loaded: {len(_geocoder)} points")
+    return _geocoder
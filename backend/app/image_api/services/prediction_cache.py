@@ -0,0 +1,144 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from image_api.models import ImageLocation, PredictionCacheEntry
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_STATS_KEY = "prediction_cache:stats"
+
+
+class PredictionCacheService:
+    """
+    Кэш результатов GeoClip по (content_hash, angle, height, GEOCLIP_MODEL_VERSION).
+    При попадании ImageLocation сразу получает статус done — без запроса в GeoClip и callback.
+    Смена GEOCLIP_MODEL_VERSION делает старые записи недоступными; удалить их — invalidate().
+    """
+
+    def __init__(self, model_version: str = None):
+        self.model_version = model_version or settings.GEOCLIP_MODEL_VERSION
+
+    def apply_cached(self, images_data):
+        """
+        Завершает задачи, для которых есть результат в кэше.
+        images_data — payload process_geo_tasks; возвращает (оставшиеся задачи, завершённые задачи).
+        Завершённые задачи дополняются lat/lon/address из кэша.
+        """
+        if not settings.PREDICTION_CACHE_ENABLED or not images_data:
+            return images_data, []
+
+        ids = [int(img['task_id']) for img in images_data]
+        locations = {
+            loc.id: loc
+            for loc in ImageLocation.objects.filter(id__in=ids, image__content_hash__isnull=False)
+            .select_related('image')
+            .only('id', 'lat', 'lon', 'address', 'angle', 'height', 'status', 'image__content_hash')
+        }
+        if not locations:
+            self._count(miss=len(images_data))
+            return images_data, []
+
+        entries = {
+            (e.content_hash, e.angle, e.height): e
+            for e in PredictionCacheEntry.objects.filter(
+                content_hash__in={loc.image.content_hash for loc in locations.values()},
+                model_version=self.model_version,
+            )
+        }
+
+        remaining, completed, hits = [], [], []
+        for img in images_data:
+            loc = locations.get(int(img['task_id']))
+            entry = entries.get((loc.image.content_hash, loc.angle, loc.height)) if loc else None
+            if entry is None:
+                remaining.append(img)
+                continue
+
+            loc.status = 'done'
+            if loc.lat is None or loc.lon is None:
+                loc.lat, loc.lon = entry.lat, entry.lon
+            if not loc.address:
+                loc.address = entry.address
+            hits.append(loc)
+            completed.append({**img, "lat": loc.lat, "lon": loc.lon, "address": loc.address})
+
+        if hits:
+            with transaction.atomic():
+                ImageLocation.objects.bulk_update(hits, ['status', 'lat', 'lon', 'address'])
+            logger.info(f"Prediction cache: {len(hits)} of {len(images_data)} tasks completed from cache")
+        self._count(hit=len(hits), miss=len(remaining))
+        return remaining, completed
+
+    def store(self, content_hash, angle, height, lat, lon, address=None):
+        """
+        Сохраняет результат GeoClip (вызывается из callback).
+        """
+        self.store_many([(content_hash, angle, height, lat, lon, address)])
+
+    def store_many(self, results):
+        """
+        results — кортежи (content_hash, angle, height, lat, lon, address); пишутся одним INSERT.
+        lat/lon/address — только результат модели (и адрес, найденный по нему), не данные пользователя.
+        """
+        if not settings.PREDICTION_CACHE_ENABLED:
+            return
+        entries = [
+            PredictionCacheEntry(
+                content_hash=content_hash,
+                angle=angle,
+                height=height,
+                model_version=self.model_version,
+                lat=lat,
+                lon=lon,
+                address=address,
+            )
+            for content_hash, angle, height, lat, lon, address in results
+            if content_hash and None not in (angle, height, lat, lon)
+        ]
+        if entries:
+            PredictionCacheEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+    @staticmethod
+    def invalidate(model_version: str = None):
+        """
+        Удаляет записи кэша указанной версии модели (или все, если версия не задана).
+        """
+        queryset = PredictionCacheEntry.objects.all()
+        if model_version:
+            queryset = queryset.filter(model_version=model_version)
+        deleted, _ = queryset.delete()
+        try:
+            get_redis().delete(REDIS_STATS_KEY)
+        except Exception as e:
+            logger.warning(f"Prediction cache: failed to reset stats: {e}")
+        logger.info(f"Prediction cache invalidated: {deleted} entries (version={model_version or 'all'})")
+        return deleted
+
+    @staticmethod
+    def get_stats():
+        """
+        {'hit': N, 'miss': M, 'hit_rate': N / (N + M)}
+        """
+        try:
+            raw = get_redis().hgetall(REDIS_STATS_KEY)
+        except Exception as e:
+            logger.warning(f"Prediction cache: failed to read stats: {e}")
+            return {}
+        stats = {k.decode(): int(v) for k, v in raw.items()}
+        total = stats.get('hit', 0) + stats.get('miss', 0)
+        stats['hit_rate'] = stats.get('hit', 0) / total if total else 0.0
+        return stats
+
+    def _count(self, hit=0, miss=0):
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            if hit:
+                pipe.hincrby(REDIS_STATS_KEY, 'hit', hit)
+            if miss:
+                pipe.hincrby(REDIS_STATS_KEY, 'miss', miss)
+            pipe.execute()
+        except Exception:
+            pass
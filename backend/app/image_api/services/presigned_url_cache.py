@@ -0,0 +1,141 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+
+from .redis_client import get_redis
+from .s3_service import S3Service
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "presigned:"
+
+
+class PresignedUrlCache:
+    """
+    Кэш presigned URL по ключу объекта S3.
+    Ссылка переиспользуется, пока до истечения expires_in остаётся больше refresh_margin секунд.
+    Уровни: LRU в памяти процесса -> Redis (опционально) -> подпись через S3Service.
+    """
+
+    def __init__(self, expires_in: int = None, refresh_margin: int = None,
+                 max_size: int = None, use_redis: bool = None):
+        self.expires_in = expires_in or settings.PRESIGNED_URL_EXPIRES_IN
+        self.refresh_margin = refresh_margin if refresh_margin is not None else settings.PRESIGNED_URL_REFRESH_MARGIN
+        self.max_size = max_size or settings.PRESIGNED_URL_CACHE_SIZE
+        self.use_redis = settings.PRESIGNED_URL_CACHE_REDIS if use_redis is None else use_redis
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (url, fresh_until)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Возвращает presigned URL для всех ключей за один проход:
+        сначала память, затем один MGET в Redis, оставшиеся подписываются локально.
+        """
+        now = time.time()
+        result = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            url = self._get_local(key, now)
+            if url is None:
+                missing.append(key)
+            else:
+                result[key] = url
+
+        if missing and self.use_redis:
+            for key, url, fresh_until in self._get_redis(missing, now):
+                self._set_local(key, url, fresh_until)
+                result[key] = url
+            missing = [key for key in missing if key not in result]
+
+        if missing:
+            signed = self._sign(missing, now)
+            result.update({key: url for key, (url, _) in signed.items()})
+            result.update({key: None for key in missing if key not in signed})
+
+        return result
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.use_redis:
+            try:
+                get_redis().delete(REDIS_KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"Presigned URL cache: Redis delete failed for {key}: {e}")
+
+    def _get_local(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            url, fresh_until = entry
+            if fresh_until <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url
+
+    def _set_local(self, key, url, fresh_until):
+        with self._lock:
+            self._entries[key] = (url, fresh_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _get_redis(self, keys, now):
+        try:
+            values = get_redis().mget([REDIS_KEY_PREFIX + key for key in keys])
+        except Exception as e:
+            logger.warning(f"Presigned URL cache: Redis MGET failed: {e}")
+            return []
+
+        found = []
+        for key, value in zip(keys, values):
+            if not value:
+                continue
+            fresh_until, _, url = value.decode().partition("|")
+            if float(fresh_until) > now:
+                found.append((key, url, float(fresh_until)))
+        return found
+
+    def _sign(self, keys, now):
+        s3 = S3Service()
+        fresh_until = now + self.expires_in - self.refresh_margin
+        signed = {}
+        for key in keys:
+            url = s3.generate_presigned_url(key, expires_in=self.expires_in)
+            if url is None:
+                continue
+            signed[key] = (url, fresh_until)
+            self._set_local(key, url, fresh_until)
+
+        if signed and self.use_redis:
+            ttl = max(1, int(self.expires_in - self.refresh_margin))
+            try:
+                pipe = get_redis().pipeline(transaction=False)
+                for key, (url, until) in signed.items():
+                    pipe.set(REDIS_KEY_PREFIX + key, f"{until}|{url}", ex=ttl)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Presigned URL cache: Redis write failed: {e}")
+        return signed
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_presigned_url_cache() -> PresignedUrlCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PresignedUrlCache()
+    return _cache
@@ -0,0 +1,26 @@
+import logging
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+
+
+def get_redis():
+    """
+    Возвращает общий для процесса клиент Redis под кэши приложения.
+    Пул соединений redis-py сам пересоздаётся после fork.
+    """
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=int(settings.REDIS_PORT),
+            password=settings.REDIS_PASSWORD or None,
+            db=settings.REDIS_CACHE_DB,
+            socket_timeout=settings.REDIS_CACHE_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CACHE_SOCKET_TIMEOUT,
+        )
+    return _redis
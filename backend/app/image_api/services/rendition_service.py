@@ -0,0 +1,87 @@
+import io
+import os
+import logging
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .s3_service import S3Service
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+FORMAT_CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+def rendition_key(filename, size, image_format=None):
+    """
+    Ключ превью в S3, производный от ключа оригинала: renditions/<имя>_<размер>.<ext>.
+    Ключи оригиналов контентные, поэтому у одинаковых файлов превью общие.
+    """
+    image_format = image_format or settings.RENDITION_FORMAT
+    stem = os.path.splitext(filename)[0]
+    return f"renditions/{stem}_{size}{FORMAT_EXTENSIONS[image_format]}"
+
+
+class RenditionService:
+    """
+    Уменьшенные копии изображений (превью для списка и просмотра) через Pillow.
+    Размеры — по длинной стороне (RENDITION_SIZES), формат WEBP или JPEG.
+    """
+
+    def __init__(self, sizes=None, image_format=None, quality=None):
+        self.sizes = sorted(sizes or settings.RENDITION_SIZES, reverse=True)
+        self.image_format = (image_format or settings.RENDITION_FORMAT).upper()
+        self.quality = quality or settings.RENDITION_QUALITY
+        self.s3_service = S3Service()
+
+    def render(self, content):
+        """
+        Возвращает {размер: байты} для всех размеров. Размеры больше оригинала не увеличиваются.
+        """
+        with Image.open(io.BytesIO(content)) as source:
+            # JPEG декодируется сразу с уменьшением (1/2..1/8) — заметно быстрее полного декодирования
+            source.draft("RGB", (self.sizes[0], self.sizes[0]))
+            image = ImageOps.exif_transpose(source)
+            if self.image_format == "JPEG":
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+
+            renditions = {}
+            # От большего к меньшему: каждый следующий размер уменьшается из предыдущего
+            for size in self.sizes:
+                image.thumbnail((size, size), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, format=self.image_format, quality=self.quality, optimize=True)
+                renditions[size] = buffer.getvalue()
+        return renditions
+
+    def create_renditions(self, filename, content=None):
+        """
+        Скачивает оригинал (если content не передан), делает превью и загружает их в S3.
+        Возвращает {"<размер>": ключ} или None при ошибке.
+        """
+        if content is None:
+            content = self.s3_service.download_file(filename)
+            if content is None:
+                return None
+
+        try:
+            rendered = self.render(content)
+        except Exception as e:
+            logger.error(f"Rendition error for {filename}: {e}")
+            return None
+
+        keys = {}
+        for size, data in rendered.items():
+            key = rendition_key(filename, size, self.image_format)
+            if not self.s3_service.upload_file(key, data, FORMAT_CONTENT_TYPES[self.image_format]):
+                return None
+            keys[str(size)] = key
+
+        logger.info(
+            f"Renditions for {filename}: {len(content)} B -> "
+            + ", ".join(f"{size}px {len(data)} B" for size, data in rendered.items())
+        )
+        return keys
@@ -1,7 +1,13 @@
+import io
 import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
-from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from typing import List, Dict, Any, Optional
 from urllib.parse import urlparse, urlunparse
 
@@ -12,30 +18,160 @@ AWS_ACCESS_KEY_ID = settings.AWS_ACCESS_KEY_ID
 AWS_SECRET_ACCESS_KEY = settings.AWS_SECRET_ACCESS_KEY
 AWS_S3_REGION_NAME = settings.AWS_S3_REGION_NAME
 
+S3_UPLOAD_MAX_WORKERS = settings.S3_UPLOAD_MAX_WORKERS
+S3_MULTIPART_THRESHOLD = settings.S3_MULTIPART_THRESHOLD
+S3_MULTIPART_CHUNKSIZE = settings.S3_MULTIPART_CHUNKSIZE
+S3_MAX_POOL_CONNECTIONS = settings.S3_MAX_POOL_CONNECTIONS
+S3_TCP_KEEPALIVE = settings.S3_TCP_KEEPALIVE
+
 logger = logging.getLogger(__name__)
 
+# Один boto3-клиент на процесс: пул соединений и разбор endpoint/креденшалов
+# не повторяются для каждого S3Service. После fork (prefork-воркеры Celery,
+# gunicorn) дочерний процесс создаёт свой клиент — сокеты родителя не переиспользуются.
+_client_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+
+def get_s3_client():
+    """
+    Возвращает общий для процесса boto3-клиент S3 (потокобезопасно).
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = boto3.session.Session().client(
+                's3',
+                endpoint_url=AWS_S3_ENDPOINT_URL,
+                aws_access_key_id=AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                region_name=AWS_S3_REGION_NAME,
+                config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    tcp_keepalive=S3_TCP_KEEPALIVE,
+                ),
+            )
+            _client_pid = pid
+            logger.info(f"S3 client created for process {pid}")
+    return _client
+
+
+def _reset_s3_client():
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_s3_client)
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Файловый объект поверх объекта S3: seek без сети, read — ranged GET.
+    Позволяет zipfile читать центральный каталог и отдельные записи, не скачивая архив.
+    """
+
+    def __init__(self, client, bucket_name: str, key: str):
+        self._client = client
+        self._bucket_name = bucket_name
+        self._key = key
+        self._size = client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._pos = max(0, pos)
+        return self._pos
+
+    def readinto(self, buffer):
+        if self._pos >= self._size or not len(buffer):
+            return 0
+        end = min(self._pos + len(buffer), self._size) - 1
+        data = self._client.get_object(
+            Bucket=self._bucket_name,
+            Key=self._key,
+            Range=f"bytes={self._pos}-{end}",
+        )['Body'].read()
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
 
 class S3Service:
     def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url=AWS_S3_ENDPOINT_URL,
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_S3_REGION_NAME,
-        )
+        self.s3_client = get_s3_client()
         self.bucket_name = os.getenv('AWS_STORAGE_BUCKET_NAME')
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_UPLOAD_MAX_WORKERS,
+        )
 
     def upload_file(self, filename: str, content: bytes, content_type: str = 'application/octet-stream') -> bool:
         """
-        Загружает файл в S3
+        Загружает файл в S3.
+        Файлы больше S3_MULTIPART_THRESHOLD загружаются multipart-частями по S3_MULTIPART_CHUNKSIZE.
         """
         try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=filename,
-                Body=content,
-                ContentType=content_type
+            if len(content) >= S3_MULTIPART_THRESHOLD:
+                self.s3_client.upload_fileobj(
+                    io.BytesIO(content),
+                    self.bucket_name,
+                    filename,
+                    ExtraArgs={'ContentType': content_type},
+                    Config=self.transfer_config,
+                )
+            else:
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=filename,
+                    Body=content,
+                    ContentType=content_type
+                )
+            logger.info(f"Uploaded to S3 successfully: {filename}")
+            return True
+        except ClientError as e:
+            logger.error(f"S3 upload error for {filename}: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error during S3 upload for {filename}: {str(e)}")
+            return False
+
+    def upload_fileobj(self, filename: str, fileobj, content_type: str = 'application/octet-stream') -> bool:
+        """
+        Загружает файловый объект в S3 потоково (multipart для больших объектов),
+        не читая его целиком в память
+        """
+        try:
+            self.s3_client.upload_fileobj(
+                fileobj,
+                self.bucket_name,
+                filename,
+                ExtraArgs={'ContentType': content_type},
+                Config=self.transfer_config,
             )
             logger.info(f"Uploaded to S3 successfully: {filename}")
             return True
@@ -46,6 +182,41 @@ class S3Service:
             logger.error(f"Unexpected error during S3 upload for {filename}: {str(e)}")
             return False
 
+    def open_ranged(self, filename: str, buffer_size: int = None):
+        """
+        Открывает объект S3 на чтение с произвольным доступом (ranged GET, буфер buffer_size)
+        """
+        return io.BufferedReader(
+            S3RangeReader(self.s3_client, self.bucket_name, filename),
+            buffer_size=buffer_size or settings.S3_RANGE_READ_SIZE,
+        )
+
+    def download_file(self, filename: str) -> Optional[bytes]:
+        """
+        Скачивает объект целиком; None — объекта нет или ошибка S3
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=filename)
+            return response['Body'].read()
+        except ClientError as e:
+            logger.error(f"S3 download error for {filename}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error during S3 download for {filename}: {str(e)}")
+            return None
+
+    def read_head(self, filename: str, size: int) -> Optional[bytes]:
+        """
+        Первые size байт объекта одним ranged GET (заголовки, EXIF)
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=filename, Range=f"bytes=0-{size - 1}")
+            return response['Body'].read()
+        except (ClientError, BotoCoreError) as e:
+            # Сетевые ошибки (таймаут, обрыв) тоже не должны ронять batch_read_heads
+            logger.error(f"S3 ranged read error for {filename}: {str(e)}")
+            return None
+
     def delete_file(self, filename: str) -> bool:
         """
         Удаляет файл из S3
@@ -71,23 +242,34 @@ class S3Service:
         endpoint_url = os.getenv('AWS_S3_ENDPOINT_URL', '').rstrip('/')
         return f"{endpoint_url}/{self.bucket_name}/{filename}"
 
-    def batch_upload(self, files_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def batch_upload(self, files_data: List[Dict[str, Any]], max_workers: Optional[int] = None) -> Dict[str, Any]:
         """
-        Загружает несколько файлов в S3
+        Загружает несколько файлов в S3 параллельно (пул не больше max_workers потоков)
         Возвращает словарь с результатами загрузки
         """
         results = {
             'successful': [],
             'failed': []
         }
+        if not files_data:
+            return results
+
+        max_workers = min(max_workers or S3_UPLOAD_MAX_WORKERS, len(files_data))
 
-        for file_data in files_data:
-            success = self.upload_file(
+        def upload(file_data):
+            return self.upload_file(
                 filename=file_data['filename'],
                 content=file_data['content'],
                 content_type=file_data.get('content_type', 'application/octet-stream')
             )
 
+        if max_workers <= 1:
+            statuses = [upload(file_data) for file_data in files_data]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                statuses = list(executor.map(upload, files_data))
+
+        for file_data, success in zip(files_data, statuses):
             if success:
                 results['successful'].append({
                     'filename': file_data['filename'],
@@ -104,6 +286,20 @@ class S3Service:
 
         return results
 
+    def batch_read_heads(self, filenames: List[str], size: int, max_workers: Optional[int] = None) -> List[Optional[bytes]]:
+        """
+        Читает первые size байт нескольких объектов параллельно (как batch_upload).
+        Возвращает байты в порядке filenames, None — для объектов, которые не удалось прочитать.
+        """
+        if not filenames:
+            return []
+
+        max_workers = min(max_workers or S3_UPLOAD_MAX_WORKERS, len(filenames))
+        if max_workers <= 1:
+            return [self.read_head(filename, size) for filename in filenames]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda filename: self.read_head(filename, size), filenames))
+
     def batch_delete(self, filenames: List[str]) -> bool:
         """
         Удаляет несколько файлов из S3
@@ -157,5 +353,77 @@ class S3Service:
         except Exception as e:
             logger.error(f"Error generating presigned URL for {filename}: {str(e)}")
             return None
-        
-     
+
+    def generate_presigned_put_url(self, filename: str, content_type: str, expires_in: int = 3600) -> Optional[str]:
+        """
+        Генерирует presigned URL для прямой загрузки объекта клиентом (PUT).
+        Клиент должен отправить тот же Content-Type.
+        """
+        try:
+            url = self.s3_client.generate_presigned_url(
+                "put_object",
+                Params={"Bucket": self.bucket_name, "Key": filename, "ContentType": content_type},
+                ExpiresIn=expires_in
+            )
+            return self.rewrite_presigned_url(url, settings.AWS_S3_PUBLIC_ENDPOINT)
+        except Exception as e:
+            logger.error(f"Error generating presigned PUT URL for {filename}: {str(e)}")
+            return None
+
+    def create_multipart_upload(self, filename: str, content_type: str) -> str:
+        """
+        Начинает multipart-загрузку, возвращает UploadId
+        """
+        response = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=filename, ContentType=content_type
+        )
+        return response["UploadId"]
+
+    def generate_presigned_part_url(self, filename: str, upload_id: str, part_number: int,
+                                    expires_in: int = 3600) -> str:
+        """
+        Генерирует presigned URL для загрузки одной части multipart-загрузки
+        """
+        url = self.s3_client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": self.bucket_name,
+                "Key": filename,
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+            },
+            ExpiresIn=expires_in
+        )
+        return self.rewrite_presigned_url(url, settings.AWS_S3_PUBLIC_ENDPOINT)
+
+    def complete_multipart_upload(self, filename: str, upload_id: str, parts: List[Dict[str, Any]]) -> bool:
+        """
+        Завершает multipart-загрузку; parts — [{'PartNumber': 1, 'ETag': '...'}, ...]
+        """
+        try:
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=filename,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error completing multipart upload for {filename}: {str(e)}")
+            self.abort_multipart_upload(filename, upload_id)
+            return False
+
+    def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=filename, UploadId=upload_id)
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload for {filename}: {str(e)}")
+
+    def get_object_size(self, filename: str) -> Optional[int]:
+        """
+        Размер объекта в байтах или None, если объекта нет
+        """
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=filename)["ContentLength"]
+        except ClientError:
+            return None
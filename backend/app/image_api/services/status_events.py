@@ -0,0 +1,119 @@
+import json
+import uuid
+import logging
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core import signing
+
+from image_api.models import ImageLocation
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "image_locations:user:"
+TICKET_SALT = "image_api.status_events"
+TICKET_USED_PREFIX = "status_events:ticket:"
+DELTA_FIELDS = ('id', 'status', 'lat', 'lon', 'address', 'error_reason')
+
+
+def user_channel(user_id):
+    return f"{CHANNEL_PREFIX}{user_id}"
+
+
+def issue_stream_ticket(user_id):
+    """
+    Короткоживущий одноразовый билет на подключение к потоку событий.
+    EventSource не умеет передавать заголовки, а JWT доступа в query string
+    оседает в логах прокси и истории браузера — в URL передаётся только билет.
+    """
+    return signing.dumps({"u": user_id, "n": uuid.uuid4().hex}, salt=TICKET_SALT)
+
+
+def redeem_stream_ticket(ticket):
+    """
+    Возвращает id пользователя, если билет подписан, не старше STATUS_EVENTS_TICKET_TTL
+    и ещё не использован (SET NX в Redis), иначе None.
+    """
+    ttl = settings.STATUS_EVENTS_TICKET_TTL
+    try:
+        data = signing.loads(ticket, salt=TICKET_SALT, max_age=ttl)
+    except signing.BadSignature:
+        return None
+    try:
+        first_use = get_redis().set(f"{TICKET_USED_PREFIX}{data['n']}", 1, nx=True, ex=ttl)
+    except Exception as e:
+        # Без Redis одноразовость не проверить, а поток без него всё равно не работает
+        logger.warning(f"Status events ticket check failed: {e}")
+        return None
+    return data["u"] if first_use else None
+
+
+def publish_status_deltas(rows):
+    """
+    Публикует изменения статусов в Redis pub/sub — одно сообщение на пользователя.
+    rows — словари с user_id и полями DELTA_FIELDS.
+    Ошибки Redis не мешают основной обработке: клиент получит данные при следующем запросе списка.
+    """
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row['user_id']].append({field: row.get(field) for field in DELTA_FIELDS})
+    if not by_user:
+        return
+
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id, deltas in by_user.items():
+            pipe.publish(user_channel(user_id), json.dumps({"locations": deltas}))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Status events publish failed: {e}")
+
+
+def publish_location_updates(location_ids):
+    """
+    Читает текущее состояние ImageLocation одним запросом и публикует его.
+    Возвращает id пользователей, чьи локации изменились.
+    """
+    if not location_ids:
+        return set()
+    rows = list(ImageLocation.objects.filter(id__in=location_ids).values('user_id', *DELTA_FIELDS))
+    publish_status_deltas(rows)
+    return {row['user_id'] for row in rows}
+
+
+async def status_event_stream(user_id):
+    """
+    Поток Server-Sent Events с изменениями статусов ImageLocation пользователя.
+    На каждое соединение — своя подписка; при тишине шлётся комментарий-keepalive,
+    чтобы прокси не закрывали соединение.
+    """
+    client = aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=int(settings.REDIS_PORT),
+        password=settings.REDIS_PASSWORD or None,
+        db=settings.REDIS_CACHE_DB,
+        socket_connect_timeout=settings.REDIS_CACHE_SOCKET_TIMEOUT,
+    )
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    channel = user_channel(user_id)
+    try:
+        await pubsub.subscribe(channel)
+        yield f"retry: {settings.STATUS_EVENTS_RETRY_MS}\n\n"
+        while True:
+            message = await pubsub.get_message(timeout=settings.STATUS_EVENTS_KEEPALIVE)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            data = message['data']
+            if isinstance(data, bytes):
+                data = data.decode()
+            yield f"event: status\ndata: {data}\n\n"
+    finally:
+        try:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Status events unsubscribe failed for user {user_id}: {e}")
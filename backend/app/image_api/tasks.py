@@ -1,93 +1,430 @@
-from celery import shared_task
+from celery import chain, chord, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from .models import ImageLocation
 from .utils import _send_geo_request_internal  # внутренняя версия _send_geo_request
-from django.core.exceptions import ObjectDoesNotExist
 import logging
-from image_api.models import UploadedArchive
-from image_api.services.image_upload_service import ImageUploadService
+from image_api.models import UploadedArchive, UploadedImage
+from image_api.services.geocoding_service import GeocodingService
+from image_api.services.inference_copy_service import InferenceCopyService, inference_key
+from image_api.services.image_upload_service import (
+    HASH_CHUNK_SIZE,
+    ImageUploadService,
+    apply_exif_metadata,
+    content_key,
+)
+from image_api.services.prediction_cache import PredictionCacheService
+from image_api.services.rendition_service import RenditionService
 from image_api.services.s3_service import S3Service
+from image_api.services.list_response_cache import bump_list_versions
+from image_api.services.status_events import publish_location_updates
+import hashlib
+import tempfile
+import time
 import zipfile
-import io
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
-DEFAULT_ANGLE=0
-DEFAULT_HEIGHT=1.5
+
+def _needs_geocoding(img):
+    has_coordinates = img.get('lat') is not None and img.get('lon') is not None
+    return bool(img.get('address')) != has_coordinates
+
+
+def _has_user_address(img):
+    # Пользователь указал только адрес — его координаты важнее предсказанных
+    return bool(img.get('address')) and (img.get('lat') is None or img.get('lon') is None)
+
 
 @shared_task
-def process_geo_tasks(images_data):
+def geocode_locations_task(location_ids, user_address_ids=()):
+    """
+    Дозаполняет адрес или координаты ImageLocation через геокодер.
+    Для user_address_ids (адрес ввёл пользователь, координат не было) координаты адреса
+    заменяют предсказанные, даже если callback или кэш уже успели их записать.
+    Обращения к Nominatim идут не чаще GEOCODE_MIN_INTERVAL на все воркеры, строки обновляются
+    пачками по GEOCODE_BATCH_SIZE одним bulk_update.
+    """
+    geocoder = GeocodingService(min_interval=settings.GEOCODE_MIN_INTERVAL)
+    batch_size = settings.GEOCODE_BATCH_SIZE
+    user_address_ids = set(user_address_ids)
+
+    for start in range(0, len(location_ids), batch_size):
+        batch_ids = location_ids[start:start + batch_size]
+        pending = ImageLocation.objects.filter(id__in=batch_ids).values('id', 'address', 'lat', 'lon')
+
+        resolved = {}
+        for row in pending:
+            if row['address'] and (row['id'] in user_address_ids or row['lat'] is None or row['lon'] is None):
+                coordinates = geocoder.geocode(row['address'])
+                if coordinates:
+                    resolved[row['id']] = {'lat': coordinates[0], 'lon': coordinates[1]}
+            elif row['lat'] is not None and row['lon'] is not None and not row['address']:
+                address = geocoder.reverse(row['lat'], row['lon'])
+                if address:
+                    resolved[row['id']] = {'address': address}
+
+        if not resolved:
+            continue
+
+        # Сеть — вне транзакции; здесь только короткая запись. Поля, которые
+        # уже успел заполнить callback, не перезаписываем — кроме координат адреса пользователя.
+        with transaction.atomic():
+            locations = list(ImageLocation.objects.select_for_update().filter(id__in=resolved))
+            changed = []
+            for location in locations:
+                updated = False
+                for field, value in resolved[location.id].items():
+                    if getattr(location, field) in (None, "") or (
+                        location.id in user_address_ids and getattr(location, field) != value
+                    ):
+                        setattr(location, field, value)
+                        updated = True
+                if updated:
+                    changed.append(location)
+            ImageLocation.objects.bulk_update(changed, ['address', 'lat', 'lon'])
+        bump_list_versions(publish_location_updates([location.id for location in changed]))
+        logger.info(f"Geocoded {len(changed)} of {len(batch_ids)} locations")
+
+
+@shared_task
+def process_geo_tasks(images_data, attempt=0):
     """
     Асинхронная задача для отправки запроса на геолокацию.
+    Задачи с результатом в кэше предсказаний завершаются сразу, без GeoClip;
+    если в записи кэша нет адреса, он ищется отдельной задачей после коммита.
+    Геокодирование адресов/координат запускается параллельно отдельной задачей.
+    failed получают только задачи, которые GeoClip явно отклонил. При неизвестном исходе
+    (таймаут, 5xx) задачи остаются processing и отправляются повторно (attempt — номер повтора)
+    до GEOCLIP_DISPATCH_RETRIES раз; пришедший тем временем callback просто завершит строку.
     """
+    # Что геокодировать, решается по данным загрузки — до того, как кэш заполнит координаты
+    to_geocode = [img['task_id'] for img in images_data if _needs_geocoding(img)]
+    if attempt:
+        # Повтор: геокодирование уже запущено, отправляем только не завершённые за это время
+        pending = set(
+            ImageLocation.objects.filter(id__in=[img['task_id'] for img in images_data], status='processing')
+            .values_list('id', flat=True)
+        )
+        images_data = [img for img in images_data if int(img['task_id']) in pending]
+    else:
+        user_address_ids = [img['task_id'] for img in images_data if _has_user_address(img)]
+        if to_geocode:
+            geocode_locations_task.delay(to_geocode, user_address_ids)
+
+    # Локации с надёжным GPS из EXIF уже done — им нужен только адрес
+    images_data = [img for img in images_data if not img.get('skip_inference')]
+    images_data, completed = PredictionCacheService().apply_cached(images_data)
+    # Адрес в кэше есть не всегда (только с OFFLINE_GEOCODER_SNAP) — дозаполняем, как после callback
+    without_address = [img['task_id'] for img in completed if not img['address'] and img['task_id'] not in to_geocode]
+    if without_address:
+        transaction.on_commit(lambda: geocode_locations_task.delay(without_address))
+
+    if not images_data:
+        bump_list_versions(publish_location_updates([img['task_id'] for img in completed]))
+        return
+
+    # GeoClip получает копии размером со вход модели (готовятся при приёме файла) вместо оригиналов
+    images_data = InferenceCopyService.attach(images_data)
     geo_result = _send_geo_request_internal(images_data)
 
-    if geo_result:
-        for error in geo_result['errors']:
-            task_id = error['task_id']
-            try:
-                location = ImageLocation.objects.get(id=int(task_id))
-                location.status = 'failed'
-                location.save()
-                logger.info(f"Updated ImageLocation {location.id} to 'failed'")
-            except ImageLocation.DoesNotExist:
-                logger.warning(f"ImageLocation not found for task_id={task_id}")
-    else:
-        logger.error("Geo request failed with no result returned.")
+    errors = {int(error['task_id']): error for error in geo_result['errors'] if error.get('task_id')}
+    retry_ids = {task_id for task_id, error in errors.items() if error.get('retryable')}
+    if retry_ids and attempt < settings.GEOCLIP_DISPATCH_RETRIES:
+        retry = [img for img in images_data if int(img['task_id']) in retry_ids]
+        countdown = settings.GEOCLIP_DISPATCH_RETRY_DELAY * 2 ** attempt
+        process_geo_tasks.apply_async((retry,), {'attempt': attempt + 1}, countdown=countdown)
+        logger.warning(f"Retrying {len(retry)} geo tasks in {countdown:.0f} s (attempt {attempt + 1})")
+        errors = {task_id: error for task_id, error in errors.items() if task_id not in retry_ids}
+
+    # Отклонённые (и исчерпавшие повторы) задачи помечаются failed одним bulk_update;
+    # строки, которые callback уже успел завершить, не трогаем
+    failed = []
+    if errors:
+        processing = set(
+            ImageLocation.objects.filter(id__in=errors, status='processing').values_list('id', flat=True)
+        )
+        failed = [
+            ImageLocation(id=task_id, status='failed', error_reason=error['error'])
+            for task_id, error in errors.items()
+            if task_id in processing
+        ]
+    if failed:
+        ImageLocation.objects.bulk_update(failed, ['status', 'error_reason'])
+        logger.info(f"Marked {len(failed)} ImageLocations as 'failed'")
+
+    # Завершённые из кэша и отклонённые задачи — одним сообщением на пользователя
+    bump_list_versions(publish_location_updates([img['task_id'] for img in completed] + [loc.id for loc in failed]))
+
+
+@shared_task
+def generate_derivatives_task(image_ids):
+    """
+    Делает для UploadedImage превью и копию под вход GeoClip — из одного скачивания оригинала,
+    изображения обрабатываются параллельно (S3_UPLOAD_MAX_WORKERS). Ключи сохраняются одним bulk_update,
+    кэш списков владельцев сбрасывается, чтобы preview_url сразу указывал на превью.
+    Задача стоит в цепочке перед process_geo_tasks, поэтому не падает: без копии
+    задача уйдёт в GeoClip с оригиналом.
+    """
+    try:
+        _generate_derivatives(image_ids)
+    except Exception as e:
+        logger.error(f"Derivatives failed for images {image_ids}: {e}")
+
+
+def _generate_derivatives(image_ids):
+    images = list(
+        UploadedImage.objects.filter(id__in=image_ids).only('id', 'filename', 'renditions', 'inference_key')
+    )
+    if not images:
+        return
+
+    copy_enabled = settings.INFERENCE_COPY_ENABLED
+    # Тот же файл у другого пользователя — производные в S3 уже есть (ключи производные от контентного)
+    known = {image.filename: {'renditions': {}, 'inference_key': None} for image in images}
+    for filename, renditions, key in (
+        UploadedImage.objects.filter(filename__in=known).values_list('filename', 'renditions', 'inference_key')
+    ):
+        if renditions:
+            known[filename]['renditions'] = renditions
+        if key and key == inference_key(filename):
+            known[filename]['inference_key'] = key
+
+    rendition_service = RenditionService()
+    copy_service = InferenceCopyService()
+
+    def derive(filename):
+        entry = known[filename]
+        need_renditions = not entry['renditions']
+        need_copy = copy_enabled and not entry['inference_key']
+        if not need_renditions and not need_copy:
+            return entry
+        content = rendition_service.s3_service.download_file(filename)
+        if content is None:
+            return entry
+        entry = dict(entry)
+        if need_renditions:
+            entry['renditions'] = rendition_service.create_renditions(filename, content) or {}
+        if need_copy:
+            entry['inference_key'] = copy_service.create(filename, content)
+        return entry
+
+    filenames = list(known)
+    with ThreadPoolExecutor(max_workers=min(settings.S3_UPLOAD_MAX_WORKERS, len(filenames))) as executor:
+        derived = dict(zip(filenames, executor.map(derive, filenames)))
+
+    changed, rendered = [], []
+    for image in images:
+        entry = derived[image.filename]
+        updated = False
+        if entry['renditions'] and image.renditions != entry['renditions']:
+            image.renditions = entry['renditions']
+            rendered.append(image)
+            updated = True
+        if entry['inference_key'] and image.inference_key != entry['inference_key']:
+            image.inference_key = entry['inference_key']
+            updated = True
+        if updated:
+            changed.append(image)
+
+    if changed:
+        UploadedImage.objects.bulk_update(changed, ['renditions', 'inference_key'])
+    if rendered:
+        bump_list_versions(
+            ImageLocation.objects.filter(image__in=rendered).values_list('user_id', flat=True).distinct()
+        )
+    logger.info(
+        f"Derivatives for {len(images)} images: {len(rendered)} with new renditions, "
+        f"{sum(1 for image in images if image.inference_key)} with inference copies"
+    )
+
+
+def start_image_processing(image_ids, images_data):
+    """
+    Запуск обработки новых записей (вызывается после коммита): сначала производные изображений,
+    затем process_geo_tasks — цепочкой, чтобы GeoClip получил уже готовую копию.
+    Если производные не нужны, задачи отправляются сразу.
+    """
+    if image_ids:
+        chain(generate_derivatives_task.si(image_ids), process_geo_tasks.si(images_data)).delay()
+    elif images_data:
+        process_geo_tasks.delay(images_data)
+
+
+def _archive_entry_content_type(name):
+    return "image/jpeg" if name.lower().endswith(("jpg", "jpeg")) else "image/png"
+
+
+def _archive_image_entries(zf):
+    """
+    Записи-изображения архива в порядке центрального каталога — одинаково
+    во всех подзадачах, поэтому чанк однозначно задаётся диапазоном индексов.
+    """
+    entries = []
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        # проверка по расширению
+        if not info.filename.lower().endswith((".jpg", ".jpeg", ".png", ".gif")):
+            logger.warning(f"Skipped non-image file: {info.filename}")
+            continue
+        entries.append(info)
+    return entries
+
 
 @shared_task
 def process_archive_task(archive_id):
+    """
+    Читает центральный каталог архива прямо из S3 (ranged GET), делит записи на чанки
+    по ARCHIVE_CHUNK_SIZE и запускает их параллельно через chord.
+    Повторный запуск пропускает чанки из UploadedArchive.completed_chunks.
+    """
     try:
         archive = UploadedArchive.objects.get(id=archive_id)
         logger.info(f"Processing archive {archive.filename}")
 
         s3 = S3Service()
+        with s3.open_ranged(archive.filename) as stream, zipfile.ZipFile(stream) as zf:
+            total_entries = len(_archive_image_entries(zf))
+
+        # Размер чанка фиксируется при первом запуске, иначе чекпоинты перестанут совпадать
+        archive.chunk_size = archive.chunk_size or settings.ARCHIVE_CHUNK_SIZE
+        archive.total_entries = total_entries
+        archive.status = 'processing'
+        archive.error_reason = None
+        archive.save(update_fields=['chunk_size', 'total_entries', 'status', 'error_reason', 'updated_at'])
+
+        completed = set(archive.completed_chunks)
+        pending = [n for n in range(archive.total_chunks) if n not in completed]
+        logger.info(
+            f"Archive {archive_id}: {total_entries} images, "
+            f"{archive.total_chunks} chunks, {len(pending)} pending"
+        )
 
-        # Скачиваем файл из S3 в память
-        obj = s3.s3_client.get_object(Bucket=s3.bucket_name, Key=archive.filename)
-        file_bytes = obj["Body"].read()
+        if not pending:
+            finalize_archive_task.delay([], archive_id)
+            return
 
-        with zipfile.ZipFile(io.BytesIO(file_bytes)) as zf:
-            image_files = [f for f in zf.namelist() if not f.endswith("/")]
+        chord(
+            process_archive_chunk_task.s(archive_id, chunk_index) for chunk_index in pending
+        )(finalize_archive_task.s(archive_id))
+
+    except Exception as e:
+        logger.error(f"Error processing archive {archive_id}: {str(e)}")
+        UploadedArchive.objects.filter(id=archive_id).update(
+            status='failed', error_reason=str(e), updated_at=timezone.now()
+        )
 
-            validated_files = []
-            for i, name in enumerate(image_files):
-                # проверка по расширению
-                if not name.lower().endswith((".jpg", ".jpeg", ".png", ".gif")):
-                    logger.warning(f"Skipped non-image file: {name}")
-                    continue
 
-                with zf.open(name) as file_data:
-                    content = file_data.read()
+@shared_task
+def process_archive_chunk_task(archive_id, chunk_index):
+    """
+    Обрабатывает один чанк архива: каждая запись распаковывается один раз — хэшируется
+    по мере записи во временный буфер (в памяти до ARCHIVE_ENTRY_SPOOL_SIZE, дальше на диске)
+    и, если такого объекта ещё нет, загружается в S3 из буфера.
+    Затем строки БД и чекпоинт чанка фиксируются одной транзакцией.
+    Ключи в S3 контентные (SHA-256), поэтому повтор чанка и повторные файлы не плодят копии.
+    """
+    try:
+        archive = UploadedArchive.objects.select_related('user').get(id=archive_id)
+        if chunk_index in archive.completed_chunks:
+            return {"chunk": chunk_index, "ok": True, "skipped": True}
 
-                validated_files.append({
-                    "filename": f"{uuid.uuid4()}_{name}",
-                    "content": content,
+        s3 = S3Service()
+        service = ImageUploadService(archive.user)
+        start = chunk_index * archive.chunk_size
+        end = start + archive.chunk_size
+        started = time.perf_counter()
+
+        batch = []
+        with s3.open_ranged(archive.filename) as stream, zipfile.ZipFile(stream) as zf:
+            entries = list(enumerate(_archive_image_entries(zf)[start:end], start=start))
+
+            stored = set()
+            for i, info in entries:
+                name = info.filename
+                with zf.open(info) as file_data, \
+                        tempfile.SpooledTemporaryFile(max_size=settings.ARCHIVE_ENTRY_SPOOL_SIZE) as spool:
+                    hasher = hashlib.sha256()
+                    head = b""
+                    for chunk in iter(lambda: file_data.read(HASH_CHUNK_SIZE), b""):
+                        if len(head) < settings.EXIF_HEADER_BYTES:
+                            head += chunk[:settings.EXIF_HEADER_BYTES - len(head)]
+                        hasher.update(chunk)
+                        spool.write(chunk)
+                    content_hash = hasher.hexdigest()
+                    filename = content_key(content_hash, name)
+
+                    if content_hash not in stored and not service.stored_hashes([content_hash]):
+                        spool.seek(0)
+                        if not s3.upload_fileobj(filename, spool, _archive_entry_content_type(name)):
+                            raise Exception(f"Failed to upload {name} to S3")
+                    stored.add(content_hash)
+
+                batch.append(apply_exif_metadata({
+                    "filename": filename,
+                    "content_hash": content_hash,
                     "original_filename": name,
+                    "url": s3.generate_file_url(filename),
                     "index": i,
-                    "content_type": (
-                        "image/jpeg" if name.lower().endswith(("jpg", "jpeg")) else "image/png"
-                    ),
-                    # для совместимости с upload_and_process
                     "address": None,
                     "lat": None,
                     "lon": None,
-                    "angle": DEFAULT_ANGLE,   # дефолт
-                    "height": DEFAULT_HEIGHT,  # дефолт
-                })
-
-            if validated_files:
-                service = ImageUploadService(archive.user)
-                uploaded_images, errors = service.upload_and_process(validated_files)
-                if errors:
-                    logger.error(f"Errors while processing archive {archive_id}: {errors}")
-                else:
-                    try:
-                        s3.delete_file(archive.filename)
-                        archive.delete()
-                        logger.info(f"Archive {archive.filename} deleted from DB and S3")
-                    except Exception as cleanup_error:
-                        logger.error(f"Cleanup error for archive {archive_id}: {cleanup_error}")    
+                    "angle": None,   # из EXIF или дефолт
+                    "height": None,  # дефолт
+                }, head))
+
+        with transaction.atomic():
+            locked = UploadedArchive.objects.select_for_update().get(id=archive_id)
+            if chunk_index in locked.completed_chunks:
+                return {"chunk": chunk_index, "ok": True, "skipped": True}
+
+            if batch:
+                images, locations = service.create_records_batch(batch)
+                image_ids = service.pending_derivatives(images)
+                images_data = service.geo_tasks_payload(images, locations)
+                transaction.on_commit(lambda: start_image_processing(image_ids, images_data))
+            locked.completed_chunks = sorted(locked.completed_chunks + [chunk_index])
+            locked.save(update_fields=['completed_chunks', 'updated_at'])
+
+        logger.info(
+            f"Archive {archive_id} chunk {chunk_index}: {len(batch)} images "
+            f"in {time.perf_counter() - started:.1f} s"
+        )
+        return {"chunk": chunk_index, "ok": True, "count": len(batch)}
 
     except Exception as e:
-        logger.error(f"Error processing archive {archive_id}: {str(e)}")
\ No newline at end of file
+        # Исключение не пробрасываем: иначе chord не вызовет finalize_archive_task
+        logger.error(f"Error processing archive {archive_id} chunk {chunk_index}: {str(e)}")
+        return {"chunk": chunk_index, "ok": False, "error": str(e)}
+
+
+@shared_task
+def finalize_archive_task(chunk_results, archive_id):
+    """
+    Callback chord: удаляет архив, если все чанки готовы, иначе помечает его failed
+    (повторный process_archive_task продолжит с невыполненных чанков).
+    """
+    try:
+        archive = UploadedArchive.objects.get(id=archive_id)
+    except UploadedArchive.DoesNotExist:
+        logger.warning(f"Archive {archive_id} not found on finalize")
+        return
+
+    failed = [r for r in chunk_results if not r.get("ok")]
+    missing = set(range(archive.total_chunks)) - set(archive.completed_chunks)
+    if failed or missing:
+        logger.error(f"Errors while processing archive {archive_id}: {failed}")
+        archive.status = 'failed'
+        archive.error_reason = "; ".join(f"chunk {r['chunk']}: {r['error']}" for r in failed) or None
+        archive.save(update_fields=['status', 'error_reason', 'updated_at'])
+        return
+
+    try:
+        S3Service().delete_file(archive.filename)
+        archive.delete()
+        logger.info(f"Archive {archive.filename} deleted from DB and S3")
+    except Exception as cleanup_error:
+        logger.error(f"Cleanup error for archive {archive_id}: {cleanup_error}")
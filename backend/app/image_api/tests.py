@@ -1,3 +1,1355 @@
-from django.test import TestCase
+import bz2
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from botocore.exceptions import ClientError, ReadTimeoutError
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import ExifTags, Image
+from PIL.TiffImagePlugin import IFDRational
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    UploadedImage, ImageLocation, DetectedImageLocation, ConsumedUploadKey, UploadedArchive, PredictionCacheEntry,
+    GeocodeCacheEntry,
+)
+from .constants import DEFAULT_ANGLE, DEFAULT_HEIGHT
+from .events import _authenticate_stream
+from .filters import ImageLocationFilter, bounding_box_filters
+from .services.archive_upload_service import ArchiveUploadService
+from .services.callback_service import PredictionCallbackService
+from .services.direct_upload_service import REPLAY_ERROR
+from .services.exif_reader import read_exif_geo
+from .services.geocoding_service import GeocodingService
+from .services.image_upload_service import ImageUploadService, apply_exif_metadata
+from .services.list_response_cache import bump_list_versions
+from .services.offline_geocoder import OfflineReverseGeocoder, build_index
+from .services import presigned_url_cache, s3_service
+from .services.presigned_url_cache import PresignedUrlCache
+from .services.rendition_service import RenditionService
+from .services.s3_service import S3RangeReader, S3Service
+from .services.inference_copy_service import InferenceCopyService, inference_key, render_inference_copy
+from .tasks import process_archive_chunk_task, process_archive_task, process_geo_tasks
+from .utils import _send_geo_request_internal
+
+
+class _FakeRedis:
+    """
+    Словарь вместо Redis: только команды, которые используют кэши приложения (TTL не учитывается).
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def incr(self, key):
+        value = int(self.data.get(key, 0)) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        results = [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+class _FakePresignedUrlCache:
+    def get_many(self, keys):
+        return {key: f"http://s3.local/{key}" for key in keys}
+
+
+@override_settings(LIST_CACHE_ENABLED=False)
+@mock.patch('image_api.views.get_presigned_url_cache', return_value=_FakePresignedUrlCache())
+class GetUserImageLocationsQueryCountTest(TestCase):
+    # COUNT для пагинации + страница локаций (image, user через JOIN) + prefetch детекций с file
+    EXPECTED_QUERIES = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_locations(self, count, detections_per_location):
+        for i in range(count):
+            image = UploadedImage.objects.create(filename=f"{i}.jpg", user=self.user)
+            location = ImageLocation.objects.create(user=self.user, image=image, status='done')
+            for j in range(detections_per_location):
+                detected = UploadedImage.objects.create(filename=f"{i}_{j}.jpg", user=self.user)
+                DetectedImageLocation.objects.create(file=detected, image_location=location)
+
+    def _get(self, page_size):
+        return self.client.get(reverse('user-image-locations'), {'page_size': page_size})
+
+    def test_query_count_does_not_depend_on_page_size(self, _cache):
+        self._create_locations(count=30, detections_per_location=1)
+
+        for page_size in (1, 10, 30):
+            with self.assertNumQueries(self.EXPECTED_QUERIES):
+                response = self._get(page_size)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['data']), page_size)
+
+    def test_query_count_does_not_depend_on_detections(self, _cache):
+        self._create_locations(count=5, detections_per_location=4)
+
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self._get(10)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(len(item['trash_images']) == 4 for item in response.data['data']))
+
+
+@override_settings(LIST_CACHE_ENABLED=False)
+@mock.patch('image_api.views.get_presigned_url_cache', return_value=_FakePresignedUrlCache())
+class GetUserImageLocationsCursorPaginationTest(TestCase):
+    # Без COUNT: страница локаций + prefetch детекций
+    EXPECTED_QUERIES = 2
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(25):
+            image = UploadedImage.objects.create(filename=f"{i}.jpg", user=self.user)
+            ImageLocation.objects.create(user=self.user, image=image, status='done')
+
+    def _get(self, **params):
+        return self.client.get(reverse('user-image-locations'), {'pagination': 'cursor', 'page_size': 10, **params})
+
+    def test_cursor_walks_all_pages_without_count(self, _cache):
+        seen = []
+        cursor = None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            with self.assertNumQueries(self.EXPECTED_QUERIES):
+                response = self._get(**params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['data'])
+            cursor = response.data['meta']['next_cursor']
+            if not cursor:
+                break
+
+        expected = list(ImageLocation.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_prev_cursor_returns_previous_page(self, _cache):
+        first = self._get()
+        second = self._get(cursor=first.data['meta']['next_cursor'])
+        back = self._get(cursor=second.data['meta']['prev_cursor'])
+        self.assertEqual(
+            [item['id'] for item in back.data['data']],
+            [item['id'] for item in first.data['data']],
+        )
+
+
+@override_settings(LIST_CACHE_ENABLED=False)
+@mock.patch('image_api.views.get_presigned_url_cache', return_value=_FakePresignedUrlCache())
+class GetUserImageLocationsDateFilterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        image = UploadedImage.objects.create(filename="a.jpg", user=self.user)
+        self.locations = {}
+        for label, created_at in [('day_before', datetime(2026, 5, 1, 23, 59, 59)),
+                                  ('start', datetime(2026, 5, 2, 0, 0)),
+                                  ('end', datetime(2026, 5, 2, 23, 59, 59)),
+                                  ('day_after', datetime(2026, 5, 3, 0, 0))]:
+            location = ImageLocation.objects.create(user=self.user, image=image, status='done')
+            ImageLocation.objects.filter(id=location.id).update(created_at=timezone.make_aware(created_at))
+            self.locations[label] = location.id
+
+    def _get(self, **params):
+        return self.client.get(reverse('user-image-locations'), {'pagination': 'cursor', **params})
+
+    def test_date_range_is_inclusive_and_does_not_cast_column(self, _cache):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._get(created_date_after='2026-05-02', created_date_before='2026-05-02')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(item['id'] for item in response.data['data']),
+                         sorted([self.locations['start'], self.locations['end']]))
+        # Полуоткрытый диапазон по created_at, без приведения к date — иначе индекс (user, created_at) не работает
+        location_sql = queries.captured_queries[0]['sql']
+        self.assertIn('"created_at" >=', location_sql)
+        self.assertNotIn('::date', location_sql)
+
+    def test_invalid_date_is_rejected(self, _cache):
+        self.assertEqual(self._get(created_date_after='02.05.2026').status_code, 400)
+
+
+class ImageLocationRadiusFilterTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='owner', password='pass')
+        image = UploadedImage.objects.create(filename="a.jpg", user=user)
+        self.near = ImageLocation.objects.create(user=user, image=image, lat=55.75, lon=37.61)
+        ImageLocation.objects.create(user=user, image=image, lat=59.93, lon=30.31)
+
+    def test_radius_is_applied_once(self):
+        with mock.patch('image_api.filters.bounding_box_filters', wraps=bounding_box_filters) as bbox:
+            found = list(ImageLocationFilter(
+                {'lat': '55.7', 'lon': '37.6', 'radius_km': '10'}, queryset=ImageLocation.objects.all()
+            ).qs)
+
+        self.assertEqual(found, [self.near])
+        bbox.assert_called_once()
+
+    def test_incomplete_radius_params_do_not_filter(self):
+        queryset = ImageLocationFilter({'lat': '55.7', 'lon': '37.6'}, queryset=ImageLocation.objects.all()).qs
+        self.assertEqual(queryset.count(), 2)
+
+
+@mock.patch('image_api.services.image_upload_service.S3Service')
+@mock.patch('image_api.services.direct_upload_service.S3Service')
+class DirectUploadTest(TestCase):
+    SIZE = 1024
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _s3(self, s3_class, size=SIZE):
+        s3 = s3_class.return_value
+        s3.generate_presigned_put_url.return_value = "http://s3.local/put"
+        s3.generate_file_url.side_effect = lambda key: f"http://s3.local/{key}"
+        s3.get_object_size.return_value = size
+        s3.batch_read_heads.side_effect = lambda keys, size: [None] * len(keys)
+        return s3
+
+    def _presign(self, client=None):
+        response = (client or self.client).post(
+            reverse('uploads_presign'),
+            {'files': [{'filename': 'a.jpg', 'content_type': 'image/jpeg', 'size': self.SIZE}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data['uploads'][0]
+
+    def _commit(self, token):
+        with self.captureOnCommitCallbacks():
+            return self.client.post(reverse('uploads_commit'), {'files': [{'upload_token': token}]}, format='json')
+
+    def test_presign_returns_put_url_and_token(self, s3_class, _upload_s3):
+        self._s3(s3_class)
+        upload = self._presign()
+
+        self.assertEqual(upload['method'], 'put')
+        self.assertEqual(upload['url'], "http://s3.local/put")
+        self.assertTrue(upload['key'].endswith('_a.jpg'))
+        self.assertTrue(upload['upload_token'])
+
+    def test_commit_creates_location_and_consumes_key(self, s3_class, _upload_s3):
+        self._s3(s3_class)
+        upload = self._presign()
+
+        response = self._commit(upload['upload_token'])
+
+        self.assertEqual(response.status_code, 200)
+        location = ImageLocation.objects.get(id=response.data['ids'][0])
+        self.assertEqual(location.image.filename, upload['key'])
+        self.assertEqual(location.status, 'processing')
+        self.assertTrue(ConsumedUploadKey.objects.filter(key=upload['key'], user=self.user).exists())
+
+    def test_commit_replay_is_rejected(self, s3_class, _upload_s3):
+        self._s3(s3_class)
+        token = self._presign()['upload_token']
+        self.assertEqual(self._commit(token).status_code, 200)
+
+        response = self._commit(token)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['validation_errors'][0]['error'], REPLAY_ERROR)
+        self.assertEqual(ImageLocation.objects.filter(user=self.user).count(), 1)
+
+    def test_commit_size_mismatch_is_rejected(self, s3_class, _upload_s3):
+        self._s3(s3_class, size=self.SIZE + 1)
+        token = self._presign()['upload_token']
+
+        response = self._commit(token)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['validation_errors'][0]['error'], "Uploaded file size mismatch")
+        self.assertFalse(ImageLocation.objects.exists())
+        self.assertFalse(ConsumedUploadKey.objects.exists())
+
+    def test_commit_rejects_token_of_another_user(self, s3_class, _upload_s3):
+        self._s3(s3_class)
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='pass'))
+        token = self._presign(client=other)['upload_token']
+
+        response = self._commit(token)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['validation_errors'][0]['error'], "Upload token belongs to another user")
+
+    def _presign_multipart(self, s3_class, count):
+        s3 = self._s3(s3_class)
+        s3.create_multipart_upload.return_value = "upload-1"
+        s3.generate_presigned_part_url.return_value = "http://s3.local/part"
+        with override_settings(S3_MULTIPART_THRESHOLD=self.SIZE):
+            response = self.client.post(
+                reverse('uploads_presign'),
+                {'files': [{'filename': f'{n}.jpg', 'size': self.SIZE} for n in range(count)]},
+                format='json',
+            )
+        self.assertEqual(response.data['uploads'][0]['method'], 'multipart')
+        return s3, [upload['upload_token'] for upload in response.data['uploads']]
+
+    def test_multipart_is_not_completed_when_another_item_is_invalid(self, s3_class, _upload_s3):
+        s3, (first, second) = self._presign_multipart(s3_class, 2)
+        s3.get_object_size.return_value = None  # части загружены, объект ещё не собран
+        parts = [{'part_number': 1, 'etag': '"abc"'}]
+
+        with self.captureOnCommitCallbacks():
+            response = self.client.post(reverse('uploads_commit'), {'files': [
+                {'upload_token': first, 'parts': parts},
+                {'upload_token': second},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['file_index'] for e in response.data['validation_errors']], [1])
+        s3.complete_multipart_upload.assert_not_called()
+
+    def test_multipart_already_completed_is_not_completed_again(self, s3_class, _upload_s3):
+        # Повтор commit после отклонённого пакета: объект уже собран и имеет ожидаемый размер
+        s3, (token,) = self._presign_multipart(s3_class, 1)
+
+        with self.captureOnCommitCallbacks():
+            response = self.client.post(reverse('uploads_commit'), {'files': [
+                {'upload_token': token, 'parts': [{'part_number': 1, 'etag': '"abc"'}]},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        s3.complete_multipart_upload.assert_not_called()
+
+
+@mock.patch('image_api.services.s3_service.get_s3_client')
+class S3ServiceTest(SimpleTestCase):
+    def test_read_head_network_error_returns_none(self, get_client):
+        get_client.return_value.get_object.side_effect = [
+            ReadTimeoutError(endpoint_url="http://s3.local"),
+            {"Body": io.BytesIO(b"head")},
+        ]
+
+        self.assertEqual(S3Service().batch_read_heads(["a.jpg", "b.jpg"], 4, max_workers=1), [None, b"head"])
+
+    @mock.patch('image_api.services.s3_service.S3_MULTIPART_THRESHOLD', 10)
+    def test_batch_upload_uses_multipart_for_large_files_and_keeps_order(self, get_client):
+        def put_object(**kwargs):
+            if kwargs['Key'] == 'broken.jpg':
+                raise ClientError({}, 'PutObject')
+
+        client = get_client.return_value
+        client.put_object.side_effect = put_object
+        files = [
+            {'filename': name, 'original_filename': name, 'index': i, 'content': content}
+            for i, (name, content) in enumerate([('small.jpg', b'x'), ('large.jpg', b'x' * 20), ('broken.jpg', b'x')])
+        ]
+
+        results = S3Service().batch_upload(files, max_workers=3)
+
+        self.assertEqual([f['filename'] for f in results['successful']], ['small.jpg', 'large.jpg'])
+        self.assertEqual(results['failed'], [{'filename': 'broken.jpg', 'index': 2, 'error': 'Failed to upload to S3'}])
+        # Большой файл — через TransferManager (multipart), маленькие — одним PUT
+        self.assertEqual(client.upload_fileobj.call_args.args[2], 'large.jpg')
+        self.assertEqual(sorted(c.kwargs['Key'] for c in client.put_object.call_args_list), ['broken.jpg', 'small.jpg'])
+
+    def test_upload_fileobj_streams_with_multipart_config(self, get_client):
+        self.assertTrue(S3Service().upload_fileobj("archives/a.zip", io.BytesIO(b"zip"), "application/zip"))
+
+        kwargs = get_client.return_value.upload_fileobj.call_args.kwargs
+        self.assertEqual(kwargs['Config'].multipart_chunksize, settings.S3_MULTIPART_CHUNKSIZE)
+        self.assertEqual(kwargs['Config'].max_request_concurrency, settings.S3_UPLOAD_MAX_WORKERS)
+
+
+@mock.patch('image_api.services.s3_service.boto3')
+class S3ClientTest(SimpleTestCase):
+    def setUp(self):
+        s3_service._reset_s3_client()
+        self.addCleanup(s3_service._reset_s3_client)
+
+    def test_client_is_shared_within_process(self, boto3):
+        self.assertIs(S3Service().s3_client, S3Service().s3_client)
+        boto3.session.Session.assert_called_once()
+
+    def test_child_process_creates_own_client(self, boto3):
+        boto3.session.Session.return_value.client.side_effect = [mock.sentinel.parent, mock.sentinel.child]
+        parent = s3_service.get_s3_client()
+
+        # После fork PID другой — сокеты пула родителя не переиспользуются
+        with mock.patch('image_api.services.s3_service.os.getpid', return_value=-1):
+            child = s3_service.get_s3_client()
+
+        self.assertEqual((parent, child), (mock.sentinel.parent, mock.sentinel.child))
+
+
+@mock.patch('image_api.services.presigned_url_cache.time.time', return_value=1000.0)
+@mock.patch('image_api.services.presigned_url_cache.S3Service')
+class PresignedUrlCacheTest(SimpleTestCase):
+    def _cache(self, s3_class, **options):
+        s3_class.return_value.generate_presigned_url.side_effect = (
+            lambda key, expires_in: f"http://s3.local/{key}?v={s3_class.return_value.generate_presigned_url.call_count}"
+        )
+        return PresignedUrlCache(**{'expires_in': 100, 'refresh_margin': 30, 'use_redis': False, **options})
+
+    def test_lru_evicts_least_recently_used(self, s3_class, _time):
+        cache = self._cache(s3_class, max_size=2)
+        cache.get_many(['a', 'b'])
+        cache.get('a')  # a — последний использованный, вытесняется b
+        cache.get('c')
+
+        self.assertEqual(cache.get('a'), "http://s3.local/a?v=1")
+        self.assertEqual(cache.get('b'), "http://s3.local/b?v=4")
+
+    def test_url_is_resigned_within_refresh_margin(self, s3_class, time_):
+        cache = self._cache(s3_class)
+        first = cache.get('a')
+
+        time_.return_value = 1000 + 69
+        self.assertEqual(cache.get('a'), first)
+        # До истечения ссылки меньше refresh_margin — клиент получил бы почти протухший URL
+        time_.return_value = 1000 + 71
+        self.assertNotEqual(cache.get('a'), first)
+
+    def test_redis_tier_is_shared_between_processes(self, s3_class, _time):
+        redis = _FakeRedis()
+        with mock.patch('image_api.services.presigned_url_cache.get_redis', return_value=redis):
+            url = self._cache(s3_class, use_redis=True).get('a')
+            # Другой процесс: пустой LRU, ссылка берётся из Redis без подписи
+            other = self._cache(s3_class, use_redis=True)
+            self.assertEqual(other.get('a'), url)
+
+        self.assertEqual(s3_class.return_value.generate_presigned_url.call_count, 1)
+        self.assertEqual(redis.get(presigned_url_cache.REDIS_KEY_PREFIX + 'a'), f"1070.0|{url}".encode())
+
+
+GPS = ExifTags.GPS
+
+
+def _jpeg_with_gps(gps=None, endian="<", size=(64, 48), icc_profile=None):
+    exif = Image.Exif()
+    exif.endian = endian
+    if gps is not None:
+        exif[ExifTags.IFD.GPSInfo] = gps
+    buffer = io.BytesIO()
+    extra = {"icc_profile": icc_profile} if icc_profile else {}
+    Image.new("RGB", size).save(buffer, format="JPEG", exif=exif.tobytes(), **extra)
+    return buffer.getvalue()
+
+
+def _gps(lat_ref="N", lat=(55, 45, 0), lon_ref="E", lon=(37, 36, 36), extra=None):
+    # extra — дополнительные теги GPS: ключи IntEnum, поэтому словарём, а не **kwargs
+    return {
+        GPS.GPSLatitudeRef: lat_ref,
+        GPS.GPSLatitude: tuple(IFDRational(v) for v in lat),
+        GPS.GPSLongitudeRef: lon_ref,
+        GPS.GPSLongitude: tuple(IFDRational(v) for v in lon),
+        **(extra or {}),
+    }
+
+
+class ExifReaderTest(SimpleTestCase):
+    def test_hemispheres_in_both_byte_orders(self):
+        cases = [("N", "E", 55.75, 37.61), ("S", "W", -55.75, -37.61)]
+        for endian in ("<", ">"):  # II и MM
+            for lat_ref, lon_ref, lat, lon in cases:
+                with self.subTest(endian=endian, lat_ref=lat_ref, lon_ref=lon_ref):
+                    exif = read_exif_geo(_jpeg_with_gps(_gps(lat_ref=lat_ref, lon_ref=lon_ref), endian))
+                    self.assertAlmostEqual(exif.lat, lat, places=4)
+                    self.assertAlmostEqual(exif.lon, lon, places=4)
+
+    def test_direction_and_altitude(self):
+        exif = read_exif_geo(_jpeg_with_gps(_gps(extra={
+            GPS.GPSImgDirection: IFDRational(3705, 10),
+            GPS.GPSAltitudeRef: 1,
+            GPS.GPSAltitude: IFDRational(12),
+        })))
+        self.assertAlmostEqual(exif.direction, 10.5)
+        self.assertEqual(exif.altitude, -12)
+
+    @override_settings(EXIF_GPS_MAX_ERROR_M=50, EXIF_GPS_MAX_DOP=5)
+    def test_trust_by_positioning_error_then_dop(self):
+        def trusted(extra=None):
+            return read_exif_geo(_jpeg_with_gps(_gps(extra=extra))).trusted
+
+        self.assertTrue(trusted())
+        self.assertTrue(trusted({GPS.GPSHPositioningError: IFDRational(10)}))
+        self.assertFalse(trusted({GPS.GPSHPositioningError: IFDRational(120)}))
+        # Погрешность важнее DOP
+        self.assertTrue(trusted({GPS.GPSHPositioningError: IFDRational(10), GPS.GPSDOP: IFDRational(9)}))
+        self.assertTrue(trusted({GPS.GPSDOP: IFDRational(3, 2)}))
+        self.assertFalse(trusted({GPS.GPSDOP: IFDRational(9)}))
+
+    def test_zero_coordinates_are_not_trusted(self):
+        exif = read_exif_geo(_jpeg_with_gps(_gps(lat=(0, 0, 0), lon=(0, 0, 0))))
+        self.assertTrue(exif.has_gps)
+        self.assertFalse(exif.trusted)
+
+    def test_missing_or_truncated_exif(self):
+        content = _jpeg_with_gps(_gps())
+        self.assertIsNone(read_exif_geo(_jpeg_with_gps()))
+        self.assertIsNone(read_exif_geo(b"not an image"))
+        self.assertIsNone(read_exif_geo(content[:40]))
+        self.assertIsNone(read_exif_geo(b""))
+
+    def test_large_segments_after_exif_do_not_fit_head(self):
+        # ICC-профиль 70 КБ идёт после APP1: заголовок до SOS не помещается в head, GPS читается
+        content = _jpeg_with_gps(_gps(), icc_profile=b"\x00" * 70000)
+        head = content[:64 * 1024]
+        exif = read_exif_geo(head)
+        self.assertAlmostEqual(exif.lat, 55.75, places=4)
+        self.assertAlmostEqual(exif.lon, 37.61, places=4)
+
+
+class ApplyExifMetadataTest(SimpleTestCase):
+    def _item(self, **values):
+        return {"address": None, "lat": None, "lon": None, "angle": None, "height": None, **values}
+
+    @override_settings(EXIF_TRUSTED_GPS_SKIP_INFERENCE=False)
+    def test_fills_coordinates_and_angle_from_exif(self):
+        head = _jpeg_with_gps(_gps(extra={GPS.GPSImgDirection: IFDRational(90)}))
+        item = apply_exif_metadata(self._item(), head)
+
+        self.assertAlmostEqual(item["lat"], 55.75, places=4)
+        self.assertAlmostEqual(item["lon"], 37.61, places=4)
+        self.assertEqual(item["angle"], 90)
+        self.assertEqual(item["height"], DEFAULT_HEIGHT)
+        self.assertFalse(item["skip_inference"])
+
+    def test_client_values_win_over_exif(self):
+        head = _jpeg_with_gps(_gps(extra={GPS.GPSImgDirection: IFDRational(90)}))
+        item = apply_exif_metadata(self._item(lat=1.0, lon=2.0, angle=45, height=3), head)
+
+        self.assertEqual((item["lat"], item["lon"], item["angle"], item["height"]), (1.0, 2.0, 45, 3))
+        self.assertNotIn("skip_inference", item)
+
+    def test_defaults_without_exif(self):
+        item = apply_exif_metadata(self._item(), None)
+        self.assertEqual((item["angle"], item["height"]), (DEFAULT_ANGLE, DEFAULT_HEIGHT))
+        self.assertIsNone(item["lat"])
+
+    @override_settings(EXIF_TRUSTED_GPS_SKIP_INFERENCE=True, EXIF_GPS_MAX_ERROR_M=50)
+    def test_skip_inference_only_for_trusted_gps(self):
+        trusted = apply_exif_metadata(self._item(), _jpeg_with_gps(_gps()))
+        untrusted = apply_exif_metadata(
+            self._item(), _jpeg_with_gps(_gps(extra={GPS.GPSHPositioningError: IFDRational(500)}))
+        )
+        self.assertTrue(trusted["skip_inference"])
+        self.assertFalse(untrusted["skip_inference"])
+
+
+@override_settings(EXIF_TRUSTED_GPS_SKIP_INFERENCE=True)
+@mock.patch('image_api.services.image_upload_service.S3Service')
+class SkipInferenceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+
+    def test_trusted_exif_location_is_done_without_geoclip(self, _s3):
+        item = apply_exif_metadata({
+            "filename": "a.jpg", "original_filename": "a.jpg", "url": "http://s3.local/a.jpg",
+            "address": None, "lat": None, "lon": None, "angle": None, "height": None,
+        }, _jpeg_with_gps(_gps()))
+
+        service = ImageUploadService(self.user)
+        with self.captureOnCommitCallbacks():
+            images, locations = service.create_records_batch([item])
+        payload = service.geo_tasks_payload(images, locations)
+
+        location = ImageLocation.objects.get(id=locations[0].id)
+        self.assertEqual(location.status, 'done')
+        self.assertTrue(payload[0]["skip_inference"])
+
+        with mock.patch('image_api.tasks._send_geo_request_internal') as send, \
+                mock.patch('image_api.tasks.geocode_locations_task') as geocode, \
+                mock.patch('image_api.tasks.publish_location_updates', return_value=set()), \
+                mock.patch('image_api.tasks.bump_list_versions'):
+            process_geo_tasks(payload)
+
+        send.assert_not_called()
+        # Координаты есть, адреса нет — только обратное геокодирование
+        geocode.delay.assert_called_once_with([location.id], [])
+
+
+class StatusEventsTicketTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch('image_api.services.status_events.get_redis', return_value=_FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _stream_request(self, **params):
+        return RequestFactory().get(reverse('user-image-location-events'), params)
+
+    def test_ticket_authenticates_stream_once(self):
+        response = self.client.post(reverse('user-image-location-events-ticket'))
+        self.assertEqual(response.status_code, 200)
+        ticket = response.data['ticket']
+
+        self.assertEqual(_authenticate_stream(self._stream_request(ticket=ticket)), self.user)
+        self.assertIsNone(_authenticate_stream(self._stream_request(ticket=ticket)))
+
+    def test_ticket_requires_authentication(self):
+        response = APIClient().post(reverse('user-image-location-events-ticket'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_access_token_in_query_string_is_rejected(self):
+        token = str(AccessToken.for_user(self.user))
+        self.assertIsNone(_authenticate_stream(self._stream_request(token=token)))
+        self.assertIsNone(_authenticate_stream(self._stream_request(ticket=token)))
+
+    def test_forged_ticket_is_rejected(self):
+        self.assertIsNone(_authenticate_stream(self._stream_request(ticket='not-a-ticket')))
+
+
+def _rotated_jpeg():
+    # 40x20: левая половина красная, правая синяя; Orientation=6 — при показе поворот на 90° по часовой
+    image = Image.new("RGB", (40, 20), "blue")
+    image.paste((255, 0, 0), (0, 0, 20, 20))
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@mock.patch('image_api.services.rendition_service.S3Service')
+class RenditionServiceTest(SimpleTestCase):
+    def _large_jpeg(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), "green").save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    def test_sizes_by_long_side_without_upscaling(self, _s3_class):
+        rendered = RenditionService(sizes=[256, 1024, 4096], image_format="WEBP").render(self._large_jpeg())
+
+        sizes = {size: Image.open(io.BytesIO(data)) for size, data in rendered.items()}
+        self.assertEqual({size: image.size for size, image in sizes.items()},
+                         {4096: (2000, 1000), 1024: (1024, 512), 256: (256, 128)})
+        self.assertEqual({image.format for image in sizes.values()}, {"WEBP"})
+
+    def test_exif_orientation_is_applied(self, _s3_class):
+        rendered = RenditionService(sizes=[32], image_format="JPEG").render(_rotated_jpeg())
+        # 40x20 с Orientation=6 показывается как 20x40
+        self.assertEqual(Image.open(io.BytesIO(rendered[32])).size, (16, 32))
+
+    def test_renditions_are_uploaded_under_derived_keys(self, s3_class):
+        s3 = s3_class.return_value
+        s3.upload_file.return_value = True
+
+        keys = RenditionService(sizes=[256, 1024], image_format="WEBP").create_renditions(
+            "abc.jpg", content=self._large_jpeg()
+        )
+
+        self.assertEqual(keys, {"1024": "renditions/abc_1024.webp", "256": "renditions/abc_256.webp"})
+        self.assertEqual({c.args[2] for c in s3.upload_file.call_args_list}, {"image/webp"})
+        s3.download_file.assert_not_called()
+
+    @override_settings(PREVIEW_RENDITION_SIZE=256)
+    def test_preview_key_falls_back_to_original(self, _s3_class):
+        image = UploadedImage(filename="abc.jpg")
+        self.assertEqual(image.preview_key, "abc.jpg")
+        image.renditions = {"256": "renditions/abc_256.webp"}
+        self.assertEqual(image.preview_key, "renditions/abc_256.webp")
+
+
+@override_settings(INFERENCE_IMAGE_SIZE=(224, 224), INFERENCE_COPY_FORMAT="PNG")
+class RenderInferenceCopyTest(SimpleTestCase):
+    def _render(self, **kwargs):
+        return Image.open(io.BytesIO(render_inference_copy(_rotated_jpeg(), **kwargs)))
+
+    def test_output_is_model_sized_png(self):
+        copy = self._render()
+        self.assertEqual(copy.format, "PNG")
+        self.assertEqual(copy.size, (224, 224))
+        self.assertEqual(copy.mode, "RGB")
+
+    def test_exif_orientation_is_applied(self):
+        copy = self._render()
+        # После поворота красная половина сверху, синяя снизу
+        red, blue = copy.getpixel((112, 20)), copy.getpixel((112, 204))
+        self.assertGreater(red[0], 200)
+        self.assertLess(red[2], 60)
+        self.assertGreater(blue[2], 200)
+        self.assertLess(blue[0], 60)
+
+    def test_jpeg_format_and_custom_size(self):
+        copy = self._render(size=(64, 32), image_format="JPEG")
+        self.assertEqual(copy.format, "JPEG")
+        self.assertEqual(copy.size, (64, 32))
+
+    def test_key_follows_size_and_format(self):
+        self.assertEqual(inference_key("abc_photo.jpg"), "inference/abc_photo_224x224.png")
+        self.assertEqual(
+            inference_key("abc_photo.jpg", size=(64, 32), image_format="JPEG"), "inference/abc_photo_64x32.jpg"
+        )
+
+
+@override_settings(INFERENCE_COPY_ENABLED=True, INFERENCE_IMAGE_SIZE=(224, 224), INFERENCE_COPY_FORMAT="PNG")
+class InferenceCopyFallbackTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        UploadedImage.objects.create(filename="ready.jpg", user=self.user, inference_key=inference_key("ready.jpg"))
+        UploadedImage.objects.create(filename="pending.jpg", user=self.user)
+        # Копия старого формата не подходит
+        UploadedImage.objects.create(
+            filename="stale.jpg", user=self.user, inference_key=inference_key("stale.jpg", image_format="JPEG")
+        )
+
+    def _task(self, task_id, filename):
+        return {"task_id": task_id, "image_filename": filename, "angle": 0, "height": 1.5, "lat": None, "lon": None}
+
+    def test_attach_uses_ready_copies_only(self):
+        attached = InferenceCopyService.attach([
+            self._task(1, "ready.jpg"), self._task(2, "pending.jpg"), self._task(3, "stale.jpg"),
+        ])
+        self.assertEqual(
+            [task["inference_filename"] for task in attached],
+            [inference_key("ready.jpg"), None, None],
+        )
+
+    @mock.patch('image_api.utils._send_geo_chunk', return_value=([], []))
+    def test_geoclip_gets_copy_or_falls_back_to_original(self, send_chunk):
+        _send_geo_request_internal(InferenceCopyService.attach([
+            self._task(1, "ready.jpg"), self._task(2, "pending.jpg"),
+        ]))
+
+        tasks = send_chunk.call_args.args[2]
+        self.assertEqual([task["fileName"] for task in tasks], [inference_key("ready.jpg"), "pending.jpg"])
+
+
+@override_settings(LIST_CACHE_ENABLED=True, LIST_CACHE_TTL=240, PRESIGNED_URL_REFRESH_MARGIN=600)
+@mock.patch('image_api.views.get_presigned_url_cache', return_value=_FakePresignedUrlCache())
+class GetUserImageLocationsResponseCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.redis = _FakeRedis()
+        patcher = mock.patch('image_api.services.list_response_cache.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for i in range(3):
+            self._create_location(f"{i}.jpg")
+
+    def _create_location(self, filename, user=None):
+        user = user or self.user
+        image = UploadedImage.objects.create(filename=filename, user=user)
+        return ImageLocation.objects.create(user=user, image=image, status='processing')
+
+    def _get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('user-image-locations'), {'page_size': 10}, **headers)
+
+    def _ids(self, response):
+        return [item['id'] for item in json.loads(response.content)['data']]
+
+    def test_matching_if_none_match_returns_304_without_queries(self, _cache):
+        first = self._get()
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            response = self._get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_cached_body_is_served_without_queries(self, _cache):
+        first = self._get()
+
+        with self.assertNumQueries(0):
+            second = self._get('"stale"')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self._ids(second), self._ids(first))
+
+    def test_upload_invalidates(self, _cache):
+        etag = self._get()['ETag']
+
+        with mock.patch('image_api.services.image_upload_service.S3Service'), \
+                self.captureOnCommitCallbacks(execute=True):
+            _, locations = ImageUploadService(self.user).create_records_batch([{
+                "filename": "new.jpg", "original_filename": "new.jpg", "url": "http://s3.local/new.jpg",
+                "address": None, "lat": None, "lon": None, "angle": 0, "height": 1.5,
+            }])
+
+        response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(locations[0].id, self._ids(response))
+
+    def test_delete_invalidates(self, _cache):
+        location = ImageLocation.objects.filter(user=self.user).first()
+        etag = self._get()['ETag']
+
+        self.assertEqual(self.client.delete(reverse('delete-image-location', args=[location.id])).status_code, 200)
+
+        response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(location.id, self._ids(response))
+
+    def test_status_change_invalidates(self, _cache):
+        location = ImageLocation.objects.filter(user=self.user).first()
+        etag = self._get()['ETag']
+
+        ImageLocation.objects.filter(id=location.id).update(status='done')
+        bump_list_versions([self.user.id])
+
+        response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        statuses = {item['id']: item['status'] for item in json.loads(response.content)['data']}
+        self.assertEqual(statuses[location.id], 'done')
+
+    def test_other_users_changes_keep_cache(self, _cache):
+        other = User.objects.create_user(username='other', password='pass')
+        etag = self._get()['ETag']
+
+        self._create_location("other.jpg", user=other)
+        bump_list_versions([other.id])
+
+        self.assertEqual(self._get(etag).status_code, 304)
+
+    def test_query_params_have_separate_etags(self, _cache):
+        etag = self._get()['ETag']
+        response = self.client.get(reverse('user-image-locations'), {'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(PREDICTION_CACHE_ENABLED=False, INFERENCE_COPY_ENABLED=False,
+                   GEOCLIP_DISPATCH_RETRIES=2, GEOCLIP_DISPATCH_RETRY_DELAY=10)
+@mock.patch('image_api.tasks.bump_list_versions')
+@mock.patch('image_api.tasks.publish_location_updates', return_value=set())
+@mock.patch('image_api.tasks.geocode_locations_task')
+class ProcessGeoTasksDispatchErrorsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.timed_out = self._location("a.jpg")
+        self.rejected = self._location("b.jpg")
+        self.payload = [
+            {"task_id": loc.id, "image_filename": loc.image.filename, "address": None,
+             "angle": 0, "height": 1.5, "lat": None, "lon": None, "skip_inference": False}
+            for loc in (self.timed_out, self.rejected)
+        ]
+
+    def _location(self, filename):
+        image = UploadedImage.objects.create(filename=filename, user=self.user)
+        return ImageLocation.objects.create(user=self.user, image=image, status='processing')
+
+    def _dispatch(self, attempt=0):
+        result = {'success': [], 'errors': [
+            {'task_id': str(self.timed_out.id), 'error': 'Geo service request failed: timeout', 'retryable': True},
+            {'task_id': str(self.rejected.id), 'error': 'Invalid angle', 'retryable': False},
+        ]}
+        with mock.patch('image_api.tasks._send_geo_request_internal', return_value=result), \
+                mock.patch.object(process_geo_tasks, 'apply_async') as apply_async:
+            process_geo_tasks(self.payload, attempt=attempt)
+        return apply_async
+
+    def _status(self, location):
+        location.refresh_from_db()
+        return location.status
+
+    def test_timeout_is_retried_and_rejection_fails(self, *_mocks):
+        apply_async = self._dispatch()
+
+        self.assertEqual(self._status(self.timed_out), 'processing')
+        self.assertEqual(self._status(self.rejected), 'failed')
+        self.assertEqual(self.rejected.error_reason, 'Invalid angle')
+        args, kwargs = apply_async.call_args
+        self.assertEqual([img['task_id'] for img in args[0][0]], [self.timed_out.id])
+        self.assertEqual(args[1], {'attempt': 1})
+        self.assertEqual(kwargs['countdown'], 10)
+
+    def test_exhausted_retries_fail(self, *_mocks):
+        apply_async = self._dispatch(attempt=2)
+
+        apply_async.assert_not_called()
+        self.assertEqual(self._status(self.timed_out), 'failed')
+
+    def test_retry_skips_locations_completed_meanwhile(self, geocode, *_mocks):
+        ImageLocation.objects.filter(id=self.timed_out.id).update(status='done')
+
+        with mock.patch('image_api.tasks._send_geo_request_internal',
+                        return_value={'success': [], 'errors': []}) as send:
+            process_geo_tasks(self.payload, attempt=1)
+
+        self.assertEqual([img['task_id'] for img in send.call_args.args[0]], [self.rejected.id])
+        geocode.delay.assert_not_called()
+
+
+@override_settings(PREDICTION_CACHE_ENABLED=True, GEOCLIP_MODEL_VERSION='v1')
+@mock.patch('image_api.tasks.bump_list_versions')
+@mock.patch('image_api.tasks.publish_location_updates', return_value=set())
+@mock.patch('image_api.tasks._send_geo_request_internal')
+@mock.patch('image_api.tasks.geocode_locations_task')
+class PredictionCacheHitGeocodingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+
+    def _cached(self, content_hash, address=None, **location):
+        PredictionCacheEntry.objects.create(content_hash=content_hash, angle=0, height=1.5, model_version='v1',
+                                            lat=55.75, lon=37.61, address=address)
+        image = UploadedImage.objects.create(filename=f"{content_hash}.jpg", user=self.user, content_hash=content_hash)
+        loc = ImageLocation.objects.create(user=self.user, image=image, status='processing', angle=0, height=1.5,
+                                           **location)
+        return {"task_id": loc.id, "image_filename": image.filename, "address": location.get('address'),
+                "angle": 0, "height": 1.5, "lat": location.get('lat'), "lon": location.get('lon'),
+                "skip_inference": False}
+
+    def test_hits_without_address_are_geocoded_after_commit(self, geocode, send, *_mocks):
+        bare = self._cached('a' * 64)
+        with_address = self._cached('b' * 64, address='Moscow')
+        user_coords = self._cached('c' * 64, lat=10.0, lon=20.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_geo_tasks([bare, with_address, user_coords])
+
+        send.assert_not_called()
+        self.assertEqual(ImageLocation.objects.get(id=bare['task_id']).status, 'done')
+        # Координаты пользователя уже отправлены первой задачей, повторно не отправляются
+        self.assertEqual([c.args for c in geocode.delay.call_args_list],
+                         [([user_coords['task_id']], []), ([bare['task_id']],)])
+
+
+@override_settings(OFFLINE_GEOCODER_SNAP=False, PREDICTION_CACHE_ENABLED=False)
+@mock.patch('image_api.services.callback_service.bump_list_versions')
+@mock.patch('image_api.services.callback_service.publish_status_deltas')
+@mock.patch('image_api.tasks.geocode_locations_task')
+class PredictionCallbackTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+
+    def _location(self, status='processing', **fields):
+        image = UploadedImage.objects.create(filename="a.jpg", user=self.user)
+        return ImageLocation.objects.create(user=self.user, image=image, status=status, **fields)
+
+    def _succeeded(self, location, lat=55.75, lon=37.61):
+        return {"TaskId": str(location.id), "Status": "Succeeded", "Result": {"Latitude": lat, "Longitude": lon}}
+
+    def _post(self, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('image-location-callback'), body, content_type='application/json')
+
+    def test_success_fills_empty_fields_only(self, geocode, *_mocks):
+        location = self._location(lat=10.0, lon=20.0, address='Moscow')
+
+        response = self._post(self._succeeded(location))
+
+        self.assertEqual(response.status_code, 200)
+        location.refresh_from_db()
+        # COALESCE: координаты и адрес пользователя не затираются предсказанием
+        self.assertEqual((location.status, location.lat, location.lon, location.address),
+                         ('done', 10.0, 20.0, 'Moscow'))
+        geocode.delay.assert_not_called()
+
+    def test_done_rows_are_untouched_and_repeat_returns_200(self, *_mocks):
+        location = self._location()
+        self.assertEqual(self._post(self._succeeded(location)).status_code, 200)
+
+        response = self._post(self._succeeded(location, lat=1.0, lon=2.0))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['new_status'], 'done')
+        location.refresh_from_db()
+        self.assertEqual((location.lat, location.lon), (55.75, 37.61))
+
+    def test_failed_sets_error_reason(self, *_mocks):
+        by_message, by_code = self._location(), self._location()
+
+        PredictionCallbackService().apply([
+            {"TaskId": by_message.id, "Status": "Failed", "ErrorCode": "E1", "ErrorMessage": "Broken image"},
+            {"TaskId": by_code.id, "Status": "Failed", "ErrorCode": "E2"},
+        ])
+
+        by_message.refresh_from_db()
+        by_code.refresh_from_db()
+        self.assertEqual((by_message.status, by_message.error_reason), ('failed', 'Broken image'))
+        self.assertEqual((by_code.status, by_code.error_reason), ('failed', 'E2'))
+
+    def test_geocoding_is_queued_only_without_address(self, geocode, *_mocks):
+        bare, with_address = self._location(), self._location(address='Moscow')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PredictionCallbackService().apply([self._succeeded(bare), self._succeeded(with_address)])
+
+        geocode.delay.assert_called_once_with([bare.id])
+
+    def test_unknown_status_is_rejected(self, *_mocks):
+        location = self._location()
+
+        response = self._post({"TaskId": str(location.id), "Status": "Running"})
+
+        self.assertEqual(response.status_code, 400)
+        location.refresh_from_db()
+        self.assertEqual(location.status, 'processing')
+
+    def test_unknown_task_is_not_found(self, *_mocks):
+        response = self._post({"TaskId": "999999", "Status": "Succeeded", "Result": {}})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(OFFLINE_GEOCODER_SNAP=False, PREDICTION_CACHE_ENABLED=False)
+@mock.patch('image_api.services.callback_service.bump_list_versions')
+@mock.patch('image_api.services.callback_service.publish_status_deltas')
+@mock.patch('image_api.tasks.geocode_locations_task')
+class BatchCallbackApiTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='owner', password='pass')
+        image = UploadedImage.objects.create(filename="a.jpg", user=user)
+        self.succeeded, self.failed = (
+            ImageLocation.objects.create(user=user, image=image, status='processing') for _ in range(2)
+        )
+        self.results = [
+            {"TaskId": str(self.succeeded.id), "Status": "Succeeded", "Result": {"Latitude": 55.75, "Longitude": 37.61}},
+            {"TaskId": str(self.failed.id), "Status": "Failed", "ErrorMessage": "Broken image"},
+        ]
+
+    def _post(self, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('image-location-batch-callback'), body, content_type='application/json')
+
+    def test_array_body_with_mixed_results(self, *_mocks):
+        response = self._post(self.results)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted((item['task_id'], item['new_status']) for item in response.json()['updated']),
+            [(self.succeeded.id, 'done'), (self.failed.id, 'failed')],
+        )
+        self.succeeded.refresh_from_db()
+        self.failed.refresh_from_db()
+        self.assertEqual((self.succeeded.lat, self.succeeded.lon), (55.75, 37.61))
+        self.assertEqual(self.failed.error_reason, 'Broken image')
+
+    def test_results_object_body_and_unknown_ids(self, *_mocks):
+        response = self._post({"results": [self.results[0], {"TaskId": "999999", "Status": "Succeeded"}]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], [{"task_id": self.succeeded.id, "new_status": "done"}])
+        self.assertEqual(response.json()['not_found'], [999999])
+
+    def test_body_without_list_is_rejected(self, *_mocks):
+        self.assertEqual(self._post({"TaskId": "1"}).status_code, 400)
+
+
+@override_settings(GEOCODE_CACHE_TTL=3600, GEOCODE_CACHE_REDIS_TTL=600)
+@mock.patch('image_api.services.geocoding_service.get_offline_geocoder', return_value=None)
+class GeocodingCacheTierTest(TestCase):
+    def setUp(self):
+        self.redis = _FakeRedis()
+        patcher = mock.patch('image_api.services.geocoding_service.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _service(self):
+        service = GeocodingService()
+        service.geolocator = mock.Mock()
+        service.geolocator.geocode.return_value = mock.Mock(address="Москва", latitude=55.75, longitude=37.61)
+        return service
+
+    def test_memo_then_redis_then_db_then_nominatim(self, _offline):
+        first = self._service()
+        self.assertEqual(first.geocode("  Москва "), (55.75, 37.61))
+        self.assertEqual(first.geocode("москва"), (55.75, 37.61))  # тот же нормализованный ключ — из памяти
+        first.geolocator.geocode.assert_called_once()
+        self.assertEqual(GeocodeCacheEntry.objects.count(), 1)
+
+        # Другой экземпляр: Redis, без запроса к БД
+        second = self._service()
+        with self.assertNumQueries(0):
+            self.assertEqual(second.geocode("Москва"), (55.75, 37.61))
+
+        # Redis пуст — строка БД, и Redis заполняется снова
+        self.redis.data.clear()
+        third = self._service()
+        self.assertEqual(third.geocode("Москва"), (55.75, 37.61))
+        self.assertTrue(self.redis.data)
+        second.geolocator.geocode.assert_not_called()
+        third.geolocator.geocode.assert_not_called()
+
+    def test_network_error_is_not_cached(self, _offline):
+        service = self._service()
+        service.geolocator.geocode.side_effect = TimeoutError("timeout")
+
+        self.assertIsNone(service.geocode("Москва"))
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+        self.assertFalse(self.redis.data)
+
+
+@mock.patch('image_api.services.geocoding_service.time.sleep')
+class GeocodingRateLimitTest(SimpleTestCase):
+    def test_waits_for_lock_held_by_another_worker(self, sleep):
+        redis = mock.Mock()
+        redis.set.side_effect = [None, None, True]  # два раза ключ занят другим воркером
+        redis.pttl.return_value = 400
+
+        with mock.patch('image_api.services.geocoding_service.get_redis', return_value=redis):
+            GeocodingService(min_interval=1)._wait_rate_limit()
+
+        redis.set.assert_called_with("geocode:ratelimit", 1, nx=True, px=1000)
+        self.assertEqual(sleep.call_args_list, [mock.call(0.4), mock.call(0.4)])
+
+    def test_local_throttle_without_redis(self, sleep):
+        service = GeocodingService(min_interval=1)
+        with mock.patch('image_api.services.geocoding_service.get_redis', side_effect=ConnectionError), \
+                mock.patch('image_api.services.geocoding_service.time.monotonic', side_effect=[100.0, 100.25, 101.0]):
+            service._wait_rate_limit()
+            service._wait_rate_limit()
+
+        sleep.assert_called_once_with(0.75)
+
+
+OSM_EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="55.7500" lon="37.6100">
+    <tag k="addr:street" v="Тверская"/><tag k="addr:housenumber" v="1"/><tag k="addr:city" v="Москва"/>
+  </node>
+  <node id="2" lat="55.7600" lon="37.6200"/>
+  <node id="3" lat="55.7602" lon="37.6202"/>
+  <node id="4" lat="55.8000" lon="37.7000"/>
+  <way id="10">
+    <nd ref="2"/><nd ref="3"/>
+    <tag k="building" v="yes"/><tag k="addr:street" v="Арбат"/><tag k="addr:housenumber" v="5"/>
+  </way>
+  <way id="11"><nd ref="4"/><tag k="highway" v="residential"/></way>
+</osm>
+"""
+
+
+@mock.patch('image_api.services.geocoding_service.get_redis', return_value=_FakeRedis())
+class OfflineGeocoderTest(TestCase):
+    def setUp(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        osm_path = os.path.join(index_dir, "region.osm.bz2")
+        with bz2.open(osm_path, "wt", encoding="utf-8") as f:
+            f.write(OSM_EXTRACT)
+        self.count = build_index(osm_path, os.path.join(index_dir, "index"))
+        self.geocoder = OfflineReverseGeocoder(os.path.join(index_dir, "index"))
+
+    def test_build_index_and_reverse(self, _redis):
+        self.assertEqual(self.count, 2)  # адресная точка и центроид здания; улица без адреса пропущена
+
+        point = self.geocoder.reverse((55.75001, 37.61001), max_distance_m=50)
+        building = self.geocoder.reverse((55.7601, 37.6201), max_distance_m=50)
+
+        self.assertEqual(point.address, "Тверская, 1, Москва")
+        self.assertEqual(building.address, "Арбат, 5")
+        self.assertAlmostEqual(building.lat, 55.7601, places=4)  # центроид узлов здания
+        self.assertIsNone(self.geocoder.reverse((55.8, 37.7), max_distance_m=50))
+
+    def test_offline_index_is_tried_before_nominatim(self, _redis):
+        with mock.patch('image_api.services.geocoding_service.get_offline_geocoder', return_value=self.geocoder):
+            service = GeocodingService()
+            service.geolocator = mock.Mock()
+            service.geolocator.reverse.return_value = mock.Mock(address="Nominatim", latitude=55.8, longitude=37.7)
+
+            self.assertEqual(service.reverse(55.7601, 37.6201), "Арбат, 5")
+            service.geolocator.reverse.assert_not_called()
+            # Вне индекса — цепочка кэшей и Nominatim
+            self.assertEqual(service.reverse(55.8, 37.7), "Nominatim")
+            service.geolocator.reverse.assert_called_once()
+
+
+class _RangedS3Client:
+    """
+    Объект S3 в памяти: отвечает на ranged GET и запоминает запрошенные диапазоны.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.content)}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(v) for v in Range.removeprefix("bytes=").split("-"))
+        self.ranges.append((start, end))
+        return {'Body': io.BytesIO(self.content[start:end + 1])}
+
+
+def _zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name, content in entries:
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+class ArchiveRangedReadTest(TestCase):
+    def test_range_reader_fetches_only_central_directory_and_entry(self):
+        archive = _zip([("big.jpg", os.urandom(512 * 1024)), ("small.jpg", b"small")])
+        client = _RangedS3Client(archive)
+
+        stream = io.BufferedReader(S3RangeReader(client, "bucket", "a.zip"), buffer_size=8 * 1024)
+        with zipfile.ZipFile(stream) as zf:
+            self.assertEqual(zf.namelist(), ["big.jpg", "small.jpg"])
+            self.assertEqual(zf.read("small.jpg"), b"small")
+
+        fetched = sum(end - start + 1 for start, end in client.ranges)
+        self.assertLess(fetched, len(archive) // 10)
+
+    @mock.patch('image_api.tasks.start_image_processing')
+    @mock.patch('image_api.tasks.S3Service')
+    def test_chunk_processes_only_its_entries(self, s3_class, _start):
+        user = User.objects.create_user(username='owner', password='pass')
+        content = _zip([(f"{i}.jpg", f"image {i}".encode()) for i in range(5)] + [("notes.txt", b"skip")])
+        s3 = s3_class.return_value
+        s3.open_ranged.side_effect = lambda filename: io.BytesIO(content)
+        s3.upload_fileobj.return_value = True
+        s3.generate_file_url.side_effect = lambda key: f"http://s3.local/{key}"
+        archive = UploadedArchive.objects.create(filename="a.zip", original_filename="a.zip", user=user,
+                                                 s3_url="http://s3.local/a.zip", status='processing',
+                                                 total_entries=5, chunk_size=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_archive_chunk_task(archive.id, 1)
+
+        self.assertTrue(result["ok"])
+        self.assertEqual(
+            sorted(ImageLocation.objects.values_list('image__original_filename', flat=True)), ["2.jpg", "3.jpg"]
+        )
+        self.assertEqual(s3.upload_fileobj.call_count, 2)
+        archive.refresh_from_db()
+        self.assertEqual(archive.completed_chunks, [1])
+
+
+class _UnreadableUpload(io.BytesIO):
+    """
+    Загруженный архив, который нельзя прочитать целиком — только частями.
+    """
+    name = "photos.zip"
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            raise AssertionError("archive must be streamed, not read whole")
+        return super().read(size)
+
+
+@mock.patch('image_api.services.archive_upload_service.process_archive_task')
+@mock.patch('image_api.services.archive_upload_service.S3Service')
+class ArchiveUploadServiceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+
+    def test_archive_is_streamed_to_s3(self, s3_class, task):
+        s3 = s3_class.return_value
+        s3.upload_fileobj.return_value = True
+        s3.generate_file_url.side_effect = lambda key: f"http://s3.local/{key}"
+        upload = _UnreadableUpload(b"zip" * 1000)
+        upload.seek(100)
+
+        archive = ArchiveUploadService(self.user).upload_archive(upload)
+
+        filename, fileobj = s3.upload_fileobj.call_args.args
+        self.assertIs(fileobj, upload)
+        self.assertEqual(upload.tell(), 0)  # с начала файла
+        self.assertTrue(filename.startswith("archives/") and filename.endswith("_photos.zip"))
+        self.assertEqual((archive.filename, archive.user), (filename, self.user))
+        task.delay.assert_called_once_with(archive.id)
+
+    def test_failed_upload_creates_no_archive(self, s3_class, task):
+        s3_class.return_value.upload_fileobj.return_value = False
+
+        with self.assertRaises(Exception):
+            ArchiveUploadService(self.user).upload_archive(_UnreadableUpload(b"zip"))
+
+        self.assertFalse(UploadedArchive.objects.exists())
+        task.delay.assert_not_called()
+
+
+class ResumeArchivesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+
+    def _archive(self, status, age_minutes=0, idle_minutes=None, **fields):
+        archive = UploadedArchive.objects.create(
+            filename=f"{status}.zip", original_filename=f"{status}.zip", s3_url="http://s3.local/a.zip",
+            user=self.user, status=status, **fields,
+        )
+        now = timezone.now()
+        UploadedArchive.objects.filter(id=archive.id).update(
+            created_at=now - timedelta(minutes=age_minutes),
+            updated_at=now - timedelta(minutes=age_minutes if idle_minutes is None else idle_minutes),
+        )
+        return archive
+
+    @mock.patch('image_api.management.commands.resume_archives.process_archive_task')
+    def test_resumes_failed_and_stalled_archives(self, task):
+        failed = self._archive('failed', total_entries=5, chunk_size=2, completed_chunks=[0])
+        stalled = self._archive('processing', age_minutes=120)
+        self._archive('processing', age_minutes=5)
+        # Большой архив обрабатывается давно, но чанки завершаются — не зависший
+        self._archive('processing', age_minutes=180, idle_minutes=2, total_entries=5000, chunk_size=100)
+
+        call_command('resume_archives', stdout=io.StringIO())
+
+        self.assertEqual(sorted(c.args[0] for c in task.delay.call_args_list), [failed.id, stalled.id])
+
+    @mock.patch('image_api.management.commands.resume_archives.process_archive_task')
+    def test_dry_run_does_not_dispatch(self, task):
+        self._archive('failed')
+        call_command('resume_archives', '--dry-run', stdout=io.StringIO())
+        task.delay.assert_not_called()
+
+    @mock.patch('image_api.tasks.chord')
+    @mock.patch('image_api.tasks.S3Service')
+    def test_process_archive_dispatches_only_missing_chunks(self, s3_class, chord):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            for i in range(5):
+                zf.writestr(f"{i}.jpg", b"jpeg")
+        s3_class.return_value.open_ranged.side_effect = lambda filename: io.BytesIO(buffer.getvalue())
+        archive = self._archive('failed', chunk_size=2, completed_chunks=[0, 2])
+
+        process_archive_task(archive.id)
+
+        chunks = [signature.args[1] for signature in chord.call_args.args[0]]
+        self.assertEqual(chunks, [1])
+        archive.refresh_from_db()
+        self.assertEqual((archive.status, archive.total_entries), ('processing', 5))
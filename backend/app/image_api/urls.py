@@ -1,14 +1,28 @@
 from django.urls import path
 
 from . import views
-from .callbacks import image_location_callback
-from .views import UploadImageView, GetUserImageLocationsView, DeleteUserImageLocationView, UploadArchiveView
+from .callbacks import image_location_callback, image_location_batch_callback
+from .events import image_location_events, image_location_events_ticket
+from .views import (
+    UploadImageView,
+    GetUserImageLocationsView,
+    DeleteUserImageLocationView,
+    UploadArchiveView,
+    PresignUploadView,
+    CommitUploadView,
+)
 
 urlpatterns = [
     path('upload-archive/', UploadArchiveView.as_view(), name='upload_archive'),
     path('upload-images/', UploadImageView.as_view(), name='upload_images'),
+    path('uploads/presign/', PresignUploadView.as_view(), name='uploads_presign'),
+    path('uploads/commit/', CommitUploadView.as_view(), name='uploads_commit'),
     path('user/image-locations/', GetUserImageLocationsView.as_view(), name='user-image-locations'),
+    path('user/image-locations/events/', image_location_events, name='user-image-location-events'),
+    path('user/image-locations/events/ticket/', image_location_events_ticket,
+         name='user-image-location-events-ticket'),
     path('update-image-result/', image_location_callback, name='image-location-callback'),
+    path('update-image-results/', image_location_batch_callback, name='image-location-batch-callback'),
     path("image-locations/<int:pk>/", DeleteUserImageLocationView.as_view(), name="delete-image-location"),
 ]
 
@@ -1,23 +1,115 @@
-import requests
+import os
+import time
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
 
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+# Пул HTTP-соединений к GeoClip — один requests.Session на процесс (после fork — новый)
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def _get_geo_session():
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.GEOCLIP_DISPATCH_MAX_WORKERS,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "Accept": "*/*"
+                })
+                _session, _session_pid = session, pid
+    return _session
+
+
+def _send_geo_chunk(url, callback_url, tasks, chunk_index):
+    """
+    Отправляет один чанк задач. Возвращает (jobs, errors); при сбое запроса
+    все задачи чанка попадают в errors.
+    retryable в ошибке: False — сервис явно отклонил задачу (validationErrors, 4xx),
+    True — исход неизвестен (таймаут, обрыв, 5xx, нечитаемый ответ): задачи могли быть приняты.
+    """
+    payload = {
+        "callbackUrl": callback_url,
+        "tasks": tasks
+    }
+    started = time.perf_counter()
+    try:
+        logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
+        response = _get_geo_session().post(
+            url, data=json.dumps(payload), timeout=settings.GEOCLIP_DISPATCH_TIMEOUT
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            f"Geo chunk {chunk_index}: {len(tasks)} tasks, "
+            f"status {response.status_code}, {elapsed_ms:.0f} ms"
+        )
+
+        # 422 — сервис не поставил ни одной задачи, причины в validationErrors
+        if response.status_code in (202, 422):
+            try:
+                result = response.json()
+            except ValueError:
+                logger.error(f"Geo service returned invalid JSON for chunk {chunk_index}")
+                return [], [
+                    {'task_id': t['taskId'], 'error': 'Invalid response from geo service', 'retryable': True}
+                    for t in tasks
+                ]
+
+            # GeoClipService отдаёт camelCase, но поддержим и PascalCase
+            jobs = result.get("jobs") or result.get("Jobs") or []
+            validation_errors = result.get("validationErrors") or result.get("ValidationErrors") or []
+            return jobs, [
+                {
+                    'task_id': error.get('taskId') or error.get('TaskId'),
+                    'error': error.get('error') or error.get('Error'),
+                    'retryable': False,
+                }
+                for error in validation_errors
+            ]
+
+        logger.error(f"Geo service returned non-202 status: {response.status_code}, body: {response.text}")
+        error = f"Geo service returned {response.status_code}"
+        retryable = response.status_code >= 500 or response.status_code in (408, 429)
+    except Exception as e:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.error(f"Exception while calling geo service (chunk {chunk_index}, {elapsed_ms:.0f} ms): {e}", exc_info=True)
+        error = f"Geo service request failed: {e}"
+        retryable = True
+
+    return [], [{'task_id': t['taskId'], 'error': error, 'retryable': retryable} for t in tasks]
+
+
 def _send_geo_request_internal(images):
     """
-        Отправляет POST-запрос на внешний сервис для обработки списка изображений.
+        Отправляет задачи на внешний сервис чанками по GEOCLIP_DISPATCH_CHUNK_SIZE,
+        не более GEOCLIP_DISPATCH_MAX_WORKERS запросов одновременно, через общий пул соединений.
 
         Args:
-            images (list): Список словарей с ключами 'image_id' и 'image_path'.
+            images (list): Список словарей с ключами 'task_id', 'image_filename', 'angle', 'height', 'lat', 'lon'
+                и необязательным 'inference_filename' — копией под вход модели (отправляется вместо оригинала).
 
         Returns:
             dict: {
-                'success': list of task_ids successfully queued,
-                'errors': list of dicts with {'task_id', 'error'},
-                'raw_response': original response dict (optional)
+                'success': list of job ids successfully queued,
+                'errors': list of dicts with {'task_id', 'error', 'retryable'},
             }
     """
     callback_url = f"{settings.API_BASE_URL}:8000/api/update-image-result/"
@@ -25,82 +117,34 @@ def _send_geo_request_internal(images):
 
     tasks = []
     for img in images:
-        task_id = img['task_id']
-        image_filename = img['image_filename']
-        angle = img['angle']
-        height = img['height']
-        lat = img['lat']
-        lon = img['lon']
         tasks.append({
-            "fileName": image_filename,
-            "taskId": str(task_id),
-            "angle": angle,
-            "height": height,
-            "lat": lat,
-            "lon": lon,
+            "fileName": img.get('inference_filename') or img['image_filename'],
+            "taskId": str(img['task_id']),
+            "angle": img['angle'],
+            "height": img['height'],
+            "lat": img['lat'],
+            "lon": img['lon'],
         })
 
-    payload = {
-        "callbackUrl": callback_url,
-        "tasks": tasks
-    }
+    chunk_size = settings.GEOCLIP_DISPATCH_CHUNK_SIZE
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    logger.info(f"Sending geo request for {len(tasks)} images in {len(chunks)} chunks")
 
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "*/*"
+    structured_result = {
+        'success': [],
+        'errors': [],
     }
-
-    try:
-        logger.info(f"Sending geo request for {len(tasks)} images")
-        logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
-
-        response = requests.post(url, data=json.dumps(payload), headers=headers, timeout=30)
-
-        logger.info(f"Geo service response status: {response.status_code}")
-
-        if response.status_code == 202:
-            try:
-                result = response.json()
-                logger.info(f"Geo service returned: {result}")
-
-                # Извлекаем успешные job и ошибки
-                jobs = result.get("jobs", [])
-                validation_errors = result.get("validationErrors", [])
-
-                # Формируем структурированный ответ
-                structured_result = {
-                    'success': [job for job in jobs],  # можно преобразовать в int, если нужно
-                    'errors': [
-                        {
-                            'task_id': error.get('taskId'),
-                            'error': error.get('error')
-                        }
-                        for error in validation_errors
-                    ],
-                    'raw_response': result  # опционально, для отладки
-                }
-
-                return structured_result
-
-            except ValueError:
-                logger.error("Geo service returned invalid JSON")
-                return {
-                    'success': [],
-                    'errors': [],
-                    'raw_response': None
-                }
-        else:
-            logger.error(f"Geo service returned non-202 status: {response.status_code}, body: {response.text}")
-            return {
-                'success': [],
-                'errors': [],
-                'raw_response': None
-            }
-
-    except Exception as e:
-        logger.error(f"Exception while calling geo service: {e}", exc_info=True)
-        return {
-            'success': [],
-            'errors': [],
-            'raw_response': None
-        }
\ No newline at end of file
+    if not chunks:
+        return structured_result
+
+    max_workers = min(settings.GEOCLIP_DISPATCH_MAX_WORKERS, len(chunks))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda args: _send_geo_chunk(url, callback_url, *args),
+            ((chunk, i) for i, chunk in enumerate(chunks)),
+        )
+        for jobs, errors in results:
+            structured_result['success'].extend(jobs)
+            structured_result['errors'].extend(errors)
+
+    return structured_result
@@ -1,26 +1,31 @@
-import uuid
 import logging
 
+from django.db.models import Prefetch
+from django.http import HttpResponse
 from django.utils.dateparse import parse_date
 from drf_spectacular.utils import OpenApiExample, OpenApiResponse, extend_schema
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from geopy.geocoders import Nominatim
+from rest_framework.renderers import JSONRenderer
 
-from .filters import ImageLocationFilter
-from .models import ImageLocation
-from .pagination import CustomPagination
+from .filters import ImageLocationFilter, created_at_range_filters
+from .models import ImageLocation, DetectedImageLocation
+from .pagination import CustomPagination, KeysetPagination
 from image_api.services.image_upload_service import ImageUploadService
 from image_api.services.archive_upload_service import ArchiveUploadService
-from .serializers import UploadImagesRequestSerializer, ImageDataSerializer
+from image_api.services.direct_upload_service import DirectUploadService
+from image_api.services.presigned_url_cache import get_presigned_url_cache
+from image_api.services.list_response_cache import ListResponseCache, bump_list_versions
+from .serializers import (
+    ImageDataSerializer,
+    DirectUploadPresignRequestSerializer,
+    DirectUploadCommitRequestSerializer,
+)
 
 logger = logging.getLogger(__name__)
 
-DEFAULT_ANGLE=0
-DEFAULT_HEIGHT=1.5
-
 upload_request_schema = {
     "type": "object",
     "properties": {
@@ -184,48 +189,27 @@ class UploadImageView(APIView):
                 "address": raw.get(f"images_data[{i}][address]"),
                 "lat": raw.get(f"images_data[{i}][lat]"),
                 "lon": raw.get(f"images_data[{i}][lon]"),
-                "angle": raw.get(f"images_data[{i}][angle]", DEFAULT_ANGLE),
-                "height": raw.get(f"images_data[{i}][height]", DEFAULT_HEIGHT),
+                # Без angle/height — из EXIF или значения по умолчанию (apply_exif_metadata)
+                "angle": raw.get(f"images_data[{i}][angle]"),
+                "height": raw.get(f"images_data[{i}][height]"),
             })
             i += 1
 
         serializer = ImageDataSerializer(data=images_data, many=True)
         serializer.is_valid(raise_exception=True)
-        geolocator = Nominatim(user_agent="my_app")
-        images_data = serializer.validated_data
-        processed = []
-        for item in images_data:
-            image = item["image"]
-            address = item.get("address")
-            lat = item.get("lat")
-            lon = item.get("lon")
-
-            # Если есть адрес, но нет координат → геокодируем
-            if address and (lat is None or lon is None):
-                try:
-                    loc = geolocator.geocode(address)
-                    if loc:
-                        lat, lon = loc.latitude, loc.longitude
-                except Exception as e:
-                    print(f" Ошибка геокодирования {address}: {e}")
-
-            # Если есть координаты, но нет адреса → обратное геокодирование
-            if (lat is not None and lon is not None) and not address:
-                try:
-                    loc = geolocator.reverse((lat, lon))
-                    if loc:
-                        address = loc.address
-                except Exception as e:
-                    print(f"Ошибка reverse для {lat}, {lon}: {e}")
-
-            processed.append({
-                "image": image,
-                "address": address,
-                "lat": lat,
-                "lon": lon,
+        # Геокодирование вынесено в Celery (geocode_locations_task): здесь сохраняем
+        # адрес/координаты как пришли и сразу отвечаем
+        processed = [
+            {
+                "image": item["image"],
+                "address": item.get("address") or None,
+                "lat": item.get("lat"),
+                "lon": item.get("lon"),
                 "angle": item.get("angle"),
                 "height": item.get("height"),
-            })
+            }
+            for item in serializer.validated_data
+        ]
 
         service = ImageUploadService(request.user)
         validated_files, validation_errors = service.validate_files(processed)
@@ -264,6 +248,53 @@ class UploadArchiveView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@extend_schema(
+    request=DirectUploadPresignRequestSerializer,
+    summary="Presigned URL для прямой загрузки в S3",
+    description=(
+        "Возвращает для каждого файла ключ, upload_token и presigned PUT URL "
+        "(или UploadId и URL частей multipart-загрузки для больших файлов). "
+        "После загрузки клиент вызывает /api/uploads/commit/."
+    )
+)
+class PresignUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = DirectUploadPresignRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            uploads = DirectUploadService(request.user).presign(serializer.validated_data["files"])
+        except Exception as e:
+            logger.error(f"Presign failed: {str(e)}")
+            return Response({"error": "Presign failed", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({"uploads": uploads}, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    request=DirectUploadCommitRequestSerializer,
+    summary="Подтверждение прямой загрузки",
+    description=(
+        "Проверяет, что файлы загружены в S3 по upload_token, создаёт записи "
+        "и запускает задачу на определение геолокации."
+    )
+)
+class CommitUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = DirectUploadCommitRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        locations, errors = DirectUploadService(request.user).commit(serializer.validated_data["files"])
+        if errors:
+            return Response({"validation_errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"ids": [loc.id for loc in locations]}, status=status.HTTP_200_OK)
+
+
 @extend_schema(
     summary="Получить локации изображений пользователя",
     description=(
@@ -353,6 +384,20 @@ class GetUserImageLocationsView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
+        # Кэш ответа: неизменившийся список — 304 по ETag или готовое тело из Redis
+        response_cache = ListResponseCache(user.id, request.query_params)
+        response_cache.load_version()
+        etag = response_cache.etag
+        if response_cache.matches(request.headers.get('If-None-Match')):
+            not_modified = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            not_modified['ETag'] = etag
+            return not_modified
+        cached_body = response_cache.get()
+        if cached_body is not None:
+            cached = HttpResponse(cached_body, content_type='application/json')
+            cached['ETag'] = etag
+            return cached
+
         # === Фильтрация ===
         filters = {'user': user}  # всегда фильтруем по пользователю
 
@@ -369,8 +414,7 @@ class GetUserImageLocationsView(APIView):
                     {"error": "Invalid date format for 'created_date_after'. Expected YYYY-MM-DD."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            # Фильтр: created_at >= начало дня
-            filters['created_at__date__gte'] = parsed_date
+            created_date_after = parsed_date
 
         if created_date_before:
             parsed_date = parse_date(created_date_before)
@@ -379,15 +423,28 @@ class GetUserImageLocationsView(APIView):
                     {"error": "Invalid date format for 'created_date_before'. Expected YYYY-MM-DD."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            # Фильтр: created_at <= конец дня
-            filters['created_at__date__lte'] = parsed_date
+            created_date_before = parsed_date
 
+        # created_at >= начало первого дня и < начала дня, следующего за последним
+        filters.update(created_at_range_filters(created_date_after, created_date_before))
 
         if 'radius_km' not in query_params:
             query_params['radius_km'] = 10
 
         # Применяем фильтрацию
-        image_locations = ImageLocation.objects.filter(**filters).select_related('image', 'user').order_by('-id')
+        # detected_image_mappings вместе с file подгружаются одним запросом на страницу,
+        # чтобы to_dict() не делал запросов на каждую локацию/детекцию
+        image_locations = (
+            ImageLocation.objects.filter(**filters)
+            .select_related('image', 'user')
+            .prefetch_related(
+                Prefetch(
+                    'detected_image_mappings',
+                    queryset=DetectedImageLocation.objects.select_related('file').order_by('id'),
+                )
+            )
+            .order_by('-id')
+        )
         # image_locations = ImageLocation.objects.filter(**filters).select_related('image', 'user').order_by('-id')
 
         filtered_queryset = ImageLocationFilter(query_params, queryset=image_locations).qs
@@ -395,15 +452,26 @@ class GetUserImageLocationsView(APIView):
         # Фильтруем ImageLocation по пользователю
         # image_locations = ImageLocation.objects.order_by('-id').filter(user=user).select_related('image', 'user')
 
-        # Пагинация
-        paginator = CustomPagination()
+        # Пагинация: постраничная с точным total (по умолчанию)
+        # или курсорная (?pagination=cursor либо ?cursor=...) — без COUNT и OFFSET
+        if query_params.get('pagination') == 'cursor' or 'cursor' in query_params:
+            paginator = KeysetPagination()
+        else:
+            paginator = CustomPagination()
         paginated_locations = paginator.paginate_queryset(filtered_queryset, request)
 
+        # Подписываем ссылки на превью (или оригиналы, если превью ещё нет) для всей страницы за один проход
+        preview_urls = get_presigned_url_cache().get_many(loc.image.preview_key for loc in paginated_locations)
+
         # Формируем список словарей через to_dict()
-        response_data = [loc.to_dict() for loc in paginated_locations]
+        response_data = [loc.to_dict(preview_urls=preview_urls) for loc in paginated_locations]
 
         # Возвращаем ответ с пагинацией
-        return paginator.get_paginated_response(response_data)
+        response = paginator.get_paginated_response(response_data)
+        if etag:
+            response_cache.set(JSONRenderer().render(response.data))
+            response['ETag'] = etag
+        return response
 
 class DeleteUserImageLocationView(APIView):
     permission_classes = [IsAuthenticated]
@@ -422,4 +490,5 @@ class DeleteUserImageLocationView(APIView):
 
         # Удаляем объект
         image_location.delete()
+        bump_list_versions([user.id])
         return Response({"message": f"ImageLocation {pk} deleted"}, status=status.HTTP_200_OK)    
\ No newline at end of file
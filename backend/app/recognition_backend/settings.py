@@ -135,6 +135,48 @@ if USE_S3_MEDIA:
     MEDIA_URL = f"{os.environ.get('AWS_S3_ENDPOINT_URL')}/{AWS_STORAGE_BUCKET_NAME}/"
     AWS_S3_PUBLIC_ENDPOINT = os.getenv("AWS_S3_PUBLIC_ENDPOINT", AWS_S3_ENDPOINT_URL)
 
+# Параллельная и multipart-загрузка в S3
+S3_UPLOAD_MAX_WORKERS = int(os.getenv("S3_UPLOAD_MAX_WORKERS", 8))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024))
+
+# Общий boto3-клиент на процесс: размер пула HTTP-соединений и keep-alive
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", max(10, S3_UPLOAD_MAX_WORKERS * 2)))
+S3_TCP_KEEPALIVE = os.getenv("S3_TCP_KEEPALIVE", "1") == "1"
+# Размер одного ranged GET при чтении архивов прямо из S3
+S3_RANGE_READ_SIZE = int(os.getenv("S3_RANGE_READ_SIZE", 1024 * 1024))
+
+# Кэш presigned URL: срок жизни ссылки, запас до истечения, размер LRU и уровень в Redis
+PRESIGNED_URL_EXPIRES_IN = int(os.getenv("PRESIGNED_URL_EXPIRES_IN", 3600))
+PRESIGNED_URL_REFRESH_MARGIN = int(os.getenv("PRESIGNED_URL_REFRESH_MARGIN", 300))
+PRESIGNED_URL_CACHE_SIZE = int(os.getenv("PRESIGNED_URL_CACHE_SIZE", 10000))
+PRESIGNED_URL_CACHE_REDIS = os.getenv("PRESIGNED_URL_CACHE_REDIS", "0") == "1"
+
+# Превью (рендишены): размеры по длинной стороне, формат (WEBP/JPEG), качество; размер превью для списка
+RENDITION_SIZES = [int(size) for size in os.getenv("RENDITION_SIZES", "256,1024").split(",") if size.strip()]
+RENDITION_FORMAT = os.getenv("RENDITION_FORMAT", "WEBP").upper()
+RENDITION_QUALITY = int(os.getenv("RENDITION_QUALITY", 80))
+PREVIEW_RENDITION_SIZE = int(os.getenv("PREVIEW_RENDITION_SIZE", 256))
+
+# Копия изображения под вход GeoClip (resize из processor_info.json GeoClipService): формат (PNG — без
+# повторного сжатия с потерями, JPEG — меньше, но см. PSNR в scripts/bench_inference_copy.py) и качество JPEG
+INFERENCE_COPY_ENABLED = os.getenv("INFERENCE_COPY_ENABLED", "1") == "1"
+INFERENCE_IMAGE_SIZE = tuple(int(side) for side in os.getenv("INFERENCE_IMAGE_SIZE", "224,224").split(","))
+INFERENCE_COPY_FORMAT = os.getenv("INFERENCE_COPY_FORMAT", "PNG").upper()
+INFERENCE_COPY_QUALITY = int(os.getenv("INFERENCE_COPY_QUALITY", 95))
+
+# EXIF: сколько первых байт файла читать (APP1 не длиннее 64 КБ, с запасом на APP0 перед ним), пороги точности GPS и политика «не отправлять в GeoClip
+# изображения с надёжным GPS» (локация сразу получает статус done)
+EXIF_HEADER_BYTES = int(os.getenv("EXIF_HEADER_BYTES", 80 * 1024))
+EXIF_GPS_MAX_ERROR_M = float(os.getenv("EXIF_GPS_MAX_ERROR_M", 50))
+EXIF_GPS_MAX_DOP = float(os.getenv("EXIF_GPS_MAX_DOP", 5))
+EXIF_TRUSTED_GPS_SKIP_INFERENCE = os.getenv("EXIF_TRUSTED_GPS_SKIP_INFERENCE", "0") == "1"
+
+# Прямая загрузка в S3 (presign/commit): срок жизни URL, upload_token и лимит файлов на запрос
+DIRECT_UPLOAD_URL_EXPIRES_IN = int(os.getenv("DIRECT_UPLOAD_URL_EXPIRES_IN", 3600))
+DIRECT_UPLOAD_TOKEN_MAX_AGE = int(os.getenv("DIRECT_UPLOAD_TOKEN_MAX_AGE", 24 * 3600))
+DIRECT_UPLOAD_MAX_FILES = int(os.getenv("DIRECT_UPLOAD_MAX_FILES", 200))
+
 # DRF — убираем SessionAuthentication, чтобы Postman не требовал CSRF
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -234,6 +276,47 @@ REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', '')
 REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
 REDIS_PORT = os.getenv('REDIS_PORT', 6379)
 
+# Отдельная БД Redis под кэши приложения (брокер Celery живёт в /0)
+REDIS_CACHE_DB = int(os.getenv('REDIS_CACHE_DB', 1))
+REDIS_CACHE_SOCKET_TIMEOUT = float(os.getenv('REDIS_CACHE_SOCKET_TIMEOUT', 0.5))
+
+# Кэш геокодирования (Nominatim): срок жизни в БД, в Redis и точность округления координат
+GEOCODER_USER_AGENT = os.getenv('GEOCODER_USER_AGENT', 'my_app')
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 30 * 24 * 3600))
+GEOCODE_CACHE_REDIS_TTL = int(os.getenv('GEOCODE_CACHE_REDIS_TTL', 24 * 3600))
+GEOCODE_REVERSE_PRECISION = int(os.getenv('GEOCODE_REVERSE_PRECISION', 4))
+# Фоновое геокодирование: пауза между запросами к Nominatim (его лимит — 1 запрос/сек, общий
+# для всех воркеров через Redis) и размер пачки
+GEOCODE_MIN_INTERVAL = float(os.getenv('GEOCODE_MIN_INTERVAL', 1.0))
+GEOCODE_BATCH_SIZE = int(os.getenv('GEOCODE_BATCH_SIZE', 50))
+
+# Локальный обратный геокодер по выгрузке OSM (manage.py build_reverse_geocoder)
+OFFLINE_GEOCODER_INDEX_DIR = os.getenv('OFFLINE_GEOCODER_INDEX_DIR', '')
+OFFLINE_GEOCODER_MAX_DISTANCE_M = float(os.getenv('OFFLINE_GEOCODER_MAX_DISTANCE_M', 150))
+OFFLINE_GEOCODER_SNAP = os.getenv('OFFLINE_GEOCODER_SNAP', '1') == '1'
+
+# Кэш предсказаний GeoClip; версию модели менять при обновлении весов GeoClipService
+GEOCLIP_MODEL_VERSION = os.getenv('GEOCLIP_MODEL_VERSION', 'geo-clip')
+PREDICTION_CACHE_ENABLED = os.getenv('PREDICTION_CACHE_ENABLED', '1') == '1'
+
+# Отправка задач в GeoClip: размер чанка, число параллельных запросов (и размер пула соединений), таймаут
+GEOCLIP_DISPATCH_CHUNK_SIZE = int(os.getenv('GEOCLIP_DISPATCH_CHUNK_SIZE', 200))
+GEOCLIP_DISPATCH_MAX_WORKERS = int(os.getenv('GEOCLIP_DISPATCH_MAX_WORKERS', 4))
+GEOCLIP_DISPATCH_TIMEOUT = float(os.getenv('GEOCLIP_DISPATCH_TIMEOUT', 30))
+# Повторная отправка при неизвестном исходе (таймаут, 5xx): число попыток и начальная задержка (сек, удваивается)
+GEOCLIP_DISPATCH_RETRIES = int(os.getenv('GEOCLIP_DISPATCH_RETRIES', 3))
+GEOCLIP_DISPATCH_RETRY_DELAY = float(os.getenv('GEOCLIP_DISPATCH_RETRY_DELAY', 30))
+
+# Поток изменений статусов (SSE): интервал keepalive-комментариев (сек) и задержка переподключения клиента (мс)
+STATUS_EVENTS_KEEPALIVE = float(os.getenv('STATUS_EVENTS_KEEPALIVE', 15))
+STATUS_EVENTS_RETRY_MS = int(os.getenv('STATUS_EVENTS_RETRY_MS', 5000))
+# Срок жизни одноразового билета для ?ticket= (сек)
+STATUS_EVENTS_TICKET_TTL = int(os.getenv('STATUS_EVENTS_TICKET_TTL', 30))
+
+# Кэш ответа списка локаций (Redis, версия на пользователя); TTL ограничен PRESIGNED_URL_REFRESH_MARGIN
+LIST_CACHE_ENABLED = os.getenv('LIST_CACHE_ENABLED', '1') == '1'
+LIST_CACHE_TTL = int(os.getenv('LIST_CACHE_TTL', 240))
+
 CELERY_TASK_ALWAYS_EAGER = False  # False для продакшена
 CELERY_TASK_EAGER_PROPAGATES = True
 
@@ -244,4 +327,11 @@ CELERY_RESULT_BACKEND = (
     f"redis://:{REDIS_PASSWORD}@{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', 6379)}/0"
 )
 CELERY_TASK_TRACK_STARTED = True
-CELERY_TASK_TIME_LIMIT = 30 * 60
\ No newline at end of file
+CELERY_TASK_TIME_LIMIT = 30 * 60
+
+# Размер пачки bulk_create при массовой загрузке изображений (архивы)
+IMAGE_UPLOAD_BATCH_SIZE = int(os.getenv('IMAGE_UPLOAD_BATCH_SIZE', 500))
+# Запись архива буферизуется в памяти до ARCHIVE_ENTRY_SPOOL_SIZE байт, больше — во временном файле
+ARCHIVE_ENTRY_SPOOL_SIZE = int(os.getenv('ARCHIVE_ENTRY_SPOOL_SIZE', 32 * 1024 * 1024))
+# Архив делится на чанки по ARCHIVE_CHUNK_SIZE записей, чанки обрабатываются параллельными подзадачами
+ARCHIVE_CHUNK_SIZE = int(os.getenv('ARCHIVE_CHUNK_SIZE', 200))
@@ -0,0 +1,74 @@
+# /app/scripts/bench_archive_upload.py
+# Память и скорость загрузки архива в S3: старый путь (read() + put_object)
+# против потокового multipart (S3Service.upload_fileobj).
+# Каждый замер — в отдельном процессе, чтобы пиковый RSS не смешивался.
+# Запуск: python scripts/bench_archive_upload.py [размеры в МБ через запятую]
+import os
+import sys
+import time
+import uuid
+import resource
+import tempfile
+import multiprocessing
+import django
+
+# --- Настройка Django ---
+sys.path.append('/app')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recognition_backend.settings')
+django.setup()
+
+from image_api.services.s3_service import S3Service
+
+# --- параметры ---
+SIZES_MB = [int(x) for x in (sys.argv[1] if len(sys.argv) > 1 else "100,500,1024,2048,4096").split(",")]
+BLOCK = 8 * 1024 * 1024
+
+
+def make_archive(size_mb):
+    f = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
+    block = os.urandom(BLOCK)
+    written = 0
+    while written < size_mb * 1024 * 1024:
+        f.write(block)
+        written += BLOCK
+    f.close()
+    return f.name
+
+
+def measure(mode, path, queue):
+    s3 = S3Service()
+    key = f"bench/{uuid.uuid4()}.zip"
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        if mode == "read":
+            ok = s3.upload_file(key, f.read(), content_type="application/zip")
+        else:
+            ok = s3.upload_fileobj(key, f, content_type="application/zip")
+    elapsed = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    s3.delete_file(key)
+    # ru_maxrss в Linux — в КБ
+    queue.put((ok, elapsed, (rss_after - rss_before) / 1024))
+
+
+def run(mode, path):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(mode, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+for size_mb in SIZES_MB:
+    path = make_archive(size_mb)
+    try:
+        for mode in ("read", "stream"):
+            ok, elapsed, rss_mb = run(mode, path)
+            print(
+                f"{size_mb:>6} MB {mode:>6}: {elapsed:7.1f} s  {size_mb / elapsed:7.1f} MB/s  "
+                f"+RSS {rss_mb:8.1f} MB  {'ok' if ok else 'FAILED'}"
+            )
+    finally:
+        os.unlink(path)
@@ -0,0 +1,122 @@
+# /app/scripts/bench_inference_copy.py
+# Сравнение входа GeoClip: полноразмерный оригинал против копии под вход модели (InferenceCopyService).
+# Для каждого изображения из каталога: байты, передаваемые GeoClipService из S3, и время на его стороне
+# (GET + декодирование + resize до INFERENCE_IMAGE_SIZE, как в PredictService), плюс стоимость
+# подготовки копии в Celery (GET оригинала + EXIF-поворот + resize + PUT) и PSNR копии относительно
+# входа модели без повторного сжатия (PNG — без потерь, inf; JPEG — INFERENCE_COPY_QUALITY).
+# Объекты удаляются в конце.
+# Запуск: python scripts/bench_inference_copy.py <каталог с JPEG/PNG> [кол-во прогонов]
+import io
+import math
+import os
+import sys
+import time
+import uuid
+import django
+
+# --- Настройка Django ---
+sys.path.append('/app')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recognition_backend.settings')
+django.setup()
+
+from django.conf import settings
+from PIL import Image, ImageChops, ImageOps, ImageStat
+from image_api.services.inference_copy_service import InferenceCopyService, inference_key
+from image_api.services.s3_service import S3Service
+
+# --- параметры ---
+SOURCE_DIR = sys.argv[1] if len(sys.argv) > 1 else '/app/scripts/bench_images'
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+PREFIX = f"bench/{uuid.uuid4()}"
+
+s3 = S3Service()
+service = InferenceCopyService()
+width, height = settings.INFERENCE_IMAGE_SIZE
+
+
+def geoclip_side(key):
+    """
+    То, что делает GeoClipService на задачу: скачать объект, декодировать, растянуть до входа модели.
+    """
+    started = time.perf_counter()
+    content = s3.download_file(key)
+    with Image.open(io.BytesIO(content)) as image:
+        image.convert("RGB").resize((width, height), Image.Resampling.BICUBIC)
+    return len(content), time.perf_counter() - started
+
+
+def psnr(original, copy):
+    """
+    PSNR (дБ) копии относительно эталонного входа модели: оригинал с EXIF-поворотом,
+    растянутый до INFERENCE_IMAGE_SIZE, без сжатия.
+    """
+    with Image.open(io.BytesIO(original)) as source:
+        reference = ImageOps.exif_transpose(source).convert("RGB").resize((width, height), Image.Resampling.BICUBIC)
+    with Image.open(io.BytesIO(copy)) as image:
+        diff = ImageChops.difference(reference, image.convert("RGB"))
+    rms = math.sqrt(sum(value ** 2 for value in ImageStat.Stat(diff).rms) / 3)
+    return math.inf if rms == 0 else 20 * math.log10(255 / rms)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+names = sorted(
+    name for name in os.listdir(SOURCE_DIR)
+    if name.lower().endswith((".jpg", ".jpeg", ".png"))
+)
+if not names:
+    sys.exit(f"В {SOURCE_DIR} нет изображений")
+
+keys = []
+for name in names:
+    key = f"{PREFIX}/{name}"
+    with open(os.path.join(SOURCE_DIR, name), "rb") as f:
+        s3.upload_file(key, f.read(), "image/jpeg" if name.lower().endswith(("jpg", "jpeg")) else "image/png")
+    keys.append(key)
+
+print(f"{'файл':<32}{'оригинал, КБ':>14}{'копия, КБ':>11}{'GeoClip ориг., мс':>19}"
+      f"{'GeoClip копия, мс':>19}{'подготовка, мс':>16}{'PSNR, дБ':>10}")
+totals = {"orig_bytes": 0, "copy_bytes": 0, "orig_time": 0.0, "copy_time": 0.0, "ingest_time": 0.0}
+psnrs = []
+try:
+    for name, key in zip(names, keys):
+        ingest_times = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            copy_key = service.create(key)
+            ingest_times.append(time.perf_counter() - started)
+        if copy_key is None:
+            print(f"{name:<32} не удалось подготовить копию")
+            continue
+
+        orig = [geoclip_side(key) for _ in range(RUNS)]
+        copy = [geoclip_side(copy_key) for _ in range(RUNS)]
+        orig_bytes, copy_bytes = orig[0][0], copy[0][0]
+        orig_time, copy_time = median(t for _, t in orig), median(t for _, t in copy)
+        ingest_time = median(ingest_times)
+        quality = psnr(s3.download_file(key), s3.download_file(copy_key))
+        psnrs.append(quality)
+
+        totals["orig_bytes"] += orig_bytes
+        totals["copy_bytes"] += copy_bytes
+        totals["orig_time"] += orig_time
+        totals["copy_time"] += copy_time
+        totals["ingest_time"] += ingest_time
+        print(f"{name[:31]:<32}{orig_bytes / 1024:>14.1f}{copy_bytes / 1024:>11.1f}"
+              f"{orig_time * 1000:>19.1f}{copy_time * 1000:>19.1f}{ingest_time * 1000:>16.1f}{quality:>10.1f}")
+
+    count = len(names)
+    print(f"\nВсего {count} изображений: трафик GeoClip {totals['orig_bytes'] / 1024 / 1024:.1f} МБ -> "
+          f"{totals['copy_bytes'] / 1024 / 1024:.2f} МБ "
+          f"(x{totals['orig_bytes'] / max(totals['copy_bytes'], 1):.0f} меньше)")
+    print(f"Среднее на изображение: GeoClip {totals['orig_time'] / count * 1000:.1f} -> "
+          f"{totals['copy_time'] / count * 1000:.1f} мс, "
+          f"подготовка копии {totals['ingest_time'] / count * 1000:.1f} мс, "
+          f"итого с копией {(totals['copy_time'] + totals['ingest_time']) / count * 1000:.1f} мс")
+    if psnrs:
+        print(f"PSNR копии ({settings.INFERENCE_COPY_FORMAT}): минимум {min(psnrs):.1f} дБ, медиана {median(psnrs):.1f} дБ")
+finally:
+    s3.batch_delete(keys + [inference_key(key) for key in keys])
@@ -0,0 +1,76 @@
+# /app/scripts/bench_radius_filter.py
+# Сравнение старого фильтра по радиусу (acos через .extra) и bounding box + гаверсинус
+# на синтетической таблице. Строки создаются у отдельного пользователя и удаляются в конце.
+# Запуск: python scripts/bench_radius_filter.py [кол-во строк]
+import os
+import sys
+import time
+import django
+
+# --- Настройка Django ---
+sys.path.append('/app')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recognition_backend.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from image_api.filters import ImageLocationFilter
+from image_api.models import UploadedImage, ImageLocation
+
+# --- параметры ---
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+CENTER = {'lat': 55.7558, 'lon': 37.6176, 'radius_km': 10}
+RUNS = 5
+
+OLD_SQL = """
+6371 * acos(
+    cos(radians(%s)) *
+    cos(radians(lat)) *
+    cos(radians(lon) - radians(%s)) +
+    sin(radians(%s)) *
+    sin(radians(lat))
+) <= %s
+"""
+
+User = get_user_model()
+user, _ = User.objects.get_or_create(username='bench_radius_filter')
+image = UploadedImage.objects.create(filename='bench.jpg', user=user)
+
+print(f"Генерация {ROWS} строк...")
+with connection.cursor() as cursor:
+    # Точки равномерно по европейской части России (~25..65 с.ш., 25..82 в.д.)
+    cursor.execute(
+        """
+        INSERT INTO image_locations (user_id, image_id, status, lat, lon, created_at)
+        SELECT %s, %s, 'done', 25 + random() * 40, 25 + random() * 57, now()
+        FROM generate_series(1, %s)
+        """,
+        [user.id, image.id, ROWS],
+    )
+    cursor.execute("ANALYZE image_locations")
+
+
+def timed(label, queryset):
+    # прогрев
+    list(queryset.values_list('id', flat=True))
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        count = len(list(queryset.values_list('id', flat=True)))
+    elapsed = (time.perf_counter() - started) / RUNS
+    print(f"{label:>12}: {elapsed * 1000:9.1f} ms, строк: {count}")
+    print(queryset.explain())
+    return elapsed
+
+
+base = ImageLocation.objects.filter(user=user)
+try:
+    old = timed('acos/extra', base.extra(
+        where=[OLD_SQL],
+        params=[CENTER['lat'], CENTER['lon'], CENTER['lat'], CENTER['radius_km']],
+    ))
+    new = timed('bbox+index', ImageLocationFilter(CENTER, queryset=base).qs)
+    print(f"Ускорение: x{old / new:.1f}")
+finally:
+    ImageLocation.objects.filter(user=user).delete()
+    image.delete()
+    user.delete()
@@ -0,0 +1,57 @@
+# /app/scripts/bench_s3_upload.py
+# Сравнение последовательной и параллельной загрузки в локальный MinIO (S3/docker-compose.yml).
+# Запуск: python scripts/bench_s3_upload.py [кол-во файлов] [размер файла в КБ]
+import os
+import sys
+import time
+import uuid
+import django
+
+# --- Настройка Django ---
+sys.path.append('/app')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recognition_backend.settings')
+django.setup()
+
+from django.conf import settings
+from image_api.services.s3_service import S3Service
+
+# --- параметры ---
+FILES_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+FILE_SIZE_KB = int(sys.argv[2]) if len(sys.argv) > 2 else 3 * 1024
+PREFIX = f"bench/{uuid.uuid4()}"
+
+s3 = S3Service()
+payload = os.urandom(FILE_SIZE_KB * 1024)
+
+
+def make_files(label):
+    return [
+        {
+            "filename": f"{PREFIX}/{label}/{i}.jpg",
+            "content": payload,
+            "original_filename": f"{i}.jpg",
+            "index": i,
+            "content_type": "image/jpeg",
+        }
+        for i in range(FILES_COUNT)
+    ]
+
+
+def run(label, max_workers):
+    files = make_files(label)
+    started = time.perf_counter()
+    results = s3.batch_upload(files, max_workers=max_workers)
+    elapsed = time.perf_counter() - started
+    total_mb = FILES_COUNT * FILE_SIZE_KB / 1024
+    print(
+        f"{label:>8}: workers={max_workers:<3} {elapsed:7.2f} s  "
+        f"{total_mb / elapsed:7.1f} MB/s  ok={len(results['successful'])} failed={len(results['failed'])}"
+    )
+    s3.batch_delete([f["filename"] for f in files])
+    return elapsed
+
+
+print(f"{FILES_COUNT} файлов по {FILE_SIZE_KB} КБ, multipart от {settings.S3_MULTIPART_THRESHOLD // 1024} КБ")
+serial = run("serial", 1)
+parallel = run("parallel", settings.S3_UPLOAD_MAX_WORKERS)
+print(f"Ускорение: x{serial / parallel:.2f}")
@@ -0,0 +1,83 @@
+# /app/scripts/explain_image_locations.py
+# Проверка планов запросов списка локаций (GetUserImageLocationsView) на большой таблице:
+# строки распределяются между USERS синтетическими пользователями, для каждого запроса
+# печатается EXPLAIN ANALYZE и проверяется, что image_locations читается по индексу, а не Seq Scan.
+# Строки и пользователи удаляются в конце.
+# Запуск: python scripts/explain_image_locations.py [кол-во строк] [кол-во пользователей]
+import os
+import sys
+from datetime import date, timedelta
+import django
+
+# --- Настройка Django ---
+sys.path.append('/app')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recognition_backend.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from image_api.filters import created_at_range_filters
+from image_api.models import UploadedImage, ImageLocation
+
+# --- параметры ---
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+USERS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+PAGE_SIZE = 10
+HISTORY_DAYS = 730
+
+User = get_user_model()
+users = User.objects.bulk_create([User(username=f'bench_explain_{i}') for i in range(USERS)])
+user_ids = [u.id for u in users]
+image = UploadedImage.objects.create(filename='bench.jpg', user=users[0])
+
+print(f"Генерация {ROWS} строк для {USERS} пользователей...")
+with connection.cursor() as cursor:
+    # ~2% строк в статусе processing, created_at — за последние HISTORY_DAYS дней
+    cursor.execute(
+        """
+        INSERT INTO image_locations (user_id, image_id, status, lat, lon, created_at)
+        SELECT (%s::int[])[1 + (n %% %s)], %s,
+               CASE WHEN random() < 0.02 THEN 'processing' ELSE 'done' END,
+               25 + random() * 40, 25 + random() * 57,
+               now() - random() * make_interval(days => %s)
+        FROM generate_series(1, %s) AS n
+        """,
+        [user_ids, USERS, image.id, HISTORY_DAYS, ROWS],
+    )
+    cursor.execute("ANALYZE image_locations")
+
+
+def check(label, queryset):
+    plan = queryset.explain(analyze=True, buffers=True)
+    seq_scan = 'Seq Scan on image_locations' in plan
+    uses_index = 'Index' in plan
+    verdict = 'OK' if uses_index and not seq_scan else 'FAIL'
+    print(f"\n=== {label}: {verdict}")
+    print(plan)
+    return verdict == 'OK'
+
+
+user = users[USERS // 2]
+base = ImageLocation.objects.filter(user=user)
+newest = base.order_by('-id').values_list('id', flat=True)[:1000]
+cursor_id = list(newest)[-1]
+today = date.today()
+
+try:
+    results = [
+        check('первая страница', base.order_by('-id')[:PAGE_SIZE]),
+        check('курсор (id < ...)', base.filter(id__lt=cursor_id).order_by('-id')[:PAGE_SIZE]),
+        check(
+            'диапазон дат (полуоткрытый)',
+            base.filter(**created_at_range_filters(today - timedelta(days=30), today)).order_by('-id')[:PAGE_SIZE],
+        ),
+        check('диапазон дат, все строки', base.filter(**created_at_range_filters(today - timedelta(days=30), today))),
+        check('в обработке', base.filter(status='processing').order_by('-id')[:PAGE_SIZE]),
+    ]
+    print(f"\nИндексные планы: {sum(results)} из {len(results)}")
+finally:
+    # Без ORM: каскадный delete() выбрал бы все id в память
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM image_locations WHERE user_id = ANY(%s)", [user_ids])
+    image.delete()
+    User.objects.filter(id__in=user_ids).delete()